@@ -9,341 +9,4871 @@ __version__ = '0.2.1'
 ### import
 
 import asyncio
+import base64
+import bisect
 import datetime
+import hashlib
+import json
+import logging
 import os
+import random
 import re
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial, update_wrapper
+from inspect import isasyncgenfunction, iscoroutinefunction, isfunction
+from multiprocessing.sharedctypes import RawArray
+from urllib.parse import parse_qsl
 
-import ujson as json
 import uvloop
-from graphql.error import format_error
+from graphql.error import GraphQLError, format_error
+from graphql.execution import ExecutionResult, execute
+from graphql.execution.base import ResolveInfo
+from graphql.execution.middleware import MiddlewareManager
 from graphql.execution.executors.asyncio import AsyncioExecutor
+from graphql.execution.utils import default_resolve_fn
+from graphql.execution.values import get_argument_values, get_variable_values
+from graphql.language import ast
+from graphql.language.parser import parse
+from graphql.type import GraphQLArgument, GraphQLBoolean, GraphQLInt, GraphQLObjectType, GraphQLSchema, GraphQLString
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type
+from graphql.type.directives import DirectiveLocation, GraphQLDirective, GraphQLIncludeDirective, GraphQLSkipDirective
+from graphql.type.introspection import SchemaMetaFieldDef, TypeMetaFieldDef
+from graphql.validation import validate
+from promise import Promise
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import httptools
+except ImportError:
+    httptools = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
 ### const
 
+logger = logging.getLogger('aiographql')
+
+LISTEN_FDS_ENV = 'AIOGRAPHQL_LISTEN_FDS'  # e.g. "3,4;5" - inherited listening sockets of each endpoint
+HANDOFF_PID_ENV = 'AIOGRAPHQL_HANDOFF_PID'  # process to stop gracefully once this one is listening
+
 END_OF_HEADERS = b'\r\n\r\n'
+REQUEST_LINE_RE = re.compile(br'[!#$%&\'*+.^_`|~0-9A-Za-z-]+ [^ \r\n]+ HTTP/1\.([01])(?:\r\n|$)')
 CONTENT_LENGTH_RE = re.compile(br'\r\nContent-Length:\s*(\d+)', re.IGNORECASE)
+TRANSFER_ENCODING_RE = re.compile(br'\r\nTransfer-Encoding:[ \t]*([^\r]*)', re.IGNORECASE)
+CONNECTION_RE = re.compile(br'\r\nConnection:[ \t]*([^\r]*)', re.IGNORECASE)
+EXPECT_CONTINUE_RE = re.compile(br'\r\nExpect:[ \t]*100-continue', re.IGNORECASE)
+ACCEPT_ENCODING_RE = re.compile(br'\r\nAccept-Encoding:[ \t]*([^\r]*)', re.IGNORECASE)
+IF_NONE_MATCH_RE = re.compile(br'\r\nIf-None-Match:[ \t]*([^\r]*)', re.IGNORECASE)
 
 HTTP_RESPONSE = '''HTTP/1.1 200 OK
 Access-Control-Allow-Origin: *
-Content-Length: {content_length}
+Content-Length: %d
 Content-Type: application/json
-Date: {date} GMT
-Expires: Wed, 21 Oct 2015 07:28:00 GMT
+%bExpires: Wed, 21 Oct 2015 07:28:00 GMT
+Server: aiographql/{version}
+%b
+'''.replace('\n', '\r\n').replace('{version}', __version__).encode()
+# Format: HTTP_RESPONSE % (content_length, date_header, extra_headers) - preencoded to avoid copying content.
+# HTTP status is always "200 OK".
+# Good explanation why: https://github.com/graphql-python/graphene/issues/142#issuecomment-221290862
+
+HTTP_CHUNKED_RESPONSE = '''HTTP/1.1 200 OK
+Access-Control-Allow-Origin: *
+Content-Type: %b
+%bExpires: Wed, 21 Oct 2015 07:28:00 GMT
+Server: aiographql/{version}
+Transfer-Encoding: chunked
+%b
+'''.replace('\n', '\r\n').replace('{version}', __version__).encode()
+# Format: HTTP_CHUNKED_RESPONSE % (content_type, date_header, extra_headers) -
+# for large response streamed as it is serialized, or for incremental delivery in parts.
+
+MULTIPART_MIXED_RE = re.compile(br'\r\nAccept:[^\r]*multipart/mixed', re.IGNORECASE)
+MULTIPART_CONTENT_TYPE = b'multipart/mixed; boundary="-"; deferSpec=20220824'
+MULTIPART_PART_HEADERS = b'\r\n---\r\nContent-Type: application/json; charset=utf-8\r\n\r\n'
+MULTIPART_END = b'\r\n-----\r\n'
+
+UPGRADE_WEBSOCKET_RE = re.compile(br'\r\nUpgrade:[ \t]*websocket', re.IGNORECASE)
+WEBSOCKET_KEY_RE = re.compile(br'\r\nSec-WebSocket-Key:[ \t]*([A-Za-z0-9+/=]{24})', re.IGNORECASE)
+WEBSOCKET_PROTOCOL_RE = re.compile(br'\r\nSec-WebSocket-Protocol:[ \t]*([^\r]*)', re.IGNORECASE)
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WEBSOCKET_PROTOCOLS = [b'graphql-transport-ws', b'graphql-ws']  # in order of preference, the latter is legacy
+
+HTTP_SWITCHING_PROTOCOLS = '''HTTP/1.1 101 Switching Protocols
+Connection: Upgrade
+Sec-WebSocket-Accept: %b
+Sec-WebSocket-Protocol: %b
+Server: aiographql/{version}
+Upgrade: websocket
+
+'''.replace('\n', '\r\n').replace('{version}', __version__).encode()
+# Format: HTTP_SWITCHING_PROTOCOLS % (accept, protocol) - for subscriptions over WebSocket, see WebSocketConnection.
+
+HTTP_CONTINUE = b'HTTP/1.1 100 Continue\r\n\r\n'
+# Interim response to "Expect: 100-continue", so client sends content without waiting.
+
+HTTP_NOT_MODIFIED = '''HTTP/1.1 304 Not Modified
+Access-Control-Allow-Origin: *
+%bServer: aiographql/{version}
+%b
+'''.replace('\n', '\r\n').replace('{version}', __version__).encode()
+# Format: HTTP_NOT_MODIFIED % (date_header, extra_headers) - the only exception from "200 OK",
+# answering "If-None-Match" of GET request with the same "ETag" as before.
+
+METRICS_RESPONSE = '''HTTP/1.1 200 OK
+Connection: close
+Content-Length: %d
+Content-Type: text/plain; version=0.0.4
 Server: aiographql/{version}
 
-{content}'''.replace('\n', '\r\n').replace('{version}', __version__)
-# HTTP status is always "200 OK".
-# Good explanation why: https://github.com/graphql-python/graphene/issues/142#issuecomment-221290862
+'''.replace('\n', '\r\n').replace('{version}', __version__).encode()
+# Format: METRICS_RESPONSE % content_length - for Prometheus, see Metrics.render()
+
+CONTENT_ENCODINGS = [b'br', b'gzip'] if brotli else [b'gzip']  # in order of preference
+
+VARY_HEADER = b'Vary: Accept-Encoding\r\n'
+CONNECTION_CLOSE_HEADER = b'Connection: close\r\n'
+CONTENT_ENCODING_HEADERS = {
+    content_encoding: b'Content-Encoding: ' + content_encoding + b'\r\n'
+    for content_encoding in CONTENT_ENCODINGS
+}
+
+### JSON codecs
+
+def default_json(value):
+    """
+    Serialize values not supported by JSON the same way as orjson does.
+
+    @param value: datetime.datetime, datetime.date, datetime.time - e.g. returned by resolver of custom scalar
+    @return str - in ISO 8601 format
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError('Type is not JSON serializable: ' + type(value).__name__)
+
+def get_json_key(key):
+    """
+    Convert key of dict to str the same way as JsonCodec and OrjsonCodec do.
+
+    @param key: str, int, float, bool, None, datetime.datetime, etc
+    @return key: str
+    """
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, bool):
+        return 'null' if key is None else 'true' if key else 'false'
+    if isinstance(key, (datetime.date, datetime.time)):
+        return key.isoformat()
+    return str(key)
+
+class JsonCodec(object):
+    """
+    JSON codec of stdlib, the slowest one, but supports ints of any size -
+    with the same output as OrjsonCodec, so it is used when orjson is not installed.
+    Codec may be any object with the same interface, see serve(json_codec).
+    """
+
+    def __init__(self):
+        self.encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=default_json)
+
+    def loads(self, data):
+        """
+        @param data: bytes or str - JSON, e.g. GraphQL request
+        @return value: dict, list, str, etc
+        """
+        return json.loads(data)
+
+    def dumps(self, value):
+        """
+        @param value: dict, list, str, etc - e.g. GraphQL response, with datetime values and int, float, bool or None keys
+        @return data: bytes - JSON in UTF-8
+        """
+        return self.encoder.encode(value).encode()
+
+class UjsonCodec(object):
+    """
+    JSON codec of ujson, if "pip install ujson" - with the same interface as JsonCodec, about 2x faster than JsonCodec,
+    but ujson<2 serializes datetime values as Unix timestamps and None keys as "None", with no way to override,
+    so it is used only if passed to serve(json_codec) explicitly.
+    """
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def dumps(self, value):
+        return ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False).encode()
+
+class OrjsonCodec(object):
+    """
+    JSON codec of orjson, the fastest one, if "pip install orjson" - with the same interface as JsonCodec,
+    serializes to bytes without intermediate str, supports datetime values and non-str keys natively.
+    """
+
+    def __init__(self, option=None):
+        """
+        @param option: int or None - flags of orjson.dumps(), None - orjson.OPT_NON_STR_KEYS
+        """
+        self.option = orjson.OPT_NON_STR_KEYS if option is None else option
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, value):
+        return orjson.dumps(value, option=self.option)
+
+def get_json_codec():
+    """
+    @return json_codec: OrjsonCodec if "pip install orjson", else JsonCodec - with the same output
+    """
+    return OrjsonCodec() if orjson else JsonCodec()
+
+### compress
+
+def compress(content, content_encoding, level):
+    """
+    Compress content of response.
+    Releases GIL, so it is good for thread pool too.
+
+    @param content: bytes
+    @param content_encoding: bytes - one of CONTENT_ENCODINGS
+    @param level: int - compression level, 1-9 for gzip, 0-11 for br
+    @return content: bytes - compressed
+    """
+    if content_encoding == b'br':
+        return brotli.compress(content, quality=level)
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip format
+    return compressor.compress(content) + compressor.flush()
+
+def get_content_encoding(headers):
+    """
+    Negotiate content encoding from "Accept-Encoding" request header.
+
+    @param headers: bytes - HTTP headers
+    @return content_encoding: bytes or None - one of CONTENT_ENCODINGS accepted by client, if any
+    """
+    match = ACCEPT_ENCODING_RE.search(headers)
+    if not match:
+        return None
+
+    accepted, rejected = set(), set()
+    for item in match.group(1).lower().split(b','):
+        coding, _, params = item.partition(b';')
+        params = params.replace(b' ', b'')
+        is_rejected = params.startswith(b'q=0') and not params[3:].strip(b'.0')  # q=0 means "not acceptable"
+        (rejected if is_rejected else accepted).add(coding.strip())
+
+    for content_encoding in CONTENT_ENCODINGS:
+        if content_encoding in accepted or b'*' in accepted and content_encoding not in rejected:
+            return content_encoding
+
+    return None
+
+def get_compressor(content_encoding, level):
+    """
+    Create streaming compressor for response sent in chunks.
+
+    @param content_encoding: bytes - one of CONTENT_ENCODINGS
+    @param level: int - as in compress()
+    @return compress: callable(bytes): bytes - compress next chunk, may return empty bytes
+    @return flush: callable(): bytes - end of compressed content
+    """
+    if content_encoding == b'br':
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.finish
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip format
+    return compressor.compress, compressor.flush
+
+### streaming
+
+def estimate_json_size(value):
+    """
+    Estimate size of value serialized to JSON, taking the first item of each list as typical,
+    so time does not depend on length of lists - to decide whether to stream the response.
+
+    @param value: dict, list, str, etc - e.g. GraphQL response
+    @return size: int - approximate size in bytes
+    """
+    if isinstance(value, dict):
+        size = 2
+        for key, item in value.items():
+            size += (len(key) if isinstance(key, str) else 8) + 4 + estimate_json_size(item)
+        return size
+
+    if isinstance(value, list):
+        return 2 + len(value) * (1 + estimate_json_size(value[0])) if value else 2
+
+    if isinstance(value, str):
+        return len(value) + 2
+
+    return 8
+
+def iter_json(value, chunk_size, json_codec):
+    """
+    Serialize value to JSON in parts, so only about chunk_size of it is in memory at once.
+    Dicts with nested dicts or lists are walked, lists are serialized in slices of about chunk_size,
+    so most of the work is still done by fast json_codec.dumps().
+
+    @param value: dict, list, str, etc - e.g. GraphQL response
+    @param chunk_size: int - approximate size of slices of lists in bytes
+    @param json_codec: JsonCodec, UjsonCodec, OrjsonCodec, etc
+    @return parts: generator of bytes - the same JSON as json_codec.dumps(value) when joined,
+        some parts are small, so they should be joined up to chunk_size before sending
+    """
+    if isinstance(value, dict):
+        if not any(isinstance(item, (dict, list)) for item in value.values()):
+            yield json_codec.dumps(value)
+            return
+
+        separator = b'{'
+        for key, item in value.items():
+            yield separator + json_codec.dumps(get_json_key(key)) + b':'
+            yield from iter_json(item, chunk_size, json_codec)
+            separator = b','
+        yield b'}'
+
+    elif isinstance(value, list) and value:
+        step = max(1, chunk_size // estimate_json_size(value[0]))
+        separator = b'['
+        for start in range(0, len(value), step):
+            yield separator + json_codec.dumps(value[start:start + step])[1:-1]
+            separator = b','
+        yield b']'
+
+    else:
+        yield json_codec.dumps(value)
+
+### cache_control
+
+def cache_control(max_age, scope='PUBLIC'):
+    """
+    Decorator of resolver to declare cache hint of its field, used for "Cache-Control" header of GET responses:
+
+        @aiographql.cache_control(max_age=60)
+        def resolve_me(self, info):
+
+    Response is cacheable for min max_age of all selected fields with hints,
+    only if each root field has a hint, and privately if any hint has PRIVATE scope.
+
+    @param max_age: int - seconds
+    @param scope: str - PUBLIC for shared caches like CDN, PRIVATE for browser cache only
+    @return decorator: callable(resolver): resolver
+    """
+    def decorator(resolver):
+        resolver.cache_control = max_age, scope
+        return resolver
+    return decorator
+
+def get_cache_control(schema, document_ast, operation):
+    """
+    Get "Cache-Control" header value from cache hints of fields selected by query operation.
+    Static analysis - see QueryCache.analyze()
+
+    @param schema: graphene.Schema - GraphQL schema
+    @param document_ast: graphql.language.ast.Document - valid document
+    @param operation: graphql.language.ast.OperationDefinition - query operation of this document
+    @return cache_control: bytes - e.g. b'public, max-age=60' or b'no-cache'
+    """
+    def analyze_field(field, child, is_root):
+        hint = getattr(field and field.resolver, 'cache_control', None)
+        if hint:
+            max_age, scope = hint
+            result = max_age, scope.upper() == 'PRIVATE'
+        elif is_root:
+            result = 0, False  # not cacheable
+        else:
+            result = None, False  # inherits
+
+        return merge(result, child) if child else result
+
+    def merge(result, other):
+        max_age = other[0] if result[0] is None else result[0] if other[0] is None else min(result[0], other[0])
+        return max_age, result[1] or other[1]
+
+    max_age, is_private = analyze_selections(schema, document_ast, operation, analyze_field, merge, (None, False))
+    if max_age is None or max_age <= 0:
+        return b'no-cache'
+
+    return '{}, max-age={}'.format('private' if is_private else 'public', max_age).encode()
+
+### cost
+
+def cost(weight=1, list_size=None):
+    """
+    Decorator of resolver to declare its cost for query complexity analysis, see max_cost in serve():
+
+        @aiographql.cost(weight=5, list_size=100)
+        def resolve_friends(self, info):
+
+    @param weight: float - cost of resolving this field once, 1 by default
+    @param list_size: int or None - expected max length of list returned by this field, to multiply cost of its subfields,
+        None - list_size defined in serve()
+    @return decorator: callable(resolver): resolver
+    """
+    def decorator(resolver):
+        resolver.cost = weight, list_size
+        return resolver
+    return decorator
+
+def get_complexity(schema, document_ast, operation, list_size):
+    """
+    Get complexity of operation before executing it.
+    Static analysis - see QueryCache.analyze()
+
+    @param schema: graphene.Schema - GraphQL schema
+    @param document_ast: graphql.language.ast.Document - valid document
+    @param operation: graphql.language.ast.OperationDefinition - operation of this document
+    @param list_size: int - expected max length of lists, unless declared by cost() decorator
+    @return depth, nodes, cost: int, int, float -
+        max depth of fields, number of fields with fragments expanded,
+        sum of weights of fields, multiplied by list sizes of parent fields
+    """
+    def analyze_field(field, child, is_root):
+        depth, nodes, child_cost = child or (0, 0, 0.0)
+        if field is None:
+            return 1, 1, 0.0  # e.g. __typename
+
+        weight, field_list_size = getattr(field.resolver, 'cost', (1, None))
+        field_type = field.type
+        while isinstance(field_type, GraphQLNonNull):
+            field_type = field_type.of_type
+        multiplier = (field_list_size or list_size) if isinstance(field_type, GraphQLList) else 1
+
+        return depth + 1, nodes + 1, weight + multiplier * child_cost
+
+    def merge(result, other):
+        return max(result[0], other[0]), result[1] + other[1], result[2] + other[2]
+
+    return analyze_selections(schema, document_ast, operation, analyze_field, merge, (0, 0, 0.0))
+
+def analyze_selections(schema, document_ast, operation, analyze_field, merge, empty):
+    """
+    Walk fields selected by operation, reducing results of analyze_field() with merge().
+    Each fragment is analyzed once, so fragments spread many times can not make analysis exponential.
+    Introspection fields "__schema" and "__type" are walked through introspection types, so deep introspection is analyzed too.
+
+    @param schema: graphene.Schema - GraphQL schema
+    @param document_ast: graphql.language.ast.Document - valid document
+    @param operation: graphql.language.ast.OperationDefinition - operation of this document
+    @param analyze_field: callable(field: GraphQLField or None, child: mixed or None, is_root: bool): mixed -
+        result for field, None for e.g. __typename, given result of its subfields, if any
+    @param merge: callable(result: mixed, other: mixed): mixed - result for both
+    @param empty: mixed - result for no fields
+    @return result: mixed - result for operation
+    """
+    fragments = {
+        definition.name.value: definition
+        for definition in document_ast.definitions
+        if isinstance(definition, ast.FragmentDefinition)
+    }
+    analyzed_fragments = {}  # (name, is_root): result
+    meta_fields = {'__schema': SchemaMetaFieldDef, '__type': TypeMetaFieldDef}
+
+    def walk(selection_set, parent_type, is_root):
+        result = empty
+        for selection in selection_set.selections:
+
+            if isinstance(selection, ast.Field):
+                field = getattr(parent_type, 'fields', {}).get(selection.name.value) or meta_fields.get(selection.name.value)
+                child = None
+                if field and selection.selection_set:
+                    child = walk(selection.selection_set, get_named_type(field.type), False)
+                result = merge(result, analyze_field(field, child, is_root))
+
+            elif isinstance(selection, ast.FragmentSpread):
+                key = selection.name.value, is_root
+                if key not in analyzed_fragments:
+                    fragment = fragments[selection.name.value]
+                    analyzed_fragments[key] = walk(fragment.selection_set, schema.get_type(fragment.type_condition.name.value), is_root)
+                result = merge(result, analyzed_fragments[key])
+
+            else:  # InlineFragment
+                fragment_type = schema.get_type(selection.type_condition.name.value) if selection.type_condition else parent_type
+                result = merge(result, walk(selection.selection_set, fragment_type, is_root))
+
+        return result
+
+    root_type = {
+        'query': schema.get_query_type,
+        'mutation': schema.get_mutation_type,
+        'subscription': schema.get_subscription_type,
+    }[operation.operation]()
+
+    return walk(operation.selection_set, root_type, True)
+
+### offload
+
+def offload(pool='thread'):
+    """
+    Decorator of sync resolver, or of graphene type to offload all sync resolvers defined in it,
+    to run in a pool owned by serve(), so blocking or CPU-heavy resolver does not stall other connections of the loop:
+
+        @aiographql.offload()
+        def resolve_report(self, info):
+
+        @aiographql.offload(pool='process')
+        class ImageMetadata(graphene.ObjectType):
+
+    Resolver offloaded to process pool gets info=None, its root, arguments and result should be picklable.
+
+    @param pool: str - 'thread' for pool of offload_threads, good for blocking IO and C code releasing GIL, e.g. bcrypt,
+        'process' for pool of offload_processes, good for CPU-heavy Python code
+    @return decorator: callable(resolver or type): resolver or type
+    """
+    assert pool in ('thread', 'process'), 'pool should be "thread" or "process"'
+
+    def decorator(target):
+        target.offload = pool
+        return target
+    return decorator
+
+def offload_resolvers(schema, loop, pools, offload_threads, offload_processes):
+    """
+    Replace resolvers marked by offload() decorator with wrappers running them in pools, that are created on first use.
+    Wrappers of the previous serve() of the same schema are replaced too, e.g. in tests.
+
+    @param schema: graphene.Schema - GraphQL schema, changed in place
+    @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+    @param pools: dict - pool name: ThreadPoolExecutor or ProcessPoolExecutor, new pools are added here
+    @param offload_threads, offload_processes: int or None - as defined in serve()
+    @return pools: dict - the same
+    """
+    for name, type in schema.get_type_map().items():
+        if name.startswith('__') or not isinstance(type, GraphQLObjectType):
+            continue
+
+        type_pool = getattr(getattr(type, 'graphene_type', None), 'offload', None)
+        for field in type.fields.values():
+            resolver = getattr(field.resolver, 'offloaded_resolver', field.resolver)
+            field.resolver = resolver
+
+            pool = getattr(resolver, 'offload', None)
+            if pool is None and isfunction(resolver):  # not a default resolver, that is partial
+                pool = type_pool
+            if pool is None or iscoroutinefunction(resolver) or isasyncgenfunction(resolver):
+                continue
+
+            if pool not in pools:
+                pools[pool] = ThreadPoolExecutor(offload_threads) if pool == 'thread' else ProcessPoolExecutor(offload_processes)
+            field.resolver = get_offloaded_resolver(resolver, pool, pools[pool], loop)
+
+    return pools
+
+def get_offloaded_resolver(resolver, pool, executor, loop):
+    """
+    @param resolver: callable(root, info, **args): mixed - sync resolver
+    @param pool: str - 'thread' or 'process', as defined in offload()
+    @param executor: ThreadPoolExecutor or ProcessPoolExecutor
+    @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+    @return offloaded: callable(root, info, **args): asyncio.Future - with the same attributes as resolver, e.g. cache_control
+    """
+    if pool == 'process':
+        def offloaded(root, info, **args):
+            return loop.run_in_executor(executor, partial(resolver, root, None, **args))
+    else:
+        def offloaded(root, info, **args):
+            return loop.run_in_executor(executor, partial(resolver, root, info, **args))
+
+    update_wrapper(offloaded, resolver)
+    offloaded.offloaded_resolver = resolver
+    return offloaded
+
+### HTTP parser
+
+class HttpParser(object):
+    """
+    Incremental parser of pipelined HTTP/1.x requests in pure Python,
+    calling back protocol.on_message_begin(), on_headers_complete(), on_body(data) and on_message_complete() - the same way as
+    HttptoolsParser does, so ConnectionFromClient does not depend on parser.
+
+    End of headers is found with bytes.find() without rescanning from the start on each chunk,
+    only headers that define framing of request are searched with regex,
+    and content received in one chunk is passed on without copying.
+
+    Attributes set before on_headers_complete():
+    self.headers: bytes - request line and headers, without the final CRLF CRLF
+    self.http_version: str - '1.1' or '1.0'
+    self.content_length: int or None - if "Content-Length" header is found
+    self.is_chunked: bool - if request has "Transfer-Encoding: chunked" content
+    """
+
+    def __init__(self, protocol, max_header_size, max_body_size):
+        """
+        @param protocol: ConnectionFromClient - or other object with callbacks defined above, and with is_closing attribute
+        @param max_header_size: int - max size of request headers in bytes
+        @param max_body_size: int - max size of request content in bytes, checked before it is buffered
+        """
+        self.protocol = protocol
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.state = None  # None between requests, 'headers', 'body', 'chunk_size', 'chunk_data', 'chunk_end', 'trailers'
+        self.buffer = None  # bytearray with incomplete headers or line of chunked content
+        self.scanned = 0  # how many bytes of self.buffer are already scanned for END_OF_HEADERS
+        self.remaining = 0  # bytes of content or of chunk to receive
+        self.body_size = 0  # of chunked content received so far
+        self.headers = None
+        self.http_version = None
+        self.content_length = None
+        self.is_chunked = False
+
+    def feed_data(self, data):
+        """
+        @param data: bytes - received chunk
+        @return upgrade_start: int or None - index of data after headers, if protocol upgrades connection, e.g. to WebSocket
+        @raise ValueError(message: str, request: bytes) - if request is not valid or is over the limits
+        """
+        protocol = self.protocol
+        start = 0
+        size = len(data)
+
+        while start < size and not protocol.is_closing:
+            state = self.state
+
+            if state is None:
+                self.state = state = 'headers'
+                protocol.on_message_begin()
+
+            if state == 'headers':
+                start = self.parse_headers(data, start)
+                if start is None:
+                    return None  # wait for the next chunk
+
+                if protocol.on_headers_complete():
+                    return start
+
+                if self.state is None:
+                    protocol.on_message_complete()  # without content
+
+            elif state == 'body':
+                end = start + self.remaining
+                if end <= size and self.remaining == self.content_length:
+                    part = data[start:end]  # no copy if data is exactly the content
+                else:
+                    part = memoryview(data)[start:end]
+
+                self.remaining -= len(part)
+                start += len(part)
+                protocol.on_body(part)
+
+                if not self.remaining:
+                    self.state = None
+                    protocol.on_message_complete()
+
+            elif state == 'chunk_size':
+                line, start = self.read_line(data, start)
+                if line is None:
+                    return None
+
+                try:
+                    chunk_size = int(line.split(b';', 1)[0], 16)
+                    assert chunk_size >= 0
+                except Exception:
+                    raise ValueError('Chunk size is not valid', self.headers)
+
+                self.body_size += chunk_size
+                if self.body_size > self.max_body_size:
+                    raise ValueError('Request body is too large', self.headers)
+
+                self.remaining = chunk_size
+                self.state = 'chunk_data' if chunk_size else 'trailers'
+
+            elif state == 'chunk_data':
+                part = memoryview(data)[start:start + self.remaining]
+                self.remaining -= len(part)
+                start += len(part)
+                protocol.on_body(part)
+
+                if not self.remaining:
+                    self.state = 'chunk_end'
+
+            elif state == 'chunk_end':
+                line, start = self.read_line(data, start)
+                if line is None:
+                    return None
+
+                if line:
+                    raise ValueError('Chunk is longer than its size', self.headers)
+
+                self.state = 'chunk_size'
+
+            else:  # trailers are ignored until empty line
+                line, start = self.read_line(data, start)
+                if line is None:
+                    return None
+
+                if not line:
+                    self.state = None
+                    protocol.on_message_complete()
+
+        return None
+
+    def parse_headers(self, data, start):
+        """
+        @param data: bytes - received chunk
+        @param start: int - index of not parsed part of data
+        @return start: int or None - index of content in data, or None if headers are not received in full yet
+        """
+        if self.buffer is None:
+            end_of_headers_index = data.find(END_OF_HEADERS, start)
+            if end_of_headers_index == -1:
+                if len(data) - start > self.max_header_size:
+                    raise ValueError('Request headers are too large', data[start:start + 1024])
+
+                self.buffer = bytearray(memoryview(data)[start:])
+                self.scanned = max(0, len(self.buffer) - len(END_OF_HEADERS) + 1)
+                return None
+
+            headers = data[start:end_of_headers_index]
+            content_start = end_of_headers_index + len(END_OF_HEADERS)
+
+        else:
+            previous_length = len(self.buffer)
+            self.buffer += memoryview(data)[start:]
+
+            end_of_headers_index = self.buffer.find(END_OF_HEADERS, self.scanned)
+            if end_of_headers_index == -1:
+                if len(self.buffer) > self.max_header_size:
+                    raise ValueError('Request headers are too large', bytes(self.buffer[:1024]))
+
+                self.scanned = max(0, len(self.buffer) - len(END_OF_HEADERS) + 1)
+                return None
+
+            headers = bytes(self.buffer[:end_of_headers_index])
+            content_start = start + end_of_headers_index + len(END_OF_HEADERS) - previous_length
+            # END_OF_HEADERS was not found in previous chunks, so content starts in this chunk.
+            self.buffer = None
+
+        if len(headers) > self.max_header_size:
+            raise ValueError('Request headers are too large', headers[:1024])
+
+        match = REQUEST_LINE_RE.match(headers)
+        if not match:
+            raise ValueError('Request line is not valid', headers[:1024])
+
+        self.headers = headers
+        self.http_version = '1.0' if match.group(1) == b'0' else '1.1'
+        self.content_length = None
+        self.is_chunked = False
+
+        transfer_encoding = TRANSFER_ENCODING_RE.search(headers)
+        match = CONTENT_LENGTH_RE.search(headers)
+
+        if transfer_encoding:
+            if match:
+                raise ValueError('Request should not have both "Content-Length" and "Transfer-Encoding" headers', headers)
+
+            if not transfer_encoding.group(1).rstrip().lower().endswith(b'chunked'):
+                raise ValueError('"Transfer-Encoding" of request is not supported', headers)
+
+            self.is_chunked = True
+            self.body_size = 0
+            self.state = 'chunk_size'
+
+        elif match:
+            self.content_length = int(match.group(1))
+            if self.content_length > self.max_body_size:
+                raise ValueError('Request body is too large', headers)
+
+            self.remaining = self.content_length
+            self.state = 'body' if self.content_length else None
+
+        else:
+            self.state = None
+
+        return content_start
+
+    def read_line(self, data, start):
+        """
+        Read line of chunked content, that may be split to many chunks.
+
+        @param data: bytes - received chunk
+        @param start: int - index of not parsed part of data
+        @return line, start: bytes or None, int - line without CRLF or None if it is not received in full yet, index after line
+        """
+        if self.buffer is None:
+            end = data.find(b'\r\n', start)
+            if end != -1:
+                return data[start:end], end + 2
+
+            self.buffer = bytearray()
+
+        previous_length = len(self.buffer)
+        self.buffer += memoryview(data)[start:]
+
+        end = self.buffer.find(b'\r\n', max(0, previous_length - 1))
+        if end == -1:
+            if len(self.buffer) > self.max_header_size:
+                raise ValueError('Line of chunked content is too long', self.headers)
+            return None, len(data)
+
+        line = bytes(self.buffer[:end])
+        self.buffer = None
+        return line, start + end + 2 - previous_length
+
+class HttptoolsParser(object):
+    """
+    Adapter of httptools.HttpRequestParser - fast callback-based C parser, if "pip install httptools" -
+    with the same interface and attributes as HttpParser.
+    """
+
+    def __init__(self, protocol, max_header_size, max_body_size):
+        """
+        @param protocol, max_header_size, max_body_size: as defined in HttpParser
+        """
+        self.protocol = protocol
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.parser = httptools.HttpRequestParser(self)
+        self.url = None
+        self.lines = None  # of headers
+        self.header_size = 0
+        self.is_reading_headers = False
+        self.consumed = 0  # bytes of data consumed by previous requests, approximately
+        self.begin_offset = None  # of current request in data, approximately, if it begins in data
+        self.is_upgrading = False
+        self.body_size = 0
+        self.headers = None
+        self.http_version = None
+        self.content_length = None
+        self.is_chunked = False
+
+    def feed_data(self, data):
+        """
+        @param data: bytes - received chunk
+        @return upgrade_start: int or None - as defined in HttpParser.feed_data()
+        @raise ValueError(message: str, request: bytes) - as defined in HttpParser.feed_data()
+        """
+        self.consumed = 0
+        self.begin_offset = None
+        try:
+            self.parser.feed_data(data)
+
+        except httptools.HttpParserUpgrade as e:
+            upgrade_start = e.args[0]
+            if self.is_upgrading:
+                return upgrade_start
+
+            self.parser = httptools.HttpRequestParser(self)  # upgrade is not accepted by protocol, continue with HTTP
+            return self.feed_data(data[upgrade_start:])
+
+        except httptools.HttpParserError as e:
+            if self.protocol.is_closing:
+                return None  # e.g. data after "Connection: close" is ignored
+
+            if isinstance(e.__context__, ValueError):
+                raise e.__context__  # raised by callback
+
+            raise ValueError('Request is not valid: {}'.format(e), self.headers or self.url)
+
+        if self.is_reading_headers:
+            # Incomplete header is buffered by httptools, so the size is counted by received chunks.
+            self.header_size += len(data) - (self.begin_offset or 0)
+            if self.header_size > self.max_header_size:
+                raise ValueError('Request headers are too large', self.url[:1024])
+
+        return None
+
+    ### callbacks of httptools
+
+    def on_message_begin(self):
+        self.url = b''
+        self.lines = []
+        self.header_size = 0
+        self.is_reading_headers = True
+        self.begin_offset = self.consumed
+        self.is_upgrading = False
+        self.body_size = 0
+        self.content_length = None
+        self.is_chunked = False
+        self.protocol.on_message_begin()
+
+    def on_url(self, url):
+        self.url += url  # may be called with parts of url
+
+    def on_header(self, name, value):
+        if not self.is_reading_headers:
+            return  # trailer of chunked content
+
+        self.lines.append(name + b': ' + value)
+        name = name.lower()
+        if name == b'content-length':
+            self.content_length = int(value)  # validated by httptools
+        elif name == b'transfer-encoding':
+            self.is_chunked = value.rstrip().lower().endswith(b'chunked')
+
+    def on_headers_complete(self):
+        self.is_reading_headers = False
+        self.http_version = self.parser.get_http_version()
+        self.lines.insert(0, self.parser.get_method() + b' ' + self.url + b' HTTP/' + self.http_version.encode())
+        self.headers = b'\r\n'.join(self.lines)
+        self.lines = None
+        self.consumed += len(self.headers) + len(END_OF_HEADERS)
+
+        if len(self.headers) > self.max_header_size:
+            raise ValueError('Request headers are too large', self.headers[:1024])
+
+        if self.content_length is not None and self.content_length > self.max_body_size:
+            raise ValueError('Request body is too large', self.headers)
+
+        self.is_upgrading = self.protocol.on_headers_complete()
+
+    def on_body(self, body):
+        self.consumed += len(body)
+        self.body_size += len(body)
+        if self.body_size > self.max_body_size:
+            raise ValueError('Request body is too large', self.headers)
+
+        self.protocol.on_body(body)
+
+    def on_message_complete(self):
+        if not self.is_upgrading:
+            self.protocol.on_message_complete()
+
+def parse_request_head(headers):
+    """
+    Parse request line and headers, e.g. for get_context().
+
+    @param headers: bytes - request line and headers, as produced by HttpParser
+    @return method, path, http_headers: str, str, dict - path without query string,
+        names of headers in lower case, values of repeated headers joined with ", "
+    """
+    lines = headers.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ', 2)
+
+    http_headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        name, value = name.strip().lower(), value.strip()
+        http_headers[name] = http_headers[name] + ', ' + value if name in http_headers else value
+
+    return method, target.split('?', 1)[0], http_headers
+
+def is_http10(headers):
+    """
+    @param headers: bytes - request line and headers
+    @return bool - if request is HTTP/1.0, so its response can not use "Transfer-Encoding: chunked"
+    """
+    end = headers.find(b'\r\n')
+    return headers.endswith(b'HTTP/1.0', 0, len(headers) if end == -1 else end)
+
+### GET
+
+def get_request_from_query_string(headers, json_codec):
+    """
+    Get GraphQL request from query string of GET request:
+    http://graphql.org/learn/serving-over-http/#get-request
+
+    @param headers: bytes - HTTP headers, starting with "GET /?query=...&variables=...&operationName=... HTTP/1.1"
+    @param json_codec: JsonCodec, UjsonCodec, OrjsonCodec, etc
+    @return request: dict - GraphQL request
+    """
+    target = headers[4:headers.index(b' ', 4)]
+    request = dict(parse_qsl(target.partition(b'?')[2].decode()))
+
+    for key in ('variables', 'extensions'):
+        if request.get(key):
+            request[key] = json_codec.loads(request[key])
+
+    return request
+
+def get_operation(document_ast, operation_name):
+    """
+    Find operation to execute, the same way as execute() does.
+
+    @param document_ast: graphql.language.ast.Document
+    @param operation_name: str or None
+    @return operation: graphql.language.ast.OperationDefinition or None - if not found
+    """
+    operations = [
+        definition for definition in document_ast.definitions
+        if isinstance(definition, ast.OperationDefinition)
+    ]
+
+    if operation_name is None:
+        return operations[0] if len(operations) == 1 else None
+
+    for operation in operations:
+        if operation.name and operation.name.value == operation_name:
+            return operation
+
+    return None
+
+
+### incremental delivery
+
+DEFER_DIRECTIVE = GraphQLDirective(
+    name='defer',
+    description='Deliver this fragment later, in the next part of "multipart/mixed" response.',
+    args={
+        'if': GraphQLArgument(GraphQLBoolean, default_value=True),
+        'label': GraphQLArgument(GraphQLString),
+    },
+    locations=[DirectiveLocation.FRAGMENT_SPREAD, DirectiveLocation.INLINE_FRAGMENT],
+)
+
+STREAM_DIRECTIVE = GraphQLDirective(
+    name='stream',
+    description='Deliver only initialCount items of this list at first, and the rest in the next part of "multipart/mixed" response.',
+    args={
+        'if': GraphQLArgument(GraphQLBoolean, default_value=True),
+        'label': GraphQLArgument(GraphQLString),
+        'initialCount': GraphQLArgument(GraphQLInt, default_value=0),
+    },
+    locations=[DirectiveLocation.FIELD],
+)
+
+DIRECTIVES = [GraphQLIncludeDirective, GraphQLSkipDirective, DEFER_DIRECTIVE, STREAM_DIRECTIVE]
+# Usage: graphene.Schema(query=Query, directives=aiographql.DIRECTIVES)
+
+def get_incremental_plan(schema, document_ast, operation):
+    """
+    Split query operation with @defer and @stream directives to documents executed concurrently.
+
+    Deferred fragment is removed from the initial document,
+    and gets its own document with the path of fields from the root to the fragment,
+    so resolvers of these fields are called again, unless they are cached, e.g. by DataLoader.
+    Nested deferred fragments are delivered with their parent fragment.
+    Lists with @stream are resolved in full, but only initialCount items are sent in the initial part.
+    Argument "if" of these directives is checked only if it is literal, variable means true.
+
+    @param schema: graphene.Schema
+    @param document_ast: graphql.language.ast.Document - valid document
+    @param operation: graphql.language.ast.OperationDefinition or None - operation to execute
+    @return plan: dict or None - None if query operation has no @defer or @stream, else dict(
+        initial=graphql.language.ast.Document,
+        deferred=[(label: str or None, keys: list, document: graphql.language.ast.Document), ...],
+        streams=[(label: str or None, keys: list, initial_count: int), ...],
+    ) - where keys are response keys of fields from the root to the parent of deferred fragment, or to the streamed list
+    """
+    if operation is None or operation.operation != 'query':
+        return None  # fields of mutation would be executed again with deferred documents
+
+    fragments = {
+        definition.name.value: definition for definition in document_ast.definitions
+        if isinstance(definition, ast.FragmentDefinition)
+    }
+    deferred = []
+    streams = []
+
+    def transform(selection_set, ancestors, keys, is_deferred):
+        selections = []
+        for selection in selection_set.selections:
+
+            if isinstance(selection, ast.Field):
+                key = (selection.alias or selection.name).value
+                stream = _get_enabled_directive(selection.directives, 'stream')
+                if stream and not is_deferred:
+                    streams.append((_get_literal_argument(stream, 'label'), keys + [key], _get_literal_argument(stream, 'initialCount', 0)))
+
+                if selection.selection_set:
+                    selection = ast.Field(
+                        name=selection.name,
+                        alias=selection.alias,
+                        arguments=selection.arguments,
+                        directives=selection.directives,
+                        selection_set=transform(selection.selection_set, ancestors + [selection], keys + [key], is_deferred),
+                    )
+                selections.append(selection)
+                continue
+
+            if isinstance(selection, ast.FragmentSpread):
+                definition = fragments[selection.name.value]
+                type_condition, fragment_selection_set = definition.type_condition, definition.selection_set
+            else:
+                type_condition, fragment_selection_set = selection.type_condition, selection.selection_set
+
+            defer = _get_enabled_directive(selection.directives, 'defer')
+            directives = [directive for directive in selection.directives or () if directive.name.value != 'defer']
+            fragment = ast.InlineFragment(type_condition=type_condition, selection_set=None, directives=directives)
+
+            if defer and not is_deferred:
+                fragment.selection_set = transform(fragment_selection_set, [], [], True)
+                document_selection_set = ast.SelectionSet(selections=[fragment])
+                for ancestor in reversed(ancestors):
+                    if isinstance(ancestor, ast.Field):
+                        ancestor = ast.Field(name=ancestor.name, alias=ancestor.alias, arguments=ancestor.arguments,
+                            directives=ancestor.directives, selection_set=document_selection_set)
+                    else:
+                        ancestor = ast.InlineFragment(type_condition=ancestor.type_condition,
+                            selection_set=document_selection_set, directives=ancestor.directives)
+                    document_selection_set = ast.SelectionSet(selections=[ancestor])
+
+                deferred.append((_get_literal_argument(defer, 'label'), keys, ast.Document(definitions=[
+                    _copy_operation(operation, document_selection_set),
+                ])))
+                continue
+
+            fragment.selection_set = transform(fragment_selection_set, ancestors + [fragment], keys, is_deferred)
+            selections.append(fragment)
+
+        return ast.SelectionSet(selections=selections)
+
+    initial_selection_set = transform(operation.selection_set, [], [], False)
+    if not deferred and not streams:
+        return None
+
+    return dict(
+        initial=ast.Document(definitions=[_copy_operation(operation, initial_selection_set)]),
+        deferred=deferred,
+        streams=streams,
+    )
+
+def _get_enabled_directive(directives, name):
+    """
+    @param directives: list of graphql.language.ast.Directive or None
+    @param name: str - e.g. "defer"
+    @return directive: graphql.language.ast.Directive or None - if not found or disabled with literal "if: false"
+    """
+    for directive in directives or ():
+        if directive.name.value == name:
+            return None if _get_literal_argument(directive, 'if', True) is False else directive
+    return None
+
+def _get_literal_argument(directive, name, default=None):
+    """
+    @param directive: graphql.language.ast.Directive
+    @param name: str - e.g. "label"
+    @param default: mixed - if argument is not found or is not literal
+    @return value: mixed
+    """
+    for argument in directive.arguments or ():
+        if argument.name.value == name:
+            value = argument.value
+            if isinstance(value, ast.BooleanValue):
+                return value.value
+            if isinstance(value, ast.IntValue):
+                return int(value.value)
+            if isinstance(value, ast.StringValue):
+                return value.value
+    return default
+
+def _copy_operation(operation, selection_set):
+    """
+    @param operation: graphql.language.ast.OperationDefinition
+    @param selection_set: graphql.language.ast.SelectionSet - to replace the original one
+    @return operation: graphql.language.ast.OperationDefinition - with the same name and variables
+    """
+    return ast.OperationDefinition(
+        operation=operation.operation,
+        name=operation.name,
+        variable_definitions=operation.variable_definitions,
+        directives=operation.directives,
+        selection_set=selection_set,
+    )
+
+def find_values(value, keys, path=(), expand_lists=False):
+    """
+    Find values by response keys in GraphQL data, walking into each item of lists on the way.
+
+    @param value: dict, list, etc - GraphQL data
+    @param keys: list - response keys of fields, as in get_incremental_plan()
+    @param path: tuple - path to value, as in GraphQL errors
+    @param expand_lists: bool - walk into each item of list found at the end of keys too
+    @return found: generator of (path: list, value: mixed)
+    """
+    if isinstance(value, list) and (keys or expand_lists):
+        for index, item in enumerate(value):
+            yield from find_values(item, keys, path + (index,), expand_lists)
+
+    elif not keys:
+        yield list(path), value
+
+    elif isinstance(value, dict) and keys[0] in value:
+        yield from find_values(value[keys[0]], keys[1:], path + (keys[0],), expand_lists)
+
+### WebSocket frames
+
+def parse_websocket_frame(data, start, max_size):
+    """
+    Parse frame sent by client: https://tools.ietf.org/html/rfc6455#section-5.2
+
+    @param data: bytes or bytearray - received data
+    @param start: int - index of the frame in data
+    @param max_size: int - max length of payload
+    @return frame: None if data has no full frame yet, or tuple(fin: bool, opcode: int, payload: bytes, end: int)
+    @raise ValueError(code: int, reason: str) - if the frame is not acceptable
+    """
+    if len(data) - start < 2:
+        return None
+
+    first, second = data[start], data[start + 1]
+    if not second & 0x80:
+        raise ValueError(1002, 'Frame from client should be masked')
+
+    length = second & 0x7f
+    index = start + 2
+    if length == 126:
+        if len(data) - index < 2:
+            return None
+        length = int.from_bytes(data[index:index + 2], 'big')
+        index += 2
+    elif length == 127:
+        if len(data) - index < 8:
+            return None
+        length = int.from_bytes(data[index:index + 8], 'big')
+        index += 8
+
+    if length > max_size:
+        raise ValueError(1009, 'Message is too big')
+
+    end = index + 4 + length
+    if len(data) < end:
+        return None
+
+    return bool(first & 0x80), first & 0x0f, unmask(data[index + 4:end], data[index:index + 4]), end
+
+def unmask(payload, mask):
+    """
+    XOR payload with 4 bytes of mask at once for the whole payload, using big int instead of loop over bytes.
+
+    @param payload: bytes or bytearray
+    @param mask: bytes or bytearray - 4 bytes
+    @return payload: bytes
+    """
+    length = len(payload)
+    if not length:
+        return b''
+
+    mask = (bytes(mask) * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(mask, 'little')).to_bytes(length, 'little')
+
+def get_websocket_frame_header(length, opcode=1):
+    """
+    @param length: int - of payload
+    @param opcode: int - 1 for text, 8 for close, 10 for pong, etc
+    @return header: bytes - of not masked, not fragmented frame sent by server
+    """
+    first = bytes((0x80 | opcode,))
+    if length < 126:
+        return first + bytes((length,))
+    if length < 65536:
+        return first + b'\x7e' + length.to_bytes(2, 'big')
+    return first + b'\x7f' + length.to_bytes(8, 'big')
+
+def get_subscription_schema(schema):
+    """
+    Create schema with subscription type as query type, so events can be executed as queries, see get_event_document().
+
+    @param schema: graphene.Schema
+    @return schema: GraphQLSchema or None - if schema has no subscription type
+    """
+    subscription_type = schema.get_subscription_type()
+    if subscription_type is None:
+        return None
+
+    return GraphQLSchema(
+        query=subscription_type,
+        types=[type for name, type in schema.get_type_map().items() if not name.startswith('__')],
+        directives=schema.get_directives(),
+    )
+
+### serve
+
+def serve(schema, listen, get_context=None, exception_handler=None, enable_uvloop=True, run=True, query_cache_size=1000,
+        persisted_queries=None, persisted_queries_only=False, workers=None, executor_factory=None,
+        compression_min_size=1024, compression_level=6, compression_thread_min_size=65536,
+        max_requests=10000, max_requests_per_connection=100, write_buffer_limits=None, max_batch_size=100, batch_concurrency=10,
+        data_loaders=None, response_cache=None, get_cache_scope=None, metrics=None, tracing=None,
+        max_depth=None, max_nodes=None, max_cost=None, list_size=10,
+        max_header_size=65536, max_body_size=10485760, header_timeout=10.0, body_timeout=60.0, keep_alive_timeout=60.0,
+        streaming_min_size=1048576, streaming_chunk_size=65536,
+        pubsub=None, subscription_queue_size=100, subscription_overflow='coalesce', http_parser_factory=None,
+        offload_threads=None, offload_processes=None, loop_monitor=None, drain_timeout=30.0, json_codec=None):
+    """
+    Configure the stack and start serving requests
+
+    @param schema: graphene.Schema - GraphQL schema to serve
+
+    @param listen: list - one or more endpoints to listen for connections:
+        dict(protocol='tcp', port=25100, ...) - https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.create_server
+        dict(protocol='unix', path='/tmp/worker0', ...) - https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.create_unix_server
+
+    @param get_context: None or [async] callable(loop, context: dict): mixed - to produce GraphQL context like auth
+        from input unified with exception_handler() +
+        data_loaders: dict - DataLoader-s created for this request, if data_loaders are configured below
+        method: str - HTTP method, e.g. "POST"
+        path: str - HTTP path without query string, e.g. "/graphql"
+        http_headers: dict - HTTP headers with names in lower case, e.g. {"authorization": "Bearer ..."}
+        keep_alive: bool - False if connection is closed after this request, e.g. "Connection: close" or HTTP/1.0
+        connection_params: mixed - payload of "connection_init" message, for subscriptions over WebSocket
+
+    @param exception_handler: None or callable(loop, context: dict) - default or custom exception handler as defined in
+        https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.set_exception_handler +
+        headers: bytes or None - HTTP headers, if known
+        request: dict or bytes or None - accumulated HTTP request before content length is known, then accumulated content, then GraphQL request
+
+    @param enable_uvloop: bool - enable uvloop for top performance, unless you have a better loop
+    @param run: bool - if True, run the loop; False is good for tests
+
+    @param query_cache_size: int - how many parsed and validated GraphQL documents to keep in LRU cache, 0 to disable the cache,
+        see servers.query_cache.hits and .misses
+
+    @param persisted_queries: None or PersistedQueries - store of Automatic Persisted Queries:
+        https://github.com/apollographql/apollo-link-persisted-queries#protocol
+        None - in-memory LRU store of 1000 queries,
+        PersistedQueries.load(path) - queries from manifest built at deploy time,
+        or custom store with the same interface, e.g. shared by workers.
+
+    @param persisted_queries_only: bool - if True, serve only queries found in persisted_queries store, good for allow-list
+
+    @param workers: None or int - number of worker processes to fork, each with its own loop, to use all CPU cores:
+        dict(protocol='tcp', ...) endpoints are shared by workers with reuse_port=True,
+        dict(protocol='unix', path='/tmp/worker{worker}', ...) endpoints get path formatted with worker index,
+        ValueError is raised if path has no "{worker}", as workers would bind the same path over each other.
+        Crashed workers are restarted. SIGTERM and SIGINT are passed to workers to close listening sockets and exit.
+
+    @param executor_factory: None or callable(loop): executor - to create GraphQL executor shared by all requests in this loop,
+        None - SharedAsyncioExecutor
+
+    @param compression_min_size: int or None - compress responses of this size or bigger with "br" or "gzip"
+        as negotiated by "Accept-Encoding" request header, None to disable compression
+    @param compression_level: int - 1-9 for gzip, the same value is used as quality of br
+    @param compression_thread_min_size: int - compress responses of this size or bigger in thread pool of the loop,
+        to avoid blocking other connections
+
+    @param max_requests: int - max number of requests in flight in this loop, new requests get fast error response,
+        see servers.requests_in_flight and .requests_shed
+    @param max_requests_per_connection: int - max number of pipelined requests in flight per connection,
+        reading from connection is paused until responses are sent
+    @param write_buffer_limits: None or dict(high=int, low=int) - write buffer watermarks of each connection as defined in
+        https://docs.python.org/3/library/asyncio-protocol.html#asyncio.WriteTransport.set_write_buffer_limits
+        once "high" is reached, both reading from connection and writing to it are paused until "low" is reached
+
+    @param max_batch_size: int - max number of GraphQL requests in a batch sent as JSON array, responses are sent as JSON array too
+    @param batch_concurrency: int - max number of GraphQL requests of a batch executed concurrently
+
+    @param data_loaders: None or dict(name=[async] callable(keys: list): list or dict(batch_load=..., cache=bool, max_batch_size=int), ...) -
+        to create DataLoader-s for each request, passed to get_context() as "data_loaders",
+        or used as GraphQL context dict(data_loaders=...) if get_context is None
+
+    @param response_cache: None or ResponseCache - to cache serialized responses to query operations without errors, None to disable:
+        ResponseCache(ttl=1.0, max_size=64 * 1024 * 1024) - in-memory LRU cache limited by total size in bytes,
+        or custom store with the same interface, e.g. shared by workers.
+        Concurrent identical requests that miss the cache are executed once.
+        Compressed content of cache hits is cached too, so hits are not compressed again.
+    @param get_cache_scope: None or [async] callable(context: mixed): str or None - scope key of response_cache from GraphQL context,
+        e.g. user id for responses that depend on auth, or None to bypass the cache,
+        None - responses are shared by all clients
+
+    @param metrics: None or Metrics - e.g. Metrics(listen=[dict(protocol='tcp', port=25101)]) to serve metrics in Prometheus text format,
+        aggregated across workers, None to disable metrics
+
+    @param tracing: None or Tracing - e.g. Tracing(header='X-Tracing', sample_rate=0.01, slow_query_seconds=1.0, top_fields=5)
+        to time each resolver of sampled requests for slow query log, and of requests with the header for Apollo tracing extension,
+        None to disable tracing
+
+    @param max_depth: int or None - max depth of fields in operation, None for no limit
+    @param max_nodes: int or None - max number of fields in operation with fragments expanded, None for no limit
+    @param max_cost: float or None - max sum of weights of fields, multiplied by list sizes of parent fields, None for no limit,
+        weight is 1 unless declared by @aiographql.cost(weight=..., list_size=...) decorator of resolver
+    @param list_size: int - expected max length of lists, unless declared by cost() decorator
+        Operation over any limit is rejected before execution, the analysis is cached alongside parsed document.
+
+    @param max_header_size: int - max size of HTTP request headers in bytes
+    @param max_body_size: int - max Content-Length of HTTP request in bytes, checked before the body is buffered
+    @param header_timeout: float - seconds to receive HTTP request headers since their first byte, or WebSocket "connection_init" message since upgrade
+    @param body_timeout: float - seconds to receive HTTP request body since its headers are received, or each WebSocket frame since its first byte
+    @param keep_alive_timeout: float - seconds to wait for the next request on idle connection before closing it
+        Request over any limit gets error response, and then connection is closed. Idle connection is closed silently.
+
+    @param streaming_min_size: int or None - stream response with "Transfer-Encoding: chunked" as it is serialized,
+        if its estimated size is this or bigger, None to disable streaming
+    @param streaming_chunk_size: int - approximate size of chunks of streamed response,
+        next chunk is serialized once transport write buffer drains below its "high" limit
+
+    @param pubsub: None or PubSub - broker of subscription events, None - new PubSub(),
+        resolver of subscription field returns aiographql.Topic(name) to receive events of pubsub.publish(name, event),
+        or async iterable of events. Subscriptions are served over WebSocket at any path,
+        with "graphql-transport-ws" or legacy "graphql-ws" protocol, if schema has subscription type.
+        Each event is executed and serialized once per group of subscribers with the same operation, variables and cache scope,
+        see get_cache_scope. If get_context is set without get_cache_scope, subscribers are not grouped,
+        as each event is executed with context of the first subscriber of the group.
+    @param subscription_queue_size: int - max number of events waiting for slow client per connection,
+        and for execution per group of subscribers
+    @param subscription_overflow: str - 'coalesce' to replace waiting event of the same subscription with the latest one,
+        or 'drop' to drop new events once the queue is full, see servers.metrics "subscription_events_dropped_total"
+
+    @param http_parser_factory: None or callable(protocol, max_header_size, max_body_size): parser - to create HTTP parser for each connection,
+        None - HttpParser in pure Python, faster for usual requests as only headers that define framing are searched,
+        HttptoolsParser - strict C parser with callback per header, if "pip install httptools",
+        both support "Transfer-Encoding: chunked" content, "Expect: 100-continue", "Connection: close" and HTTP/1.0
+
+    @param offload_threads: int or None - max number of threads running resolvers marked by @aiographql.offload(),
+        None - default of ThreadPoolExecutor
+    @param offload_processes: int or None - max number of processes running resolvers marked by @aiographql.offload(pool='process'),
+        None - number of CPUs. Each worker gets its own pools, created only if schema has resolvers marked for them.
+    @param loop_monitor: None or LoopMonitor - e.g. LoopMonitor(interval=0.1, lag_seconds=0.1, resolver_seconds=0.01, sample_rate=0.01)
+        to report lag of the loop and sync resolvers blocking it, candidates for offload(), None to disable monitoring
+
+    @param drain_timeout: float - seconds to finish requests in flight on SIGTERM or SIGINT, see servers.drain(),
+        if serve(run=True) or workers. SIGHUP starts new process with the same command line, and once it is listening,
+        this process is drained: listening sockets are inherited by new process, or bound by its workers with reuse_port=True,
+        so no connection is refused. Schema may be swapped without restart too, see servers.swap_schema().
+
+    @param json_codec: None or object with loads(bytes) and dumps(value): bytes methods - to parse requests and serialize responses,
+        None - OrjsonCodec if "pip install orjson", the fastest one, with native support of datetime values and non-str keys,
+        else JsonCodec of stdlib with the same output, about 2x slower, so "pip install aiographql[orjson]" is recommended,
+        UjsonCodec is faster than JsonCodec, if "pip install ujson", but see its caveats.
+
+    @return servers: Servers - await servers.close() to close listening sockets - good for tests,
+        or None in supervisor process of workers, once all workers exit
+    """
+    if workers:
+        return _supervise(workers, dict(locals(), workers=None))
+
+    try:
+        if enable_uvloop:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+        loop = asyncio.get_event_loop()
+
+        if exception_handler:
+            loop.set_exception_handler(exception_handler)
+
+        servers = Servers()
+        servers.listening = loop.create_future()
+        servers.listen_fds = []
+        servers.connections = set()
+        servers.draining = None
+        servers.query_cache = QueryCache(schema, query_cache_size)
+        servers.persisted_queries = PersistedQueries() if persisted_queries is None else persisted_queries
+        servers.persisted_queries_only = persisted_queries_only
+        servers.executor = (executor_factory or SharedAsyncioExecutor)(loop)
+        servers.compression_min_size = compression_min_size
+        servers.compression_level = compression_level
+        servers.compression_thread_min_size = compression_thread_min_size
+        servers.max_requests = max_requests
+        servers.max_requests_per_connection = max_requests_per_connection
+        servers.write_buffer_limits = write_buffer_limits
+        servers.max_batch_size = max_batch_size
+        servers.batch_concurrency = batch_concurrency
+        servers.data_loaders = data_loaders
+        servers.response_cache = response_cache
+        servers.get_cache_scope = get_cache_scope
+        servers.response_cache_flights = {}
+        servers.requests_in_flight = 0
+        servers.requests_shed = 0
+        servers.metrics = metrics
+        servers.tracing = tracing
+        servers.max_depth = max_depth
+        servers.max_nodes = max_nodes
+        servers.max_cost = max_cost
+        servers.list_size = list_size
+        servers.max_header_size = max_header_size
+        servers.max_body_size = max_body_size
+        servers.header_timeout = header_timeout
+        servers.body_timeout = body_timeout
+        servers.keep_alive_timeout = keep_alive_timeout
+        servers.streaming_min_size = streaming_min_size
+        servers.streaming_chunk_size = streaming_chunk_size
+        servers.pubsub = pubsub or PubSub()
+        servers.subscription_queue_size = subscription_queue_size
+        servers.subscription_overflow = subscription_overflow
+        servers.subscription_schema = get_subscription_schema(schema)
+        servers.http_parser_factory = http_parser_factory
+        servers.json_codec = json_codec or get_json_codec()
+        servers.offload_threads = offload_threads
+        servers.offload_processes = offload_processes
+        servers.offload_pools = offload_resolvers(schema, loop, {}, offload_threads, offload_processes)
+        servers.loop_monitor = loop_monitor
+        servers.update_date_header(loop)
+        servers.listening.add_done_callback(_finish_handoff)
+
+        if metrics:
+            if metrics.shared is None:
+                metrics.allocate(workers=1)
+            metrics.start_syncing(loop, servers)
+
+        if loop_monitor:
+            loop_monitor.start(loop, servers)
+
+        coro = _serve(listen, get_context, loop, servers)
+        if run:
+            _add_signal_handlers(loop, servers, drain_timeout, handoff=True)
+            loop.run_until_complete(coro)
+        else:
+            servers.serving = loop.create_task(coro)
+            servers.serving.add_done_callback(_on_serving_done)
+
+        return servers
+
+    except Exception as e:
+        asyncio.get_event_loop().call_exception_handler(dict(
+            message=str(e),
+            exception=e,
+        ))
+
+def _on_serving_done(task):
+    """
+    Report exception of the coroutine serving requests, if serve(run=False).
+
+    @param task: asyncio.Task - servers.serving
+    """
+    if not task.cancelled() and task.exception():
+        e = task.exception()
+        asyncio.get_event_loop().call_exception_handler(dict(
+            message=str(e),
+            exception=e,
+        ))
+
+async def _serve(listen, get_context, loop, servers):
+    """
+    The coroutine serving requests, until servers are closed, and drained if servers.drain() was called.
+    Should be created by serve() only.
+
+    @param listen: list - one or more endpoints to listen for connections, as defined in serve()
+    @param get_context: None or [async] callable(loop, context: dict): mixed - to produce GraphQL context like auth as defined in serve()
+    @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+    @param servers: Servers - list that will be populated with asyncio.Server instances here
+    """
+    def protocol_factory():
+        return ConnectionFromClient(get_context, loop, servers)
+
+    def metrics_protocol_factory():
+        return MetricsConnection(servers.metrics)
+
+    assert listen, 'At least one endpoint should be specified in "listen"'
+    endpoints = [(endpoint, protocol_factory) for endpoint in listen]
+    if servers.metrics:
+        endpoints.extend((endpoint, metrics_protocol_factory) for endpoint in servers.metrics.listen)
+
+    inherited_fds = _get_inherited_fds(len(endpoints))
+    for index, (endpoint, factory) in enumerate(endpoints):
+        kwargs = endpoint.copy()  # to allow reuse of "listen" configuration
+        protocol = kwargs.pop('protocol')
+
+        if protocol not in ('tcp', 'unix'):
+            raise ValueError('Unsupported protocol={}'.format(repr(protocol)))
+
+        if inherited_fds:
+            family = socket.AF_INET if protocol == 'tcp' else socket.AF_UNIX
+            create_server = loop.create_server if protocol == 'tcp' else loop.create_unix_server
+            for fd in inherited_fds[index]:
+                sock = socket.socket(family, socket.SOCK_STREAM, fileno=fd)  # the real family is detected from fd
+                servers.append(await create_server(factory, sock=sock, ssl=kwargs.get('ssl')))
+            servers.listen_fds.append(inherited_fds[index])
+            continue
+
+        if protocol == 'tcp':
+            servers.append(await loop.create_server(factory, **kwargs))
+
+        else:
+            path = kwargs.pop('path')
+            temp_path = '{}.{}'.format(path, os.getpid())
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            servers.append(await loop.create_unix_server(factory, path=temp_path, **kwargs))
+            os.rename(temp_path, path)  # atomically replaces socket of the previous process, if any, so no connection is refused
+
+        servers.listen_fds.append([sock.fileno() for sock in servers[-1].sockets])
+
+    servers.listening.set_result(None)
+    await asyncio.gather(*[server.wait_closed() for server in servers])
+    if servers.draining:
+        await servers.draining
+
+### handoff
+
+def _get_inherited_fds(count):
+    """
+    Get listening sockets inherited from the previous process, see _handoff().
+
+    @param count: int - number of endpoints to listen
+    @return fds: list or None - of lists of file descriptors, one list per endpoint, None if nothing is inherited
+    """
+    value = os.environ.pop(LISTEN_FDS_ENV, None)  # not for grandchildren
+    if not value:
+        return None
+
+    fds = [[int(fd) for fd in part.split(',')] for part in value.split(';')]
+    if len(fds) != count:
+        raise ValueError('Inherited listening sockets of {} endpoints, but {} endpoints are configured'.format(len(fds), count))
+    return fds
+
+def _handoff(servers=None):
+    """
+    Start new process with the same command line, e.g. to serve new code or schema after deploy,
+    passing listening sockets of servers to it, if any. It stops this process once it is listening, see _finish_handoff().
+
+    @param servers: Servers or None - in supervisor of workers, as new workers bind with reuse_port=True themselves
+    """
+    env = dict(os.environ)
+    env[HANDOFF_PID_ENV] = str(os.getpid())
+
+    fds = []
+    if servers:
+        fds = [fd for group in servers.listen_fds for fd in group]
+        env[LISTEN_FDS_ENV] = ';'.join(','.join(str(fd) for fd in group) for group in servers.listen_fds)
+
+    argv = getattr(sys, 'orig_argv', None)
+    command = [sys.executable] + (argv[1:] if argv else sys.argv)
+    try:
+        subprocess.Popen(command, env=env, pass_fds=fds)
+    except Exception as e:
+        asyncio.get_event_loop().call_exception_handler(dict(
+            message='Handoff failed: {}'.format(e),
+            exception=e,
+        ))
+
+def _finish_handoff(future=None):
+    """
+    Stop the previous process gracefully, once this process is listening.
+
+    @param future: asyncio.Future or None - servers.listening
+    """
+    pid = os.environ.pop(HANDOFF_PID_ENV, None)
+    if pid:
+        try:
+            os.kill(int(pid), signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+def _add_signal_handlers(loop, servers, drain_timeout, handoff):
+    """
+    SIGTERM and SIGINT drain servers, SIGHUP hands listening sockets off to new process, if handoff.
+
+    @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+    @param servers: Servers
+    @param drain_timeout: float - as defined in serve()
+    @param handoff: bool - False in worker, as its supervisor does the handoff
+    """
+    def drain():
+        if not servers.draining:
+            loop.create_task(servers.drain(drain_timeout))
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, drain)
+
+    if handoff:
+        loop.add_signal_handler(signal.SIGHUP, _handoff, servers)
+    else:
+        loop.add_signal_handler(signal.SIGHUP, lambda: None)
+
+### workers
+
+def _supervise(workers, serve_kwargs):
+    """
+    Fork worker processes, restart crashed ones,
+    and pass SIGTERM and SIGINT to them for graceful shutdown.
+    SIGHUP starts new supervisor with the same command line, that stops this one once all its workers are listening.
+    Should be called by serve(workers=N) only.
+
+    @param workers: int - number of worker processes
+    @param serve_kwargs: dict - all arguments of serve() for workers
+    @raise ValueError - if unix endpoint has no "{worker}" in path, before any worker is forked
+    """
+    for endpoint in serve_kwargs['listen']:
+        if workers > 1 and endpoint['protocol'] == 'unix' and '{worker}' not in endpoint['path']:
+            raise ValueError('Path of unix endpoint should contain "{{worker}}" to bind a socket per worker: {}'.format(endpoint['path']))
+
+    pids = {}  # pid: (worker index, started at)
+    stopping = []
+    handoff_pid = os.environ.pop(HANDOFF_PID_ENV, None)  # not for workers
+    ready_fds = list(os.pipe()) if handoff_pid else []  # each worker of the first generation writes a byte once listening
+
+    def start_worker(index):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                if ready_fds:
+                    os.close(ready_fds[0])
+                status = _serve_worker(index, serve_kwargs, ready_fds[1] if ready_fds else None)
+            finally:
+                os._exit(status)
+
+        pids[pid] = index, time.monotonic()
+
+    def stop_workers(signum, frame):
+        stopping.append(signum)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, stop_workers)
+    signal.signal(signal.SIGHUP, lambda signum, frame: _handoff())
+
+    if serve_kwargs['metrics']:
+        serve_kwargs['metrics'].allocate(workers)  # before fork, to share memory
+
+    for index in range(workers):
+        start_worker(index)
+
+    if handoff_pid:
+        ready_fd, ready_write_fd = ready_fds
+        del ready_fds[:]  # restarted workers do not report
+        os.close(ready_write_fd)
+
+        ready = 0
+        deadline = time.monotonic() + serve_kwargs['drain_timeout']
+        while ready < workers and time.monotonic() < deadline:
+            if select.select([ready_fd], [], [], max(0, deadline - time.monotonic()))[0]:
+                data = os.read(ready_fd, workers)
+                if not data:
+                    break  # all workers exited
+                ready += len(data)
+        os.close(ready_fd)
+
+        if ready == workers:
+            os.environ[HANDOFF_PID_ENV] = handoff_pid
+            _finish_handoff()
+        else:
+            context = dict(message='Handoff failed: {} of {} workers are listening, process {} is not stopped'.format(
+                ready, workers, handoff_pid))
+            if serve_kwargs['exception_handler']:
+                serve_kwargs['exception_handler'](None, context)
+            else:
+                logger.error(context['message'])
+
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        index, started_at = pids.pop(pid, (None, None))
+        if index is None or stopping:
+            continue
+
+        context = dict(message='Worker {} exited with status {}, restarting'.format(index, status))
+        if serve_kwargs['exception_handler']:
+            serve_kwargs['exception_handler'](None, context)
+        else:
+            logger.error(context['message'])
+
+        if time.monotonic() - started_at < 1:
+            time.sleep(1)  # to avoid busy loop of crashes
+
+        if not stopping:
+            start_worker(index)
+
+def _serve_worker(index, serve_kwargs, ready_fd):
+    """
+    Serve requests in worker process until SIGTERM or SIGINT, then drain.
+    Should be called by _supervise() only.
+
+    @param index: int - worker index, from 0
+    @param serve_kwargs: dict - all arguments of serve()
+    @param ready_fd: int or None - to write a byte to supervisor once listening, on handoff
+    @return status: int - exit status of worker process
+    """
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)  # instead of handlers inherited from supervisor
+
+    metrics = serve_kwargs['metrics']
+    if metrics:
+        metrics.worker = index
+        metrics.listen = _get_worker_endpoints(metrics.listen, index)
+
+    listen = _get_worker_endpoints(serve_kwargs['listen'], index)
+    servers = serve(**dict(serve_kwargs, listen=listen, run=False))
+    if servers is None:
+        return 1
+
+    def on_listening(future):
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+    loop = asyncio.get_event_loop()
+    _add_signal_handlers(loop, servers, serve_kwargs['drain_timeout'], handoff=False)
+    if ready_fd is not None:
+        servers.listening.add_done_callback(on_listening)
+
+    try:
+        loop.run_until_complete(servers.serving)
+        return 0
+
+    except Exception:
+        return 1  # already reported by _on_serving_done()
+
+def _get_worker_endpoints(listen, index):
+    """
+    @param listen: list - endpoints as defined in serve()
+    @param index: int - worker index, from 0
+    @return listen: list - tcp endpoints with reuse_port=True, unix endpoints with path formatted with worker index
+    """
+    endpoints = []
+    for endpoint in listen:
+        endpoint = endpoint.copy()
+        if endpoint['protocol'] == 'tcp':
+            endpoint.setdefault('reuse_port', True)
+        elif endpoint['protocol'] == 'unix':
+            endpoint['path'] = endpoint['path'].format(worker=index)
+        endpoints.append(endpoint)
+    return endpoints
+
+### Servers
+
+class Servers(list):
+    """
+    A list of servers created by serve()
+
+    self.serving: asyncio.Task - coroutine serving requests, if serve(run=False)
+    self.listening: asyncio.Future - done once all endpoints are listening
+    self.listen_fds: list - of lists of file descriptors of listening sockets, one list per endpoint, for handoff
+    self.connections: set - of ConnectionFromClient and WebSocketConnection, to drain them
+    self.draining: None or asyncio.Future - done once drained, see drain()
+    self.query_cache: QueryCache - shared by all connections, with the schema being served, see swap_schema()
+    self.persisted_queries: PersistedQueries - shared by all connections
+    self.persisted_queries_only: bool - serve only persisted queries
+    self.executor: SharedAsyncioExecutor - or custom executor, shared by all requests
+    self.compression_min_size, .compression_level, .compression_thread_min_size - as defined in serve()
+    self.max_requests, .max_requests_per_connection, .write_buffer_limits - as defined in serve()
+    self.max_batch_size, .batch_concurrency, .data_loaders - as defined in serve()
+    self.response_cache, .get_cache_scope - as defined in serve()
+    self.response_cache_flights: dict - cache key: asyncio.Future of response being executed, for concurrent identical requests
+    self.metrics: None or Metrics - as defined in serve()
+    self.tracing: None or Tracing - as defined in serve()
+    self.max_depth, .max_nodes, .max_cost, .list_size - as defined in serve()
+    self.max_header_size, .max_body_size, .header_timeout, .body_timeout, .keep_alive_timeout - as defined in serve()
+    self.streaming_min_size, .streaming_chunk_size - as defined in serve()
+    self.offload_threads, .offload_processes - as defined in serve()
+    self.offload_pools: dict - pool name: ThreadPoolExecutor or ProcessPoolExecutor running resolvers marked by offload()
+    self.loop_monitor: None or LoopMonitor - as defined in serve()
+    self.requests_in_flight: int - number of requests in flight in this loop
+    self.requests_shed: int - number of requests rejected because of max_requests
+    self.date_header: bytes - "Date" header of responses, refreshed once per second
+    """
+
+    def update_date_header(self, loop):
+        """
+        Refresh self.date_header at the start of each second - cheaper than formatting it for each response.
+
+        @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+        """
+        now = time.time()
+        self.date_header = time.strftime('Date: %a, %d %b %Y %H:%M:%S GMT\r\n', time.gmtime(now)).encode()
+        self.date_header_timer = loop.call_later(1 - now % 1, self.update_date_header, loop)
+
+    def swap_schema(self, schema):
+        """
+        Serve new schema without restart: requests and subscriptions started after this call
+        are validated and executed against new schema, including those of existing connections,
+        while requests in flight finish with the old one.
+        Documents are parsed and validated anew, as validation depends on schema, other caches are kept,
+        so responses in response_cache expire by its ttl.
+
+        @param schema: graphene.Schema - new GraphQL schema
+        """
+        offload_resolvers(schema, asyncio.get_event_loop(), self.offload_pools, self.offload_threads, self.offload_processes)
+        self.subscription_schema = get_subscription_schema(schema)
+        self.query_cache = QueryCache(schema, self.query_cache.size)  # the last, as connections get schema from it
+
+    async def drain(self, timeout=30.0):
+        """
+        Graceful shutdown: stop accepting connections, close idle keep-alive ones, let requests in flight finish,
+        and requests of connections that were just accepted, then close their connections with "Connection: close" header of the last response,
+        and WebSocket connections with code 1001 "Going Away", so clients reconnect elsewhere.
+        Connections still open after timeout are aborted. Then servers are closed.
+
+        @param timeout: float - seconds to wait for requests in flight
+        """
+        if self.draining:
+            await asyncio.shield(self.draining)
+            return
+
+        loop = asyncio.get_event_loop()
+        self.draining = loop.create_future()
+        self.connections_closed = loop.create_future()
+
+        for server in self:
+            server.close()
+
+        for connection in list(self.connections):
+            connection.drain()
+
+        if self.connections:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.connections_closed), timeout)
+            except asyncio.TimeoutError:
+                for connection in list(self.connections):
+                    connection.transport.abort()
+
+        await self.close()
+        self.draining.set_result(None)
+
+    def forget_connection(self, connection):
+        """
+        Called by connection when it is closed or lost.
+
+        @param connection: ConnectionFromClient or WebSocketConnection
+        """
+        self.connections.discard(connection)
+        if self.draining and not self.connections and not self.connections_closed.done():
+            self.connections_closed.set_result(None)
+
+    async def close(self):
+        """
+        Сlose listening sockets - good for tests
+        """
+        self.date_header_timer.cancel()
+        if self.metrics:
+            self.metrics.sync_timer.cancel()
+        if self.loop_monitor:
+            self.loop_monitor.timer.cancel()
+        for executor in self.offload_pools.values():
+            executor.shutdown(wait=False)
+
+        for server in self:
+            server.close()
+
+        await asyncio.gather(*[server.wait_closed() for server in self])
+
+### SharedAsyncioExecutor
+
+class SharedAsyncioExecutor(AsyncioExecutor):
+    """
+    AsyncioExecutor that may be shared by all requests in the loop.
+
+    Original AsyncioExecutor keeps all futures to wait_until_finished(),
+    so it leaks memory when reused with graphql-core==2.0: https://github.com/graphql-python/graphql-core/pull/161
+    This executor keeps no futures, as execute(return_promise=True) is awaited instead.
+    """
+
+    def execute(self, fn, *args, **kwargs):
+        result = fn(*args, **kwargs)
+
+        if asyncio.iscoroutine(result):
+            return Promise.resolve(self.loop.create_task(result))
+
+        if isinstance(result, asyncio.Future):
+            return Promise.resolve(result)
+
+        return result
+
+### QueryCache
+
+class QueryCache(object):
+    """
+    LRU cache of parsed and validated GraphQL documents, tied to the schema.
+
+    Clients send the same few query shapes again and again,
+    so parse and validation are done once per query text, not once per request.
+    """
+
+    def __init__(self, schema, size):
+        """
+        @param schema: graphene.Schema - GraphQL schema to validate documents against
+        @param size: int - max number of documents to keep, 0 to disable the cache
+
+        self.hits: int - how many times the document was found in the cache
+        self.misses: int - how many times the document was parsed and validated
+        """
+        self.schema = schema
+        self.size = size
+        self.documents = OrderedDict()
+        self.analyses = {}  # query: {(analyzer, operation_name): result}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query):
+        """
+        Get parsed and validated GraphQL document.
+
+        @param query: str - GraphQL query text
+        @return document_ast, errors: graphql.language.ast.Document or None, list - errors are not empty if document is invalid
+        """
+        try:
+            document = self.documents[query]
+            self.documents.move_to_end(query)
+            self.hits += 1
+            return document
+
+        except KeyError:
+            pass
+
+        self.misses += 1
+        try:
+            document_ast = parse(query)
+            document = document_ast, validate(self.schema, document_ast)
+
+        except Exception as e:
+            document = None, [e]
+
+        if self.size:
+            self.documents[query] = document
+            if len(self.documents) > self.size:
+                evicted_query, _ = self.documents.popitem(last=False)
+                self.analyses.pop(evicted_query, None)
+
+        return document
+
+    def analyze(self, query, document_ast, analyzer, operation, *args):
+        """
+        Get result of static analysis of valid document, cached alongside it.
+
+        @param query: str - GraphQL query text
+        @param document_ast: graphql.language.ast.Document - as returned by get(query)
+        @param analyzer: callable(schema, document_ast, operation, *args): mixed - e.g. get_cache_control()
+        @param operation: graphql.language.ast.OperationDefinition - as returned by get_operation()
+        @param args: hashable - options of analyzer that are the same for all requests, e.g. list_size of get_complexity()
+        @return result: mixed - as returned by analyzer
+        """
+        key = (analyzer, operation.name and operation.name.value) + args
+        analyses = self.analyses.get(query)
+        if analyses is not None and key in analyses:
+            return analyses[key]
+
+        result = analyzer(self.schema, document_ast, operation, *args)
+
+        if query in self.documents:
+            if analyses is None:
+                analyses = self.analyses[query] = {}
+            analyses[key] = result
+
+        return result
+
+### PersistedQueries
+
+class PersistedQueries(object):
+    """
+    In-memory LRU store of Automatic Persisted Queries: sha256 hash of query text -> query text.
+
+    Custom store, e.g. shared by workers, should implement the same [async] get() and [async] set().
+    """
+
+    def __init__(self, size=1000, queries=None):
+        """
+        @param size: int or None - max number of queries to keep, None for no limit
+        @param queries: None or dict - sha256 hash of query text -> query text, to start with
+        """
+        self.size = size
+        self.queries = OrderedDict(queries or ())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load all queries from manifest built at deploy time.
+
+        @param path: str - path to JSON file with one of formats:
+            {sha256_hash: query, ...}
+            {"operations": [{"id": sha256_hash, "body": query, ...}, ...], ...} - apollo-persisted-query-manifest
+        @return persisted_queries: PersistedQueries - with no size limit
+        """
+        with open(path, 'rb') as f:
+            manifest = json.loads(f.read())
+
+        if 'operations' in manifest:
+            manifest = {operation['id']: operation['body'] for operation in manifest['operations']}
+
+        return cls(size=None, queries=manifest)
+
+    def get(self, sha256_hash):
+        """
+        @param sha256_hash: str - hex digest of query text
+        @return query: str or None - query text, if found
+        """
+        query = self.queries.get(sha256_hash)
+        if query is not None and self.size is not None:
+            self.queries.move_to_end(sha256_hash)
+        return query
+
+    def set(self, sha256_hash, query):
+        """
+        @param sha256_hash: str - hex digest of query text, already verified
+        @param query: str - query text
+        """
+        self.queries[sha256_hash] = query
+        if self.size is not None and len(self.queries) > self.size:
+            self.queries.popitem(last=False)
+
+### ResponseCache
+
+class ResponseCache(object):
+    """
+    In-memory LRU cache of serialized responses: cache key -> JSON bytes,
+    limited by total size in bytes, each response is fresh for ttl seconds.
+    Compressed content is kept next to each response, so cache hits are not compressed again.
+
+    Custom store, e.g. shared by workers, should implement the same [async] get() and [async] set(),
+    and may implement get_compressed() and set_compressed() too.
+    """
+
+    def __init__(self, ttl=1.0, max_size=64 * 1024 * 1024):
+        """
+        @param ttl: float - seconds to keep each response
+        @param max_size: int - max total size of responses in bytes
+
+        self.size: int - current total size of responses in bytes
+        self.hits: int - how many times fresh response was found in the cache
+        self.misses: int - how many times response was not found or expired
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.responses = OrderedDict()  # cache key: (expires_at, content)
+        self.compressed = {}  # content: [number of cache keys with this content, {content_encoding: compressed content}]
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        @param key: str - as returned by get_response_cache_key()
+        @return content: bytes or None - JSON of response, if found and fresh
+        """
+        item = self.responses.get(key)
+        if item is not None:
+            expires_at, content = item
+            if expires_at > time.monotonic():
+                self.responses.move_to_end(key)
+                self.hits += 1
+                return content
+
+            del self.responses[key]
+            self.forget(content)
+
+        self.misses += 1
+        return None
+
+    def set(self, key, content):
+        """
+        @param key: str - as returned by get_response_cache_key()
+        @param content: bytes - JSON of response
+        """
+        if len(content) > self.max_size:
+            return
+
+        item = self.responses.pop(key, None)
+        if item is not None:
+            self.forget(item[1])
+
+        self.responses[key] = time.monotonic() + self.ttl, content
+        self.compressed.setdefault(content, [0, {}])[0] += 1
+        self.size += len(content)
+        self.evict()
+
+    def get_compressed(self, content, content_encoding):
+        """
+        @param content: bytes - JSON of response, as returned by get()
+        @param content_encoding: bytes - one of CONTENT_ENCODINGS
+        @return compressed: bytes or None - as stored by set_compressed(), while content is in the cache
+        """
+        item = self.compressed.get(content)
+        return item[1].get(content_encoding) if item is not None else None
+
+    def set_compressed(self, content, content_encoding, compressed):
+        """
+        @param content: bytes - JSON of response, as returned by get()
+        @param content_encoding: bytes - one of CONTENT_ENCODINGS
+        @param compressed: bytes - content compressed with content_encoding, ignored if content is not in the cache anymore
+        """
+        item = self.compressed.get(content)
+        if item is None or content_encoding in item[1]:
+            return
+
+        item[1][content_encoding] = compressed
+        self.size += len(compressed)
+        self.evict()
+
+    def forget(self, content):
+        """
+        Account removal of content from self.responses, and remove its compressed content once no key has it.
+
+        @param content: bytes - JSON of response
+        """
+        self.size -= len(content)
+        item = self.compressed[content]
+        item[0] -= 1
+        if not item[0]:
+            del self.compressed[content]
+            self.size -= sum(len(compressed) for compressed in item[1].values())
+
+    def evict(self):
+        """
+        Remove the least recently used responses while total size is over max_size.
+        """
+        while self.size > self.max_size and self.responses:
+            _, (_, evicted) = self.responses.popitem(last=False)
+            self.forget(evicted)
+
+def get_response_cache_key(query, request, cache_scope):
+    """
+    @param query: str - GraphQL query text
+    @param request: dict - GraphQL request with "variables" and "operationName"
+    @param cache_scope: str - as returned by get_cache_scope() defined in serve()
+    @return key: str - sha256 hex digest, good for shared stores too
+    """
+    key = [cache_scope, query, request.get('variables') or None, request.get('operationName')]
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+### Metrics
+
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+BYTES_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = [
+    # name, type, help, labels of "kind" or buckets
+    ('connections_open', 'gauge', 'Open connections from clients', None),
+    ('requests_in_flight', 'gauge', 'Requests received in full and not responded yet', None),
+    ('errors_total', 'counter', 'Errors by kind', ('bad_request', 'graphql', 'internal', 'overloaded')),
+    ('parse_seconds', 'histogram', 'Time to parse JSON and get query text of request', SECONDS_BUCKETS),
+    ('get_context_seconds', 'histogram', 'Time of get_context()', SECONDS_BUCKETS),
+    ('execute_seconds', 'histogram', 'Time to execute GraphQL operations of request', SECONDS_BUCKETS),
+    ('serialize_seconds', 'histogram', 'Time to serialize response to JSON', SECONDS_BUCKETS),
+    ('loop_lag_seconds', 'histogram', 'Delay of LoopMonitor timer, time the loop was blocked', SECONDS_BUCKETS),
+    ('subscriptions_active', 'gauge', 'Subscriptions over WebSocket', None),
+    ('subscription_events_dropped_total', 'counter', 'Subscription events dropped or coalesced for slow clients', None),
+    ('request_size_bytes', 'histogram', 'Size of request content, count of requests received in full', BYTES_BUCKETS),
+    ('response_size_bytes', 'histogram', 'Size of response content before compression', BYTES_BUCKETS),
+]
+
+class Metrics(object):
+    """
+    Counters, gauges and histograms of the hot path, served in Prometheus text format:
+    https://prometheus.io/docs/instrumenting/exposition_formats/
+
+    Hot path only appends samples of histograms to plain lists, and updates plain list of values of this process.
+    Once per second samples are aggregated to buckets, and values are synced to the slot of this worker in shared memory,
+    so updates need no locks, and any worker can serve the sum of all slots.
+    """
+
+    def __init__(self, listen):
+        """
+        @param listen: list - one or more endpoints to serve metrics, as defined in serve(),
+            e.g. [dict(protocol='tcp', port=25101)] - not the same endpoints as for GraphQL requests
+
+        self.values: list - of float values of this process
+        self.samples: dict - name of histogram: list of values observed since the last sync
+        self.shared: RawArray or None - of float values of all workers, allocated by serve()
+        self.worker: int - index of worker process, from 0
+        """
+        self.listen = listen
+        self.shared = None
+        self.worker = 0
+
+        self.indexes = {}  # name or (name, kind): index of value
+        self.histograms = {}  # name: (index of first bucket, buckets, index of sum)
+        self.size = 0
+        for name, type, help, labels in METRICS:
+            if type == 'histogram':
+                self.indexes[name] = self.size
+                self.histograms[name] = self.size, labels, self.size + len(labels) + 1
+                self.size += len(labels) + 2  # buckets, +Inf, sum
+            elif labels:
+                for kind in labels:
+                    self.indexes[name, kind] = self.size
+                    self.size += 1
+            else:
+                self.indexes[name] = self.size
+                self.size += 1
+
+        self.values = [0.0] * self.size
+        self.samples = {name: [] for name in self.histograms}
+
+    def allocate(self, workers):
+        """
+        Allocate shared memory, before forking workers.
+
+        @param workers: int - number of worker processes
+        """
+        self.shared = RawArray('d', workers * self.size)
+
+    def start_syncing(self, loop, servers):
+        """
+        Sync self.values to shared memory once per second, until self.sync_timer is cancelled.
+
+        @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+        @param servers: Servers - to get gauges already counted there, without overhead for each request
+        """
+        self.servers = servers
+        self.sync()
+        self.sync_timer = loop.call_later(1, self.start_syncing, loop, servers)
+
+    def sync(self):
+        """
+        Aggregate samples and copy values to shared memory.
+        """
+        values = self.values
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+
+            samples.sort()
+            index, buckets, sum_index = self.histograms[name]
+            previous = 0
+            for bound in buckets:
+                position = bisect.bisect_right(samples, bound)  # number of samples <= bound
+                values[index] += position - previous
+                previous = position
+                index += 1
+            values[index] += len(samples) - previous  # +Inf
+            values[sum_index] += sum(samples)
+            samples.clear()
+
+        values[self.indexes['requests_in_flight']] = self.servers.requests_in_flight
+        start = self.worker * self.size
+        self.shared[start:start + self.size] = self.values
+
+    def inc(self, name, value=1):
+        """
+        Increment counter or gauge, decrement gauge with negative value.
+
+        @param name: str or tuple(str, str) - name of metric, or name and kind, e.g. ('errors_total', 'graphql')
+        @param value: float
+        """
+        self.values[self.indexes[name]] += value
+
+    def observe(self, name, value):
+        """
+        Add value to histogram.
+
+        @param name: str - name of histogram
+        @param value: float - seconds or bytes
+        """
+        self.samples[name].append(value)
+
+    def render(self):
+        """
+        @return content: bytes - values summed across workers, in Prometheus text format
+        """
+        self.sync()
+        shared = self.shared[:]
+        totals = [sum(shared[index::self.size]) for index in range(self.size)]
+        lines = []
+
+        for name, type, help, labels in METRICS:
+            full_name = 'aiographql_' + name
+            lines.append('# HELP {} {}'.format(full_name, help))
+            lines.append('# TYPE {} {}'.format(full_name, type))
+
+            if type == 'histogram':
+                index = self.indexes[name]
+                count = 0
+                for bound in labels + ('+Inf',):
+                    count += totals[index]
+                    lines.append('{}_bucket{{le="{}"}} {!r}'.format(full_name, bound, count))
+                    index += 1
+                lines.append('{}_sum {!r}'.format(full_name, totals[index]))
+                lines.append('{}_count {!r}'.format(full_name, count))
+
+            elif labels:
+                for kind in labels:
+                    lines.append('{}{{kind="{}"}} {!r}'.format(full_name, kind, totals[self.indexes[name, kind]]))
+
+            else:
+                lines.append('{} {!r}'.format(full_name, totals[self.indexes[name]]))
+
+        lines.append('')
+        return '\n'.join(lines).encode()
+
+class MetricsConnection(asyncio.Protocol):
+    """
+    Connection to metrics endpoint: any HTTP request gets metrics, then connection is closed.
+    """
+
+    def __init__(self, metrics):
+        """
+        @param metrics: Metrics
+        """
+        self.metrics = metrics
+        self.request = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, chunk):
+        self.request += chunk
+        if END_OF_HEADERS not in self.request:
+            if len(self.request) > 65536:
+                self.transport.close()  # not a request from Prometheus
+            return  # wait for the next chunk
+
+        content = self.metrics.render()
+        self.transport.write(METRICS_RESPONSE % len(content) + content)
+        self.transport.close()
+
+### Tracing
+
+class Tracing(object):
+    """
+    Opt-in per-resolver tracing of sampled requests and of requests asking for it with a header,
+    unsampled requests are executed without tracing middleware at all.
+
+    Response to request with the header gets Apollo tracing extension:
+    https://github.com/apollographql/apollo-tracing#response-format
+    Sampled requests slower than slow_query_seconds are reported to exception handler, if it is set, or to "aiographql" logger.
+    """
+
+    def __init__(self, header='X-Tracing', sample_rate=0.01, slow_query_seconds=1.0, top_fields=5):
+        """
+        @param header: str - request header asking for tracing extension in response, e.g. "X-Tracing: 1"
+        @param sample_rate: float - from 0 to 1, part of other requests to trace for slow query log
+        @param slow_query_seconds: float - report traced requests executed this long or longer
+        @param top_fields: int - number of slowest fields to report
+        """
+        self.header_re = re.compile(br'\r\n' + re.escape(header.encode()) + br':', re.IGNORECASE)
+        self.sample_rate = sample_rate
+        self.slow_query_seconds = slow_query_seconds
+        self.top_fields = top_fields
+
+    def create_tracer(self, headers):
+        """
+        @param headers: bytes - HTTP headers
+        @return tracer: Tracer or None - if request is not sampled and does not ask for tracing
+        """
+        is_requested = self.header_re.search(headers) is not None
+        if is_requested or random.random() < self.sample_rate:
+            return Tracer(is_requested)
+        return None
+
+class Tracer(object):
+    """
+    Tracing middleware of one GraphQL request, times each resolver, sync or async.
+    """
+
+    def __init__(self, is_requested):
+        """
+        @param is_requested: bool - if True, response gets tracing extension
+
+        self.resolvers: list - of (path, parent_type, field_name, return_type, started_at, finished_at)
+        self.operation: graphql.language.ast.OperationDefinition or None - executed operation, once any resolver is called
+        """
+        self.is_requested = is_requested
+        self.resolvers = []
+        self.operation = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.started_at = time.perf_counter()
+
+    def finish(self):
+        self.end_time = time.time()
+        self.duration = time.perf_counter() - self.started_at
+
+    def resolve(self, next, root, info, **args):
+        """
+        Middleware as defined in graphql-core.
+        """
+        started_at = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+
+        except Exception:
+            self.add(info, started_at)
+            raise
+
+        if hasattr(result, '__await__'):
+            return self.resolve_async(result, info, started_at)
+
+        self.add(info, started_at)
+        return result
+
+    async def resolve_async(self, result, info, started_at):
+        try:
+            return await result
+        finally:
+            self.add(info, started_at)
+
+    def add(self, info, started_at):
+        self.operation = info.operation
+        self.resolvers.append((info.path, info.parent_type, info.field_name, info.return_type, started_at, time.perf_counter()))
+
+    def get_tracing(self):
+        """
+        @return tracing: dict - Apollo tracing extension
+        """
+        return {
+            'version': 1,
+            'startTime': format_iso_time(self.start_time),
+            'endTime': format_iso_time(self.end_time),
+            'duration': int(self.duration * 1e9),
+            'execution': {
+                'resolvers': [
+                    {
+                        'path': list(path),
+                        'parentType': str(parent_type),
+                        'fieldName': field_name,
+                        'returnType': str(return_type),
+                        'startOffset': int((started_at - self.started_at) * 1e9),
+                        'duration': int((finished_at - started_at) * 1e9),
+                    }
+                    for path, parent_type, field_name, return_type, started_at, finished_at in self.resolvers
+                ],
+            },
+        }
+
+    def get_top_fields(self, count):
+        """
+        @param count: int - number of slowest fields
+        @return top_fields: list - of (path: str, seconds: float), slowest first
+        """
+        resolvers = sorted(self.resolvers, key=lambda resolver: resolver[4] - resolver[5])[:count]
+        return [
+            ('.'.join(str(key) for key in path), finished_at - started_at)
+            for path, parent_type, field_name, return_type, started_at, finished_at in resolvers
+        ]
+
+def format_iso_time(timestamp):
+    """
+    @param timestamp: float - as returned by time.time()
+    @return iso_time: str - e.g. "2018-03-01T12:34:56.789Z"
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + '.{:03d}Z'.format(int(timestamp % 1 * 1000))
+
+### LoopMonitor
+
+class LoopMonitor(object):
+    """
+    Timer expected to fire each interval measures how late it fires, that is how long the loop was blocked,
+    delaying all connections served by it. Lag is observed by "loop_lag_seconds" metric, if metrics are enabled.
+
+    Lag of lag_seconds or longer is reported, and so are sync resolvers of sampled requests running resolver_seconds or longer,
+    candidates for @aiographql.offload(), to exception handler, if it is set, or to "aiographql" logger.
+    """
+
+    def __init__(self, interval=0.1, lag_seconds=0.1, resolver_seconds=0.01, sample_rate=0.01):
+        """
+        @param interval: float - seconds between checks of lag
+        @param lag_seconds: float - report lag this long or longer
+        @param resolver_seconds: float - report sync resolvers running this long or longer
+        @param sample_rate: float - from 0 to 1, part of requests to time sync resolvers of, as each timing has overhead
+        """
+        self.interval = interval
+        self.lag_seconds = lag_seconds
+        self.resolver_seconds = resolver_seconds
+        self.sample_rate = sample_rate
+
+    def start(self, loop, servers):
+        """
+        Check lag each interval, until self.timer is cancelled.
+
+        @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+        @param servers: Servers - with metrics
+        """
+        self.loop = loop
+        self.metrics = servers.metrics
+        self.expected_at = loop.time() + self.interval
+        self.timer = loop.call_at(self.expected_at, self.check)
+
+    def check(self):
+        lag = self.loop.time() - self.expected_at
+        if self.metrics:
+            self.metrics.observe('loop_lag_seconds', lag)
+        if lag >= self.lag_seconds:
+            self.report('Loop was blocked for {:.3f}s'.format(lag), loop_lag=lag)
+
+        self.expected_at = self.loop.time() + self.interval
+        self.timer = self.loop.call_at(self.expected_at, self.check)
+
+    def resolve(self, next, root, info, **args):
+        """
+        Middleware as defined in graphql-core, times sync resolvers only, as async ones do not block the loop.
+        """
+        started_at = time.perf_counter()
+        result = next(root, info, **args)
+        seconds = time.perf_counter() - started_at
+
+        if seconds >= self.resolver_seconds and not hasattr(result, '__await__'):
+            field = '{}.{}'.format(info.parent_type.name, info.field_name)
+            self.report('Sync resolver of {} blocked the loop for {:.3f}s, consider @aiographql.offload()'.format(field, seconds),
+                blocking_resolver=dict(field=field, path=info.path, seconds=seconds))
+
+        return result
+
+    def report(self, message, **details):
+        """
+        @param message: str - human readable
+        @param details: dict - extra keys of context passed to exception handler
+        """
+        if self.loop.get_exception_handler():
+            self.loop.call_exception_handler(dict(details, message=message))
+        else:
+            logger.warning(message)
+
+### DataLoader
+
+class DataLoader(object):
+    """
+    Coalesces load(key) calls made by resolvers in the same loop iteration into one batch_load(keys) call,
+    e.g. to avoid "N+1" DB queries for "friends" of each "user",
+    and optionally caches the values for the rest of the request.
+    """
+
+    def __init__(self, batch_load, loop=None, cache=True, max_batch_size=None):
+        """
+        @param batch_load: [async] callable(keys: list): list - values or Exception-s, in order of keys
+        @param loop: None or uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+        @param cache: bool - if True, each key is loaded once per DataLoader
+        @param max_batch_size: None or int - max number of keys passed to batch_load() at once
+        """
+        self.batch_load = batch_load
+        self.loop = loop or asyncio.get_event_loop()
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.futures = {}  # key: future, if cache
+        self.queue = []  # (key, future) to load in the next batch
+
+    def load(self, key):
+        """
+        Load value by key, good to be returned by resolver.
+
+        @param key: hashable
+        @return future: asyncio.Future - with value
+        """
+        if self.cache:
+            future = self.futures.get(key)
+            if future is not None:
+                return future
+
+        future = self.loop.create_future()
+        if self.cache:
+            self.futures[key] = future
+
+        if not self.queue:
+            self.loop.call_soon(self.dispatch)
+        self.queue.append((key, future))
+
+        return future
+
+    def load_many(self, keys):
+        """
+        @param keys: list
+        @return future: asyncio.Future - with list of values, in order of keys
+        """
+        return asyncio.gather(*[self.load(key) for key in keys])
+
+    def prime(self, key, value):
+        """
+        Cache value already loaded some other way, unless this key is already cached.
+        """
+        if self.cache and key not in self.futures:
+            future = self.loop.create_future()
+            future.set_result(value)
+            self.futures[key] = future
+
+    def clear(self, key):
+        """
+        Forget cached value, e.g. after mutation.
+        """
+        self.futures.pop(key, None)
+
+    def clear_all(self):
+        """
+        Forget all cached values, e.g. before the next event of subscription.
+        """
+        self.futures.clear()
+
+    def dispatch(self):
+        """
+        Called once per loop iteration with load() calls, to start loading all keys queued so far.
+        """
+        queue, self.queue = self.queue, []
+        size = self.max_batch_size or len(queue)
+        for index in range(0, len(queue), size):
+            self.loop.create_task(self.load_batch(queue[index:index + size]))
+
+    async def load_batch(self, queue):
+        """
+        @param queue: list - of (key, future) to load with one batch_load() call
+        """
+        keys = [key for key, future in queue]
+        try:
+            values = self.batch_load(keys)
+            if hasattr(values, '__await__'):
+                values = await values
+
+            values = list(values)
+            assert len(values) == len(keys), 'batch_load() returned {} values for {} keys'.format(len(values), len(keys))
+
+        except Exception as e:
+            values = [e] * len(keys)
+
+        for (key, future), value in zip(queue, values):
+            if future.done():
+                continue
+
+            if isinstance(value, Exception):
+                future.set_exception(value)
+                self.clear(key)  # to retry on the next load()
+            else:
+                future.set_result(value)
+
+def create_data_loaders(options, loop):
+    """
+    Create new DataLoader-s for each request, so cached values are not shared by requests.
+
+    @param options: dict - data_loaders as defined in serve()
+    @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+    @return data_loaders: dict(name=DataLoader, ...)
+    """
+    data_loaders = {}
+    for name, kwargs in options.items():
+        if callable(kwargs):
+            kwargs = dict(batch_load=kwargs)
+        data_loaders[name] = DataLoader(loop=loop, **kwargs)
+    return data_loaders
+
+### PubSub
+
+class Topic(object):
+    """
+    Returned by resolver of subscription field to receive events published to PubSub with this topic.
+    """
+
+    def __init__(self, name):
+        """
+        @param name: hashable - e.g. "price:AAPL"
+        """
+        self.name = name
+
+class PubSub(object):
+    """
+    Broker of subscription events in this process.
+
+    Subscribers to the same topic with the same operation, variables and scope are grouped,
+    so each event is executed and serialized once per group, not once per subscriber.
+    With workers, each worker has its own subscribers, so events should be published in each worker,
+    e.g. from a listener of Redis channel started by each worker.
+    """
+
+    def __init__(self):
+        self.groups = {}  # topic name: {group key: SubscriptionGroup}
+
+    def publish(self, topic, event):
+        """
+        @param topic: hashable - name of Topic
+        @param event: mixed - value of subscription field, to resolve the rest of selection set from
+        """
+        groups = self.groups.get(topic)
+        if groups:
+            for group in list(groups.values()):
+                group.push(event)
+
+    def join(self, topic, key, create_group):
+        """
+        @param topic: hashable - name of Topic
+        @param key: tuple - of operation, variables and scope
+        @param create_group: callable(): SubscriptionGroup - called if there is no such group yet
+        @return group: SubscriptionGroup
+        """
+        groups = self.groups.setdefault(topic, {})
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = create_group()
+        return group
+
+    def leave(self, group):
+        """
+        Forget group without subscribers.
+
+        @param group: SubscriptionGroup
+        """
+        groups = self.groups.get(group.topic)
+        if groups and groups.get(group.key) is group:
+            del groups[group.key]
+            if not groups:
+                del self.groups[group.topic]
+
+class SubscriptionGroup(object):
+    """
+    Subscribers sharing execution and serialization of events, see PubSub.
+    """
+
+    def __init__(self, pubsub, topic, key, servers, schema, document_ast, request, context, data_loaders):
+        """
+        @param pubsub: PubSub
+        @param topic, key: as defined in PubSub.join()
+        @param servers: Servers - with executor, etc
+        @param schema: GraphQLSchema - subscription_schema the document is valid for
+        @param document_ast: graphql.language.ast.Document - as returned by get_event_document()
+        @param request: dict - GraphQL request of the first subscriber
+        @param context: mixed - GraphQL context of the first subscriber, shared by the group as they have the same scope
+        @param data_loaders: dict or None - DataLoader-s in the context, their cache is cleared before each event
+
+        self.subscribers: dict - (WebSocketConnection, subscription id): prefix of "next" message for this subscriber
+        self.events: deque - events waiting to be executed in order
+        """
+        self.pubsub = pubsub
+        self.topic = topic
+        self.key = key
+        self.servers = servers
+        self.schema = schema
+        self.document_ast = document_ast
+        self.request = request
+        self.context = context
+        self.data_loaders = data_loaders
+        self.subscribers = {}
+        self.events = deque(maxlen=servers.subscription_queue_size)
+        self.task = None
+
+    def push(self, event):
+        """
+        @param event: mixed - as defined in PubSub.publish()
+        """
+        self.events.append(event)  # the oldest event is dropped if queue is full
+        if self.task is None:
+            self.task = asyncio.get_event_loop().create_task(self.deliver())
+
+    async def deliver(self):
+        """
+        Execute and serialize each event once, then send it to all subscribers.
+        """
+        try:
+            while self.events:
+                payload, errors = await execute_event(self.servers, self.schema, self.document_ast, self.request, self.context,
+                    self.data_loaders, self.events.popleft())
+
+                for (connection, id), prefix in list(self.subscribers.items()):
+                    connection.send_parts([prefix, payload, b'}'], id)
+
+                report_event_errors(self.servers, errors, self.request)
+        finally:
+            self.task = None
+
+    def remove(self, connection, id):
+        """
+        @param connection: WebSocketConnection
+        @param id: str - subscription id
+        """
+        self.subscribers.pop((connection, id), None)
+        if not self.subscribers:
+            self.pubsub.leave(self)
+            if self.task:
+                self.task.cancel()
+
+def get_event_document(schema, document_ast, operation):
+    """
+    Convert subscription operation to query operation of subscription_schema created by serve(),
+    so each event can be executed as a query.
+
+    @param schema: graphene.Schema
+    @param document_ast: graphql.language.ast.Document - valid document
+    @param operation: graphql.language.ast.OperationDefinition - subscription operation
+    @return document_ast, field_ast: graphql.language.ast.Document, graphql.language.ast.Field -
+        or None, None if operation selects other than one top level field
+    """
+    selections = operation.selection_set.selections
+    if len(selections) != 1 or not isinstance(selections[0], ast.Field):
+        return None, None
+
+    return ast.Document(definitions=[
+        ast.OperationDefinition(
+            operation='query',
+            name=operation.name,
+            variable_definitions=operation.variable_definitions,
+            directives=operation.directives,
+            selection_set=operation.selection_set,
+        ),
+    ] + [
+        definition for definition in document_ast.definitions
+        if isinstance(definition, ast.FragmentDefinition)
+    ]), selections[0]
+
+async def execute_event(servers, schema, document_ast, request, context, data_loaders, event):
+    """
+    Execute event document with event as the value of subscription field.
+
+    @param servers: Servers - with executor
+    @param schema: GraphQLSchema - subscription_schema created by serve() or Servers.swap_schema()
+    @param document_ast: graphql.language.ast.Document - as returned by get_event_document()
+    @param request: dict - GraphQL request
+    @param context: mixed - GraphQL context
+    @param data_loaders: dict or None - DataLoader-s in the context, to clear their cache
+    @param event: mixed - as defined in PubSub.publish()
+    @return payload, errors: bytes, list - serialized GraphQL response, GraphQL errors to process at server side too
+    """
+    if data_loaders:
+        for data_loader in data_loaders.values():
+            data_loader.clear_all()
+
+    def resolve_event(next, root, info, **args):
+        return event if len(info.path) == 1 else next(root, info, **args)
+
+    try:
+        result = await execute(
+            schema,
+            document_ast,
+            context_value=context,
+            variable_values=request.get('variables'),
+            operation_name=request.get('operationName'),
+            executor=servers.executor,
+            return_promise=True,
+            middleware=MiddlewareManager(resolve_event, wrap_in_promise=False),
+        )
+    except Exception as e:
+        result = ExecutionResult(errors=[e], invalid=True)
+
+    return serialize_result(result, servers.json_codec)
+
+def serialize_result(result, json_codec):
+    """
+    @param result: graphql.execution.ExecutionResult
+    @param json_codec: JsonCodec, UjsonCodec, OrjsonCodec, etc
+    @return payload, errors: bytes, list - serialized GraphQL response, GraphQL errors to process at server side too
+    """
+    response = {}
+    if not result.invalid:
+        response['data'] = result.data
+    if result.errors:
+        response['errors'] = [format_error(error) for error in result.errors]
+
+    return json_codec.dumps(response), result.errors or []
+
+def report_event_errors(servers, errors, request):
+    """
+    Process GraphQL errors of subscription event at server side too.
+
+    @param servers: Servers - with metrics
+    @param errors: list - GraphQL errors
+    @param request: dict - GraphQL request
+    """
+    if errors and servers.metrics:
+        servers.metrics.inc(('errors_total', 'graphql'), len(errors))
+
+    loop = asyncio.get_event_loop()
+    for error in errors:
+        loop.call_exception_handler(dict(
+            message=error.message,
+            exception=getattr(error, 'original_error', error),
+            request=request,
+        ))
+
+### ConnectionFromClient
+
+class ConnectionFromClient(asyncio.Protocol):
+    """
+    Each connection from client is represented with a separate instance of this class.
+    """
+
+    def __init__(self, get_context, loop, servers):
+        """
+        @param get_context: None or [async] callable(loop, context: dict): mixed - to produce GraphQL context like auth as defined in serve()
+        @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+        @param servers: Servers - with query_cache, executor and other state shared by all connections,
+            query_cache with schema is got for each request, as it may be swapped
+        """
+        self.get_context = get_context
+        self.loop = loop
+        self.persisted_queries = servers.persisted_queries
+        self.persisted_queries_only = servers.persisted_queries_only
+        self.executor = servers.executor
+        self.compression_min_size = servers.compression_min_size
+        self.compression_level = servers.compression_level
+        self.compression_thread_min_size = servers.compression_thread_min_size
+        self.max_requests = servers.max_requests
+        self.max_requests_per_connection = servers.max_requests_per_connection
+        self.write_buffer_limits = servers.write_buffer_limits
+        self.max_batch_size = servers.max_batch_size
+        self.batch_concurrency = servers.batch_concurrency
+        self.data_loaders = servers.data_loaders
+        self.response_cache = servers.response_cache
+        self.get_cache_scope = servers.get_cache_scope
+        self.metrics = servers.metrics
+        self.tracing = servers.tracing
+        self.loop_monitor = servers.loop_monitor
+        self.max_depth = servers.max_depth
+        self.max_nodes = servers.max_nodes
+        self.max_cost = servers.max_cost
+        self.list_size = servers.list_size
+        self.max_header_size = servers.max_header_size
+        self.max_body_size = servers.max_body_size
+        self.header_timeout = servers.header_timeout
+        self.body_timeout = servers.body_timeout
+        self.keep_alive_timeout = servers.keep_alive_timeout
+        self.streaming_min_size = servers.streaming_min_size
+        self.streaming_chunk_size = servers.streaming_chunk_size
+        self.http_parser_factory = servers.http_parser_factory or HttpParser
+        self.json_codec = servers.json_codec
+        self.has_complexity_limits = servers.max_depth is not None or servers.max_nodes is not None or servers.max_cost is not None
+        self.servers = servers  # to count requests in flight, to share response_cache_flights
+
+    ### connection_made
+
+    def connection_made(self, transport):
+        """
+        Called by asyncio when connection from client is made.
+
+        @param transport: uvloop.loop.TCPTransport or UnixTransport or some other transport if you opted out of enable_uvloop=True,
+            but it should implement (may not inherit) asyncio.BaseTransport,ReadTransport,WriteTransport:
+            https://docs.python.org/3/library/asyncio-protocol.html#transports
+        """
+        self.transport = transport
+        self.responses = deque()
+        self.is_reading_paused = False
+        self.is_writing_paused = False
+        self.writing_resumed = None
+        self.is_closing = False
+        self.phase = None
+        self.deadline = None
+        self.timer = None
+        self.parser = self.http_parser_factory(self, self.max_header_size, self.max_body_size)
+        self.reading = None
+        self.headers = None
+        self.content = []
+        self.keep_alive = True
+        self.is_fresh = True  # no request is received yet
+        self.update_deadline()
+        self.servers.connections.add(self)
+
+        if self.write_buffer_limits:
+            transport.set_write_buffer_limits(**self.write_buffer_limits)
+
+        if self.metrics:
+            self.metrics.inc('connections_open')
+
+    ### connection_lost
+
+    def connection_lost(self, exc):
+        """
+        Called by asyncio when connection is closed or lost.
+
+        @param exc: Exception or None
+        """
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+        if self.writing_resumed:  # streaming response should stop
+            self.writing_resumed.set_result(None)
+            self.writing_resumed = None
+        self.send_ready_responses()  # clears the queue, so streaming responses waiting for their turn stop too
+        self.servers.forget_connection(self)
+
+        if self.metrics:
+            self.metrics.inc('connections_open', -1)
+
+    ### drain
+
+    def drain(self):
+        """
+        Called by Servers.drain(): close idle connection, or let requests already received or being received finish,
+        and close connection after the last response, that gets "Connection: close" header.
+        """
+        if self.reading:
+            self.keep_alive = False  # see on_message_complete()
+
+        elif self.responses:
+            self.is_closing = True
+            self.update_reading()
+
+        elif self.is_fresh:  # client has just connected, so its request is on the way, see on_headers_complete()
+            deadline = self.loop.time() + self.header_timeout
+            if self.deadline is None or deadline < self.deadline:
+                self.deadline = deadline
+                if self.timer:
+                    self.timer.cancel()
+                self.timer = self.loop.call_at(deadline, self.on_timeout)
+
+        else:
+            self.transport.close()
+
+    ### pause_writing
+
+    def pause_writing(self):
+        """
+        Called by asyncio when write buffer reaches its "high" limit, e.g. when client reads slowly.
+        Responses wait in self.responses queue, and no new requests are read.
+        """
+        self.is_writing_paused = True
+        self.update_reading()
+
+    ### resume_writing
+
+    def resume_writing(self):
+        """
+        Called by asyncio when write buffer drains to its "low" limit.
+        """
+        self.is_writing_paused = False
+        if self.writing_resumed:
+            self.writing_resumed.set_result(None)
+            self.writing_resumed = None
+
+        self.send_ready_responses()
+        self.update_reading()  # even if no responses are ready yet
+
+    ### update_reading
+
+    def update_reading(self):
+        """
+        Pause reading from connection while writing is paused or too many requests are in flight,
+        or connection is closing after protocol error, resume otherwise.
+        """
+        is_reading_paused = self.is_closing or self.is_writing_paused or len(self.responses) >= self.max_requests_per_connection
+        if is_reading_paused == self.is_reading_paused or self.transport.is_closing():
+            return
+
+        self.is_reading_paused = is_reading_paused
+        if is_reading_paused:
+            self.transport.pause_reading()
+        else:
+            self.transport.resume_reading()
+
+    ### data_received
+
+    def data_received(self, chunk):
+        """
+        Called by asyncio when new chunk of data is received.
+
+        This function is NOT async,
+        and it is good both for correct order of chunks
+        and for performance: no need to create_task() each time.
+
+        Chunk is fed to HTTP parser that calls back on_message_begin(), on_headers_complete(), on_body() and on_message_complete(),
+        then each GraphQL request received in full is processed in async mode - to be able to await DB, etc.
+
+        Pipelined requests may follow in the same chunk:
+        they are processed concurrently, but responses are sent in order of requests.
+
+        Each phase of request has its own deadline, see update_deadline().
+
+        @param chunk: bytes
+        """
+        if self.is_closing:
+            return  # after protocol error or "Connection: close" the rest of data can not be trusted
+
+        try:
+            upgrade_start = self.parser.feed_data(chunk)
+
+        except ValueError as e:
+            message, request = e.args
+            self.send_protocol_error(message, request)
+            return
+
+        if upgrade_start is not None:
+            self.upgrade_websocket(self.headers, chunk[upgrade_start:])
+            return
+
+        self.update_deadline()
+
+    ### on_message_begin
+
+    def on_message_begin(self):
+        """
+        Called by HTTP parser when the first byte of new request is received.
+        """
+        self.reading = 'headers'
+        self.is_fresh = False
+        self.headers = None
+
+    ### on_headers_complete
+
+    def on_headers_complete(self):
+        """
+        Called by HTTP parser when request headers are received in full.
+
+        @return is_upgrading: bool - True to stop parsing and upgrade connection to WebSocket
+        @raise ValueError(message: str, request: bytes) - to send protocol error
+        """
+        if self.is_closing:
+            return False  # httptools parses the whole chunk, even pipelined requests after "Connection: close"
+
+        parser = self.parser
+        headers = self.headers = parser.headers
+        self.reading = 'body'
+
+        match = CONNECTION_RE.search(headers)
+        connection = match.group(1).lower() if match else b''
+        self.keep_alive = b'close' not in connection and (parser.http_version != '1.0' or b'keep-alive' in connection)
+        if self.servers.draining:
+            self.keep_alive = False
+
+        is_get = headers.startswith(b'GET ')
+        is_upgrade = is_get and b'upgrade' in connection and self.servers.subscription_schema and not self.servers.draining
+        if is_upgrade and UPGRADE_WEBSOCKET_RE.search(headers):
+            return True
+
+        if parser.content_length is None and not parser.is_chunked:
+            if not is_get:
+                raise ValueError('"Content-Length" header is not found', headers)
+
+        elif EXPECT_CONTINUE_RE.search(headers):
+            self.responses.append([(HTTP_CONTINUE,)])  # in order after responses to pipelined requests
+            self.send_ready_responses()
+
+        return False
+
+    ### on_body
+
+    def on_body(self, data):
+        """
+        Called by HTTP parser with each part of request content.
+
+        @param data: bytes or memoryview - memoryview of received chunk to avoid copying, until content is received in full
+        """
+        self.content.append(data)
+
+    ### on_message_complete
+
+    def on_message_complete(self):
+        """
+        Called by HTTP parser when request is received in full.
+        """
+        if self.is_closing:
+            return
+
+        content = b''.join(self.content)  # no copy if content was received in one part
+        self.content = []
+        self.reading = None
+
+        if not self.keep_alive:
+            self.is_closing = True  # the last response gets "Connection: close", and then connection is closed
+
+        metrics = self.metrics
+        if metrics:
+            metrics.observe('request_size_bytes', len(content))
+
+        if self.servers.requests_in_flight >= self.max_requests:
+            self.servers.requests_shed += 1
+            if metrics:
+                metrics.inc(('errors_total', 'overloaded'))
+            self.send_response({'errors': [{'message': 'Server is overloaded, please retry later'}]})
+
+        else:
+            response_slot = [None]
+            self.responses.append(response_slot)
+            self.servers.requests_in_flight += 1
+
+            self.loop.create_task(self.process_request(self.headers, content, response_slot, self.keep_alive))
+            # loop.create_task() is a bit faster than asyncio.ensure_future() when starting coroutines.
+
+        self.update_reading()
+
+    ### send_protocol_error
+
+    def send_protocol_error(self, message, request=None):
+        """
+        Report error found before request is received in full, e.g. too large or too slow request,
+        send error response, and close connection once all responses are sent.
+
+        @param message: str - error message
+        @param request: bytes or None - start of HTTP request, for exception handler
+        """
+        self.loop.call_exception_handler(dict(
+            message=message,
+            protocol=self,
+            transport=self.transport,
+            request=request,
+        ))
+        if self.metrics:
+            self.metrics.inc(('errors_total', 'bad_request'))
+
+        self.is_closing = True
+        self.reading = None
+        self.content = []
+        self.update_reading()
+        self.send_response({'errors': [{'message': message}]})
+
+    ### upgrade_websocket
+
+    def upgrade_websocket(self, headers, data):
+        """
+        Switch this connection to WebSocketConnection protocol for subscriptions.
+
+        @param headers: bytes - HTTP headers of upgrade request
+        @param data: bytes - received after the headers, e.g. "connection_init" message
+        """
+        key = WEBSOCKET_KEY_RE.search(headers)
+        match = WEBSOCKET_PROTOCOL_RE.search(headers)
+        requested = [protocol.strip() for protocol in match.group(1).split(b',')] if match else []
+        protocol = next((protocol for protocol in WEBSOCKET_PROTOCOLS if protocol in requested), None)
+
+        if not key or not protocol or self.responses:
+            self.send_protocol_error('WebSocket upgrade request is not valid', headers)
+            return
+
+        accept = base64.b64encode(hashlib.sha1(key.group(1) + WEBSOCKET_GUID).digest())
+        self.transport.write(HTTP_SWITCHING_PROTOCOLS % (accept, protocol))
+
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+        if self.is_reading_paused:
+            self.is_reading_paused = False
+            self.transport.resume_reading()
+
+        self.servers.forget_connection(self)
+        connection = WebSocketConnection(self.get_context, self.loop, self.servers,
+            self.transport, protocol, headers, self.is_writing_paused)
+        self.transport.set_protocol(connection)  # connections_open is decremented by the new protocol
+        if data:
+            connection.data_received(data)
+
+    ### update_deadline
+
+    def update_deadline(self):
+        """
+        Set deadline of the current phase of connection, when the phase changes:
+        waiting for headers, for body, for responses to be processed and sent, or for the next request on idle connection.
+
+        Deadline is not extended by each chunk, so slow clients can not hold connection by trickling bytes.
+        Single timer per connection is not rescheduled when deadline moves later - on_timeout() checks it.
+        """
+        if self.reading == 'body':
+            phase, timeout = 'body', self.body_timeout
+        elif self.reading == 'headers':
+            phase, timeout = 'headers', self.header_timeout
+        elif self.responses or self.is_closing:
+            phase, timeout = 'processing', None
+        else:
+            phase, timeout = 'idle', self.keep_alive_timeout
+
+        if phase == self.phase:
+            return
+
+        self.phase = phase
+        if timeout is None:
+            self.deadline = None
+            return
+
+        self.deadline = self.loop.time() + timeout
+        if self.timer is None or self.timer.when() > self.deadline:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = self.loop.call_at(self.deadline, self.on_timeout)
+
+    ### on_timeout
+
+    def on_timeout(self):
+        """
+        Called by timer: close idle connection silently, or send error to client that is too slow to send its request.
+        """
+        self.timer = None
+        if self.deadline is None or self.transport.is_closing():
+            return
+
+        if self.loop.time() < self.deadline:
+            self.timer = self.loop.call_at(self.deadline, self.on_timeout)
+            return
+
+        if self.phase == 'idle':
+            self.transport.close()
+        else:
+            self.send_protocol_error('Timeout of request {}'.format(self.phase), self.headers)
+            self.update_deadline()
+
+    ### process_request
+
+    async def process_request(self, headers, request, response_slot, keep_alive=True):
+        """
+        Execute GraphQL request in async mode and send response back to client.
+
+        Resolvers that need to await DB, etc - should be async too.
+        Other resolvers should NOT be async.
+        Sync resolvers that block or compute for long - should be decorated with @aiographql.offload().
+
+        @param headers: bytes or None - HTTP headers
+        @param request: bytes - content of GraphQL request, or of batch of GraphQL requests as JSON array,
+            or empty for GET request with GraphQL request in query string
+        @param response_slot: list - placeholder for response in self.responses queue, as defined in send_response()
+        @param keep_alive: bool - False if connection is closed after this request, as requested by client
+        """
+        json_error_message = None
+        is_response_sent = False
+        metrics = self.metrics
+        if metrics:
+            started_at = time.perf_counter()
+        try:
+
+            ### parse json
+
+            try:
+                is_get = headers.startswith(b'GET ')
+                request = get_request_from_query_string(headers, self.json_codec) if is_get else self.json_codec.loads(request)
+
+                is_batch = isinstance(request, list)
+                operations = request if is_batch else [request]
+                assert not is_batch or 0 < len(request) <= self.max_batch_size, 'batch size should be from 1 to {}'.format(self.max_batch_size)
+
+                for operation in operations:
+                    assert isinstance(operation, dict) and ('query' in operation or 'extensions' in operation), '"query" key not found'
+
+            except Exception as e:
+                json_error_message = 'JSON: {}'.format(e)
+                raise
+
+            ### get queries
+
+            queries = []
+            for operation in operations:
+                queries.append(await self.get_query(operation))
+
+            if metrics:
+                parsed_at = time.perf_counter()
+                metrics.observe('parse_seconds', parsed_at - started_at)
+
+            ### get context
+
+            data_loaders = create_data_loaders(self.data_loaders, self.loop) if self.data_loaders else None
+
+            if self.get_context and any(error is None for query, error in queries):
+                method, path, http_headers = parse_request_head(headers)
+                context = self.get_context(self.loop, dict(
+                    message=None,  # this field is required by format shared with exception_handler()
+                    protocol=self,
+                    transport=self.transport,
+                    headers=headers,
+                    request=request,
+                    data_loaders=data_loaders,
+                    method=method,
+                    path=path,
+                    http_headers=http_headers,
+                    keep_alive=keep_alive,
+                ))
+                if hasattr(context, '__await__'):
+                    context = await context
+
+            elif data_loaders:
+                context = dict(data_loaders=data_loaders)
+
+            else:
+                context = None
+
+            if metrics:
+                context_got_at = time.perf_counter()
+                metrics.observe('get_context_seconds', context_got_at - parsed_at)
+
+            ### get cache scope
+
+            cache_scope = None
+            if self.response_cache is not None:
+                cache_scope = self.get_cache_scope(context) if self.get_cache_scope else ''
+                if hasattr(cache_scope, '__await__'):
+                    cache_scope = await cache_scope
+
+            ### execute GraphQL
+
+            query_cache = self.servers.query_cache  # the same schema for the whole request, even if swapped meanwhile
+
+            if is_batch:
+                semaphore = asyncio.Semaphore(self.batch_concurrency)
+                results = await asyncio.gather(*[
+                    self.execute_operation(operation, query, error, context, query_cache, semaphore, cache_scope=cache_scope,
+                        tracer=self.tracing and self.tracing.create_tracer(headers))
+                    for operation, (query, error) in zip(operations, queries)
+                ])
+
+            else:
+                query, error = queries[0]
+                is_multipart = MULTIPART_MIXED_RE.search(headers) is not None and not is_http10(headers)
+                incremental = is_multipart and query_cache.schema.get_directive('defer') is not None
+                results = [await self.execute_operation(request, query, error, context, query_cache, is_get=is_get,
+                    cache_scope=cache_scope, tracer=self.tracing and self.tracing.create_tracer(headers), incremental=incremental)]
+
+            if metrics:
+                metrics.observe('execute_seconds', time.perf_counter() - context_got_at)
+
+            ### send response to client
+
+            responses = [response for response, errors, cache_control in results]
+            if not is_batch and hasattr(responses[0], '__aiter__'):
+                self.stream_parts(responses[0], response_slot, headers, request)
+            else:
+                self.send_response(responses if is_batch else responses[0], response_slot, headers, results[0][2])
+            is_response_sent = True
+
+            ### process errors at server side too
+
+            for operation, (response, errors, cache_control) in zip(operations, results):
+                self.report_errors(errors, headers, operation)
+
+        except Exception as e:
+
+            self.loop.call_exception_handler(dict(
+                message=str(e),
+                exception=e,
+                protocol=self,
+                transport=self.transport,
+                headers=headers,
+                request=request,
+            ))
+
+            if not is_response_sent:
+                self.send_response({'errors': [{'message': json_error_message or 'Internal Server Error'}]}, response_slot)
+
+            if metrics:
+                metrics.inc(('errors_total', 'bad_request' if json_error_message else 'internal'))
+
+        finally:
+            self.servers.requests_in_flight -= 1
+
+    ### report_errors
+
+    def report_errors(self, errors, headers, request):
+        """
+        Process GraphQL errors at server side too.
+
+        @param errors: list - GraphQL errors
+        @param headers: bytes or None - HTTP headers
+        @param request: dict - GraphQL request
+        """
+        if self.metrics and errors:
+            self.metrics.inc(('errors_total', 'graphql'), len(errors))
+
+        for error in errors:
+            self.loop.call_exception_handler(dict(
+                message=error.message,
+                exception=getattr(error, 'original_error', error),
+                protocol=self,
+                transport=self.transport,
+                headers=headers,
+                request=request,
+            ))
+
+    ### execute_operation
+
+    async def execute_operation(self, request, query, error, context, query_cache, semaphore=None, is_get=False, cache_scope=None,
+            tracer=None, incremental=False):
+        """
+        Execute one GraphQL request, maybe from a batch.
+
+        @param request: dict - GraphQL request
+        @param query, error: str or None, dict or None - as returned by get_query()
+        @param context: mixed - GraphQL context produced by get_context(), shared by the batch
+        @param query_cache: QueryCache - with the schema to execute against, see Servers.swap_schema()
+        @param semaphore: None or asyncio.Semaphore - to limit concurrency of the batch
+        @param is_get: bool - if True, only query operation is allowed, and its response gets cache hint
+        @param cache_scope: str or None - as returned by get_cache_scope() defined in serve(), None to bypass response_cache
+        @param tracer: Tracer or None - as returned by Tracing.create_tracer(), traced request bypasses response_cache
+        @param incremental: bool - client accepts "multipart/mixed" response, so @defer and @stream directives are supported
+        @return response, errors, cache_control: dict or bytes or async generator, list, bytes or None -
+            response to client, maybe already serialized by response_cache, or parts of incremental delivery from execute_incremental(),
+            GraphQL errors to process at server side too, "Cache-Control" header value for GET request
+        """
+        cache_control = b'no-cache' if is_get else None
+        if error:
+            return {'errors': [error]}, [], cache_control
+
+        schema = query_cache.schema
+        document_ast, errors = query_cache.get(query)
+        if errors:
+            return self.format_result(ExecutionResult(errors=errors, invalid=True)) + (cache_control,)
+
+        ### check operation
+
+        operation = None
+        if is_get or cache_scope is not None or self.has_complexity_limits or incremental:
+            operation = get_operation(document_ast, request.get('operationName'))
+
+        if is_get and operation:
+            if operation.operation != 'query':
+                message = 'Can only perform a {} operation from a POST request'.format(operation.operation)
+                return {'errors': [{'message': message}]}, [], cache_control
+
+            cache_control = query_cache.analyze(query, document_ast, get_cache_control, operation)
+
+        if self.has_complexity_limits and operation:
+            error = self.check_complexity(query_cache, query, document_ast, operation)
+            if error:
+                return {'errors': [error]}, [], cache_control
+
+        if incremental and operation:
+            plan = query_cache.analyze(query, document_ast, get_incremental_plan, operation)
+            if plan:
+                return self.execute_incremental(plan, schema, request, context), [], None
+
+        ### execute
+
+        if cache_scope is not None and tracer is None and operation and operation.operation == 'query':
+            cache_key = get_response_cache_key(query, request, cache_scope)
+            response, errors = await self.execute_cached(cache_key, schema, document_ast, request, context, semaphore)
+        else:
+            response, errors = await self.execute_document(schema, document_ast, request, context, semaphore, tracer)
+
+        if errors and is_get:
+            cache_control = b'no-cache'
+
+        return response, errors, cache_control
+
+    ### check_complexity
+
+    def check_complexity(self, query_cache, query, document_ast, operation):
+        """
+        @param query_cache: QueryCache - as defined in execute_operation()
+        @param query: str - GraphQL query text
+        @param document_ast: graphql.language.ast.Document - valid document
+        @param operation: graphql.language.ast.OperationDefinition - operation to execute
+        @return error: dict or None - formatted for response to client, if operation is over any limit
+        """
+        depth, nodes, cost = query_cache.analyze(query, document_ast, get_complexity, operation, self.list_size)
+
+        for name, value, limit in (('depth', depth, self.max_depth), ('nodes', nodes, self.max_nodes), ('cost', cost, self.max_cost)):
+            if limit is not None and value > limit:
+                return {
+                    'message': 'Query {} {:g} exceeds max_{} {:g}'.format(name, value, name, limit),
+                    'extensions': {'code': 'QUERY_TOO_COMPLEX', 'depth': depth, 'nodes': nodes, 'cost': cost},
+                }
+
+        return None
+
+    ### execute_document
+
+    async def execute_document(self, schema, document_ast, request, context, semaphore, tracer=None):
+        """
+        @param schema: graphene.Schema - GraphQL schema the document is valid for
+        @param document_ast: graphql.language.ast.Document - valid document
+        @param request, context, semaphore, tracer: as defined in execute_operation()
+        @return response, errors: as returned by format_result()
+        """
+        if semaphore:
+            await semaphore.acquire()
+
+        middleware = [tracer] if tracer else []
+        if self.loop_monitor and random.random() < self.loop_monitor.sample_rate:
+            middleware.append(self.loop_monitor)
+
+        if tracer:
+            tracer.start()
+
+        try:
+            result = await execute(
+                schema,
+                document_ast,
+                context_value=context,
+                variable_values=request.get('variables'),
+                operation_name=request.get('operationName'),
+                executor=self.executor,
+                return_promise=True,
+                middleware=MiddlewareManager(*middleware, wrap_in_promise=False) if middleware else None,
+            )
+
+        except Exception as e:
+            # Same as graphql() does, e.g. for unknown operation name.
+            result = ExecutionResult(errors=[e], invalid=True)
+
+        finally:
+            if semaphore:
+                semaphore.release()
+
+        response, errors = self.format_result(result)
+
+        if tracer:
+            tracer.finish()
+            if tracer.is_requested:
+                response['extensions'] = {'tracing': tracer.get_tracing()}
+            if tracer.duration >= self.tracing.slow_query_seconds:
+                self.report_slow_query(request, tracer)
+
+        return response, errors
+
+    ### execute_incremental
+
+    def execute_incremental(self, plan, schema, request, context):
+        """
+        Start concurrent execution of the initial and deferred documents of the plan.
+
+        @param plan: dict - as returned by get_incremental_plan()
+        @param schema: graphene.Schema - as defined in execute_document()
+        @param request, context: as defined in execute_operation()
+        @return parts: async generator - as returned by iter_incremental()
+        """
+        initial = self.loop.create_task(self.execute_document(schema, plan['initial'], request, context, None))
+        deferred = [
+            self.loop.create_task(self.execute_deferred(label, keys, schema, document, request, context))
+            for label, keys, document in plan['deferred']
+        ]
+        return self.iter_incremental(initial, deferred, plan['streams'])
+
+    async def execute_deferred(self, label, keys, schema, document_ast, request, context):
+        """
+        @param label, keys, document_ast: as in plan returned by get_incremental_plan()
+        @param schema: graphene.Schema - as defined in execute_document()
+        @param request, context: as defined in execute_operation()
+        @return incremental, errors: list, list - entries of "incremental" with data of deferred fragment, GraphQL errors
+        """
+        response, errors = await self.execute_document(schema, document_ast, request, context, None)
+
+        incremental = []
+        for path, data in find_values(response.get('data'), keys, expand_lists=True):
+            if data is not None:
+                incremental.append(dict(data=data, path=path, **({'label': label} if label is not None else {})))
+
+        if errors:
+            if not incremental:
+                incremental.append(dict(data=None, path=[], **({'label': label} if label is not None else {})))
+            incremental[0]['errors'] = response['errors']
+
+        return incremental, errors
+
+    async def iter_incremental(self, initial, deferred, streams):
+        """
+        Yield the initial part as soon as it is executed, then the rest of streamed lists,
+        then deferred fragments in order of completion.
+
+        @param initial: asyncio.Task - returning response, errors of the initial document
+        @param deferred: list of asyncio.Task - as returned by execute_deferred()
+        @param streams: list - as in plan returned by get_incremental_plan()
+        @return parts: async generator of (response: dict, errors: list) -
+            response has "hasNext", subsequent responses have "incremental" list too
+        """
+        try:
+            response, errors = await initial
+            data = response.get('data')
+            if data is None:
+                for task in deferred:
+                    task.cancel()
+                deferred = []
+
+            incremental = []
+            for label, keys, initial_count in streams:
+                for path, items in find_values(data, keys):
+                    if isinstance(items, list) and len(items) > initial_count:
+                        incremental.append(dict(items=items[initial_count:], path=path + [initial_count],
+                            **({'label': label} if label is not None else {})))
+                        del items[initial_count:]
+
+            response['hasNext'] = bool(incremental or deferred)
+            yield response, errors
+
+            if incremental:
+                yield {'incremental': incremental, 'hasNext': bool(deferred)}, []
+
+            for count, task in enumerate(asyncio.as_completed(deferred), 1):
+                incremental, errors = await task
+                yield {'incremental': incremental, 'hasNext': count < len(deferred)}, errors
+
+        finally:
+            for task in deferred:
+                task.cancel()  # if client is gone
+
+    ### report_slow_query
+
+    def report_slow_query(self, request, tracer):
+        """
+        Report traced request that was slow to exception handler, if it is set, or to "aiographql" logger.
+
+        @param request: dict - GraphQL request
+        @param tracer: Tracer - finished
+        """
+        variables = request.get('variables')
+        operation_name = request.get('operationName')
+        if operation_name is None and tracer.operation and tracer.operation.name:
+            operation_name = tracer.operation.name.value
+
+        slow_query = dict(
+            operation_name=operation_name,
+            variables_digest=hashlib.sha256(json.dumps(variables, sort_keys=True).encode()).hexdigest()[:16] if variables else None,
+            seconds=tracer.duration,
+            top_fields=tracer.get_top_fields(self.tracing.top_fields),
+        )
+        message = 'Slow query {operation_name} with variables {variables_digest} took {seconds:.3f}s, top fields: {fields}'.format(
+            fields=', '.join('{} {:.3f}s'.format(path, seconds) for path, seconds in slow_query['top_fields']),
+            **slow_query
+        )
+
+        if self.loop.get_exception_handler():
+            self.loop.call_exception_handler(dict(
+                message=message,
+                slow_query=slow_query,
+                protocol=self,
+                transport=self.transport,
+                request=request,
+            ))
+        else:
+            logger.warning(message)
+
+    ### execute_cached
+
+    async def execute_cached(self, cache_key, schema, document_ast, request, context, semaphore):
+        """
+        Get response from response_cache,
+        or execute document once for all concurrent identical requests and cache its response, if there are no errors.
+
+        @param cache_key: str - as returned by get_response_cache_key()
+        @param schema, document_ast, request, context, semaphore: as defined in execute_document()
+        @return response, errors: bytes or dict, list - serialized response, unless there are errors
+        """
+        content = self.response_cache.get(cache_key)
+        if hasattr(content, '__await__'):
+            content = await content
+
+        if content is not None:
+            return content, []
+
+        flights = self.servers.response_cache_flights
+        flight = flights.get(cache_key)
+        if flight is not None:
+            result = await asyncio.shield(flight)
+            if result is not None:
+                return result
+            return await self.execute_document(schema, document_ast, request, context, semaphore)  # as the first request failed
+
+        flight = flights[cache_key] = self.loop.create_future()
+        try:
+            response, errors = await self.execute_document(schema, document_ast, request, context, semaphore)
+
+            if not errors:
+                response = self.json_codec.dumps(response)
+                stored = self.response_cache.set(cache_key, response)
+                if hasattr(stored, '__await__'):
+                    await stored
+
+            flight.set_result((response, []))  # errors are processed once, by this request
+            return response, errors
+
+        finally:
+            flights.pop(cache_key, None)
+            if not flight.done():
+                flight.set_result(None)
+
+    ### format_result
+
+    def format_result(self, result):
+        """
+        @param result: graphql.execution.ExecutionResult
+        @return response, errors: dict, list - response to client, GraphQL errors to process at server side too
+        """
+        response = {}
+        if not result.invalid:
+            response['data'] = result.data
+        if result.errors:
+            response['errors'] = [format_error(error) for error in result.errors]
+
+        return response, result.errors or []
+
+    ### get_query
+
+    async def get_query(self, request):
+        """
+        Get query text from GraphQL request or from persisted queries store:
+        https://github.com/apollographql/apollo-link-persisted-queries#protocol
+
+        @param request: dict - GraphQL request
+        @return query, error: str or None, dict or None - error is formatted for response to client
+        """
+        query = request.get('query')
+        persisted_query = (request.get('extensions') or {}).get('persistedQuery') or {}
+        sha256_hash = persisted_query.get('sha256Hash')
+
+        if not sha256_hash:
+            if self.persisted_queries_only:
+                return None, {'message': 'PersistedQueryNotSupported', 'extensions': {'code': 'PERSISTED_QUERY_NOT_SUPPORTED'}}
+            if query is None:
+                return None, {'message': 'JSON: "query" key not found'}
+            return query, None
+
+        if query is None or self.persisted_queries_only:
+            query = self.persisted_queries.get(sha256_hash)
+            if hasattr(query, '__await__'):
+                query = await query
+
+            if query is None:
+                return None, {'message': 'PersistedQueryNotFound', 'extensions': {'code': 'PERSISTED_QUERY_NOT_FOUND'}}
+            return query, None
+
+        if hashlib.sha256(query.encode()).hexdigest() != sha256_hash:
+            return None, {'message': 'provided sha does not match query', 'extensions': {'code': 'BAD_REQUEST'}}
+
+        stored = self.persisted_queries.set(sha256_hash, query)
+        if hasattr(stored, '__await__'):
+            await stored
+
+        return query, None
+
+    ### send_response
+
+    def send_response(self, response, response_slot=None, headers=None, cache_control=None):
+        """
+        Send response to the client.
+
+        Pipelined requests are processed concurrently,
+        so responses wait in self.responses queue to be sent in order of requests.
+
+        @param response: dict or list or bytes - http://facebook.github.io/graphql/October2016/#sec-Response-Format - list for batch,
+            bytes for response already serialized by response_cache, list may contain such bytes too
+        @param response_slot: list or None - [None] placeholder in self.responses queue, added when request was received in full,
+            None to add it now, e.g. for error found before request is received in full,
+            it gets (headers: bytes, content: bytes) of HTTP response once it is ready
+        @param headers: bytes or None - HTTP headers of request, to negotiate compression and to check "If-None-Match"
+        @param cache_control: bytes or None - "Cache-Control" header value for GET request, to send it with "ETag"
+        """
+        metrics = self.metrics
+        if metrics:
+            started_at = time.perf_counter()
+
+        is_cached = isinstance(response, bytes)
+        if is_cached:
+            content = response
+
+        elif isinstance(response, list) and any(isinstance(item, bytes) for item in response):
+            content = b'[' + b','.join(item if isinstance(item, bytes) else self.json_codec.dumps(item) for item in response) + b']'
+
+        elif self.streaming_min_size is not None and estimate_json_size(response) >= self.streaming_min_size and not (headers and is_http10(headers)):
+            # Not for HTTP/1.0 client, as it does not support "Transfer-Encoding: chunked".
+            self.stream_response(response, response_slot, headers, cache_control)
+            return
+
+        else:
+            content = self.json_codec.dumps(response)
+
+        if metrics:
+            metrics.observe('serialize_seconds', time.perf_counter() - started_at)
+            metrics.observe('response_size_bytes', len(content))
+
+        if response_slot is None:
+            response_slot = [None]
+            self.responses.append(response_slot)
+
+        ### cache
+
+        extra_headers = b''
+        if cache_control:
+            etag = b'W/"' + hashlib.md5(content).hexdigest().encode() + b'"'  # weak, as content may be compressed
+            extra_headers += b'Cache-Control: ' + cache_control + b'\r\nETag: ' + etag + b'\r\n'
+
+            match = IF_NONE_MATCH_RE.search(headers)
+            if match and (etag[2:] in match.group(1) or match.group(1).strip() == b'*'):
+                self.write_response(response_slot, None, None, extra_headers)
+                return
+
+        ### compress
+
+        content_encoding = None
+        if self.compression_min_size is not None and headers and len(content) >= self.compression_min_size:
+            content_encoding = get_content_encoding(headers)
+
+        if content_encoding:
+            response_cache = self.response_cache if is_cached and hasattr(self.response_cache, 'get_compressed') else None
+            if response_cache:
+                compressed = response_cache.get_compressed(content, content_encoding)
+                if compressed is not None:
+                    self.write_response(response_slot, compressed, content_encoding, extra_headers)
+                    return
+
+            if len(content) >= self.compression_thread_min_size:
+                future = self.loop.run_in_executor(None, compress, content, content_encoding, self.compression_level)
+                future.add_done_callback(lambda future: self.on_compressed(future, response_slot, content, content_encoding, extra_headers,
+                    response_cache))
+                return
+
+            compressed = compress(content, content_encoding, self.compression_level)
+            if response_cache:
+                response_cache.set_compressed(content, content_encoding, compressed)
+            content = compressed
+
+        self.write_response(response_slot, content, content_encoding, extra_headers)
+
+    ### stream_response
+
+    def stream_response(self, response, response_slot, headers, cache_control):
+        """
+        Send large response with "Transfer-Encoding: chunked" as it is serialized,
+        so only about one chunk of serialized response is in memory at once instead of the whole of it.
+
+        Response slot gets a future instead of HTTP response, send_ready_responses() resolves it when it is the turn of this response.
+        "ETag" is not sent, as content is not known in advance.
+
+        @param response: dict or list - as defined in send_response()
+        @param response_slot: list or None - as defined in send_response()
+        @param headers: bytes or None - as defined in send_response()
+        @param cache_control: bytes or None - as defined in send_response()
+        """
+        if response_slot is None:
+            response_slot = [None]
+            self.responses.append(response_slot)
+
+        extra_headers = b'Cache-Control: ' + cache_control + b'\r\n' if cache_control else b''
+        if self.is_closing and self.responses and self.responses[-1] is response_slot:
+            extra_headers += CONNECTION_CLOSE_HEADER
+
+        content_encoding = None
+        if self.compression_min_size is not None:
+            extra_headers += VARY_HEADER
+            if headers:
+                content_encoding = get_content_encoding(headers)
+        if content_encoding:
+            extra_headers += CONTENT_ENCODING_HEADERS[content_encoding]
+
+        response_slot[0] = self.loop.create_future()
+        self.loop.create_task(self.write_chunks(response, response_slot, content_encoding, extra_headers, headers))
+        self.send_ready_responses()  # may be the turn of this response already
+
+    ### write_chunks
+
+    async def write_chunks(self, response, response_slot, content_encoding, extra_headers, headers=None):
+        """
+        Serialize and write chunks of streamed response, once it is its turn in self.responses queue,
+        then send the rest of ready responses.
+        If serialization or compression fails in the middle of response, connection is closed, as response can not be completed.
+
+        @param response: dict or list - as defined in send_response()
+        @param response_slot: list - with future resolved when it is the turn of this response
+        @param content_encoding: bytes or None - as negotiated by get_content_encoding()
+        @param extra_headers: bytes - as defined in write_response()
+        @param headers: bytes or None - as defined in send_response(), for exception_handler
+        """
+        compress = flush = None
+        if content_encoding:
+            compress, flush = get_compressor(content_encoding, self.compression_level)
+
+        chunk_size = self.streaming_chunk_size
+        size = 0
+        try:
+            await response_slot[0]
+            if self.transport.is_closing():
+                return  # client is gone
+
+            self.transport.write(HTTP_CHUNKED_RESPONSE % (b'application/json', self.servers.date_header, extra_headers))
+
+            parts, parts_size = [], 0
+            for part in iter_json(response, chunk_size, self.json_codec):
+                parts.append(part)
+                parts_size += len(part)
+                if parts_size >= chunk_size:
+                    size += parts_size
+                    await self.write_chunk(b''.join(parts), compress)
+                    parts, parts_size = [], 0
+                    if self.transport.is_closing():
+                        return  # client is gone
+
+            size += parts_size
+            chunk = b''.join(parts)
+            if compress:
+                chunk = compress(chunk) + flush()
+            if chunk:
+                self.transport.writelines([b'%x\r\n' % len(chunk), chunk, b'\r\n'])
+            self.transport.write(b'0\r\n\r\n')
+
+        except asyncio.CancelledError:
+            return  # client is gone before the turn of this response
+
+        except Exception as e:
+            self.loop.call_exception_handler(dict(
+                message=str(e),
+                exception=e,
+                protocol=self,
+                transport=self.transport,
+                headers=headers,
+            ))
+            self.transport.close()  # response can not be completed
+
+        finally:
+            if self.metrics:
+                self.metrics.observe('response_size_bytes', size)
+
+            if self.responses and self.responses[0] is response_slot:
+                self.responses.popleft()
+                self.send_ready_responses()
+
+    ### stream_parts
+
+    def stream_parts(self, parts, response_slot, headers, request):
+        """
+        Send parts of incremental delivery as "multipart/mixed" response with "Transfer-Encoding: chunked",
+        each part once it is executed, in the same order and with the same backpressure as stream_response().
+        Parts are not compressed, so each of them reaches client at once.
+
+        @param parts: async generator - as returned by execute_incremental()
+        @param response_slot: list - as defined in send_response()
+        @param headers: bytes or None - HTTP headers of request, to report errors
+        @param request: dict - GraphQL request, to report errors
+        """
+        response_slot[0] = self.loop.create_future()
+        self.loop.create_task(self.write_parts(parts, response_slot, headers, request))
+        self.send_ready_responses()  # may be the turn of this response already
+
+    ### write_parts
+
+    async def write_parts(self, parts, response_slot, headers, request):
+        """
+        Write parts of incremental delivery once it is the turn of this response in self.responses queue,
+        then send the rest of ready responses.
+
+        @param parts, response_slot, headers, request: as defined in stream_parts()
+        """
+        size = 0
+        try:
+            await response_slot[0]
+            if self.transport.is_closing():
+                return  # client is gone
+
+            extra_headers = CONNECTION_CLOSE_HEADER if self.is_closing and self.responses and self.responses[-1] is response_slot else b''
+            self.transport.write(HTTP_CHUNKED_RESPONSE % (MULTIPART_CONTENT_TYPE, self.servers.date_header, extra_headers))
+
+            async for response, errors in parts:
+                chunk = MULTIPART_PART_HEADERS + self.json_codec.dumps(response)
+                size += len(chunk)
+                await self.write_chunk(chunk)
+                self.report_errors(errors, headers, request)
+                if self.transport.is_closing():
+                    return  # client is gone
+
+            self.transport.writelines([b'%x\r\n' % len(MULTIPART_END), MULTIPART_END, b'\r\n0\r\n\r\n'])
+
+        except asyncio.CancelledError:
+            return  # client is gone before the turn of this response
+
+        except Exception as e:
+            self.loop.call_exception_handler(dict(
+                message=str(e),
+                exception=e,
+                protocol=self,
+                transport=self.transport,
+                headers=headers,
+                request=request,
+            ))
+            self.transport.close()  # response can not be completed
+
+        finally:
+            await parts.aclose()
+
+            if self.metrics:
+                self.metrics.observe('response_size_bytes', size)
+
+            if self.responses and self.responses[0] is response_slot:
+                self.responses.popleft()
+                self.send_ready_responses()
+
+    ### write_chunk
+
+    async def write_chunk(self, chunk, compress=None):
+        """
+        Write chunk of streamed response, then wait for write buffer to drain below its "high" limit,
+        or at least let other requests progress.
+
+        @param chunk: bytes - serialized part of response
+        @param compress: callable(bytes): bytes or None - as returned by get_compressor()
+        """
+        if compress:
+            if len(chunk) >= self.compression_thread_min_size:
+                chunk = await self.loop.run_in_executor(None, compress, chunk)
+            else:
+                chunk = compress(chunk)
+
+        if chunk:  # compressor may buffer it
+            self.transport.writelines([b'%x\r\n' % len(chunk), chunk, b'\r\n'])  # may call pause_writing() synchronously
+
+        if self.is_writing_paused:
+            self.writing_resumed = self.loop.create_future()
+            await self.writing_resumed
+        else:
+            await asyncio.sleep(0)
+
+    ### on_compressed
+
+    def on_compressed(self, future, response_slot, content, content_encoding, extra_headers, response_cache=None):
+        """
+        Called when content is compressed in thread pool.
+
+        @param future: asyncio.Future - with compressed content
+        @param response_slot: list - as defined in send_response()
+        @param content: bytes - not compressed, to send if compression failed
+        @param content_encoding: bytes - as negotiated by get_content_encoding()
+        @param extra_headers: bytes - as defined in write_response()
+        @param response_cache: ResponseCache or None - to store compressed content of cache hit for the next hits
+        """
+        try:
+            compressed = future.result()
+            if response_cache:
+                response_cache.set_compressed(content, content_encoding, compressed)
+            content = compressed
+
+        except Exception as e:
+            content_encoding = None
+            self.loop.call_exception_handler(dict(
+                message=str(e),
+                exception=e,
+                protocol=self,
+                transport=self.transport,
+            ))
+
+        self.write_response(response_slot, content, content_encoding, extra_headers)
 
-### serve
+    ### write_response
 
-def serve(schema, listen, get_context=None, exception_handler=None, enable_uvloop=True, run=True):
-    """
-    Configure the stack and start serving requests
+    def write_response(self, response_slot, content, content_encoding, extra_headers=b''):
+        """
+        Put HTTP response to its slot in self.responses queue and send ready responses.
 
-    @param schema: graphene.Schema - GraphQL schema to serve
+        @param response_slot: list - as defined in send_response()
+        @param content: bytes or None - content of response, compressed if content_encoding is set, None for "304 Not Modified"
+        @param content_encoding: bytes or None - as negotiated by get_content_encoding()
+        @param extra_headers: bytes - e.g. "Cache-Control" and "ETag" headers, each ending with CRLF
+        """
+        if self.is_closing and self.responses and self.responses[-1] is response_slot:
+            extra_headers += CONNECTION_CLOSE_HEADER  # after protocol error or as requested by client
+        if self.compression_min_size is not None:
+            extra_headers += VARY_HEADER
+        if content_encoding:
+            extra_headers += CONTENT_ENCODING_HEADERS[content_encoding]
 
-    @param listen: list - one or more endpoints to listen for connections:
-        dict(protocol='tcp', port=25100, ...) - https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.create_server
-        dict(protocol='unix', path='/tmp/worker0', ...) - https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.create_unix_server
+        if content is None:
+            response_slot[0] = HTTP_NOT_MODIFIED % (self.servers.date_header, extra_headers), b''
+        else:
+            response_slot[0] = HTTP_RESPONSE % (len(content), self.servers.date_header, extra_headers), content
+        # Headers and content are sent with writelines(), so content is not copied.
 
-    @param get_context: None or [async] callable(loop, context: dict): mixed - to produce GraphQL context like auth from input unified with exception_handler()
+        self.send_ready_responses()
 
-    @param exception_handler: None or callable(loop, context: dict) - default or custom exception handler as defined in
-        https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.set_exception_handler +
-        headers: bytes or None - HTTP headers, if known
-        request: dict or bytes or None - accumulated HTTP request before content length is known, then accumulated content, then GraphQL request
+    ### send_ready_responses
 
-    @param enable_uvloop: bool - enable uvloop for top performance, unless you have a better loop
-    @param run: bool - if True, run the loop; False is good for tests
-    @return servers: Servers - await servers.close() to close listening sockets - good for tests
-    """
-    try:
-        if enable_uvloop:
-            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    def send_ready_responses(self):
+        """
+        Send ready responses from self.responses queue in order of requests, unless writing is paused.
+        Close connection once all responses are sent after protocol error, or start waiting for the next request.
+        """
+        responses = self.responses
+        if self.transport.is_closing():
+            for response_slot in responses:
+                if isinstance(response_slot[0], asyncio.Future):
+                    response_slot[0].cancel()  # streaming response waiting for its turn
+            responses.clear()  # client is gone
+            return
 
-        loop = asyncio.get_event_loop()
+        if self.is_writing_paused or not responses or responses[0][0] is None:
+            return
 
-        if exception_handler:
-            loop.set_exception_handler(exception_handler)
+        data = []
+        while responses and responses[0][0] is not None:
+            response = responses[0][0]
+            if isinstance(response, asyncio.Future):
+                if not response.done():
+                    response.set_result(None)  # turn of streaming response, it starts after data below is written
+                break
+            data.extend(responses.popleft()[0])
 
-        servers = Servers()
+        if data:
+            self.transport.writelines(data)  # may call pause_writing() synchronously
 
-        coro = _serve(schema, listen, get_context, loop, servers)
-        if run:
-            loop.run_until_complete(coro)
-        else:
-            loop.create_task(coro)
+        if not responses:
+            if self.is_closing:
+                self.transport.close()  # after write buffer is flushed
+                return
+            self.update_deadline()
 
-        return servers
+        self.update_reading()
 
-    except Exception as e:
-        asyncio.get_event_loop().call_exception_handler(dict(
-            message=str(e),
-            exception=e,
-        ))
+### WebSocketConnection
 
-async def _serve(schema, listen, get_context, loop, servers):
+class WebSocketConnection(asyncio.Protocol):
     """
-    The coroutine serving requests.
-    Should be created by serve() only.
+    Connection from client upgraded to WebSocket, speaking graphql-transport-ws protocol or legacy graphql-ws protocol:
+    https://github.com/enisdenjo/graphql-ws/blob/master/PROTOCOL.md
+    https://github.com/apollographql/subscriptions-transport-ws/blob/master/PROTOCOL.md
 
-    @param schema: graphene.Schema - GraphQL schema to serve
-    @param listen: list - one or more endpoints to listen for connections, as defined in serve()
-    @param get_context: None or [async] callable(loop, context: dict): mixed - to produce GraphQL context like auth as defined in serve()
-    @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
-    @param servers: Servers - list that will be populated with asyncio.Server instances here
+    Idle subscriber costs only this object and its entry in SubscriptionGroup - no task, no timer:
+    timer is set only while waiting for "connection_init" message, limited by header_timeout,
+    and while frame is incomplete or fragmented message waits for its next frame, limited by body_timeout per frame.
+    Messages wait in a bounded queue while client reads slowly, see send_parts().
     """
-    def protocol_factory():
-        return ConnectionFromClient(schema, get_context, loop)
 
-    assert listen, 'At least one endpoint should be specified in "listen"'
-    for endpoint in listen:
-        kwargs = endpoint.copy()  # to allow reuse of "listen" configuration
-        protocol = kwargs.pop('protocol')
+    def __init__(self, get_context, loop, servers, transport, protocol, headers, is_writing_paused):
+        """
+        @param get_context, loop, servers: as defined in ConnectionFromClient
+        @param transport: as defined in ConnectionFromClient.connection_made()
+        @param protocol: bytes - b'graphql-transport-ws' or b'graphql-ws'
+        @param headers: bytes - HTTP headers of upgrade request, for get_context()
+        @param is_writing_paused: bool - as it was before upgrade
 
-        if protocol == 'tcp':
-            servers.append(await loop.create_server(protocol_factory, **kwargs))
+        self.buffer: bytearray or None - accumulated incomplete frame
+        self.fragments: list or None - payloads of fragmented message
+        self.phase: str or None - 'init' while waiting for "connection_init", 'frame' while frame is incomplete, or None
+        self.deadline: float or None - loop time when the current phase times out
+        self.queue: OrderedDict or None - key: parts of message waiting for write buffer to drain
+        self.connection_params: mixed - payload of "connection_init" message, for get_context()
+        self.subscriptions: dict - id: SubscriptionGroup, or asyncio.Task iterating async iterable, or None while subscribing
+        """
+        self.get_context = get_context
+        self.loop = loop
+        self.servers = servers
+        self.transport = transport
+        self.is_legacy = protocol == b'graphql-ws'
+        self.headers = headers
+        self.is_writing_paused = is_writing_paused
+        self.buffer = None
+        self.fragments = None
+        self.queue = None
+        self.connection_params = None
+        self.is_initialized = False
+        self.subscriptions = {}
+        self.persisted_queries = servers.persisted_queries
+        self.persisted_queries_only = servers.persisted_queries_only
+        self.max_depth = servers.max_depth
+        self.max_nodes = servers.max_nodes
+        self.max_cost = servers.max_cost
+        self.list_size = servers.list_size
+        self.has_complexity_limits = servers.max_depth is not None or servers.max_nodes is not None or servers.max_cost is not None
+        self.phase = None
+        self.deadline = None
+        self.timer = None
+        servers.connections.add(self)
+        self.update_deadline()
 
-        elif protocol == 'unix':
-            if os.path.exists(kwargs['path']):
-                os.remove(kwargs['path'])
-            servers.append(await loop.create_unix_server(protocol_factory, **kwargs))
+    # The same persisted queries, allow-list and complexity limits as for HTTP requests.
+    get_query = ConnectionFromClient.get_query
+    check_complexity = ConnectionFromClient.check_complexity
 
-        else:
-            raise ValueError('Unsupported protocol={}'.format(repr(protocol)))
+    ### connection_lost
 
-    await asyncio.gather(*[server.wait_closed() for server in servers])
+    def connection_lost(self, exc):
+        """
+        Called by asyncio when connection is closed or lost.
 
-### Servers
+        @param exc: Exception or None
+        """
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
 
-class Servers(list):
-    """
-    A list of servers created by serve()
-    """
+        for id in list(self.subscriptions):
+            self.unsubscribe(id)
+        self.servers.forget_connection(self)
 
-    async def close(self):
+        if self.servers.metrics:
+            self.servers.metrics.inc('connections_open', -1)
+
+    ### drain
+
+    def drain(self):
         """
-        Сlose listening sockets - good for tests
+        Called by Servers.drain(): close connection, so client resubscribes to another server.
         """
-        for server in self:
-            server.close()
+        self.close(1001, 'Going Away')
 
-        await asyncio.gather(*[server.wait_closed() for server in self])
+    ### pause_writing
 
-### ConnectionFromClient
+    def pause_writing(self):
+        """
+        Called by asyncio when write buffer reaches its "high" limit, e.g. when client reads slowly.
+        """
+        self.is_writing_paused = True
 
-class ConnectionFromClient(asyncio.Protocol):
-    """
-    Each connection from client is represented with a separate instance of this class.
-    """
+    ### resume_writing
 
-    def __init__(self, schema, get_context, loop):
+    def resume_writing(self):
         """
-        @param schema: graphene.Schema - GraphQL schema to serve
-        @param get_context: None or [async] callable(loop, context: dict): mixed - to produce GraphQL context like auth as defined in serve()
-        @param loop: uvloop.Loop - or some other loop if you opted out of enable_uvloop=True
+        Called by asyncio when write buffer drains to its "low" limit.
         """
-        self.schema = schema
-        self.get_context = get_context
-        self.loop = loop
+        self.is_writing_paused = False
+        queue = self.queue
+        while queue and not self.is_writing_paused:
+            key, parts = queue.popitem(last=False)
+            self.transport.writelines(parts)  # may call pause_writing() synchronously
 
-    ### connection_made
+        if not queue:
+            self.queue = None
 
-    def connection_made(self, transport):
+    ### data_received
+
+    def data_received(self, chunk):
         """
-        Called by asyncio when connection from client is made.
+        Called by asyncio when new chunk of data is received.
 
-        @param transport: uvloop.loop.TCPTransport or UnixTransport or some other transport if you opted out of enable_uvloop=True,
-            but it should implement (may not inherit) asyncio.BaseTransport,ReadTransport,WriteTransport:
-            https://docs.python.org/3/library/asyncio-protocol.html#transports
+        @param chunk: bytes
         """
-        self.transport = transport
-        self.prepare_for_new_request()
+        if self.buffer:
+            self.buffer += chunk
+            data = self.buffer
+        else:
+            data = chunk
+
+        start = 0
+        while not self.transport.is_closing():
+            try:
+                frame = parse_websocket_frame(data, start, self.servers.max_body_size)
+            except ValueError as e:
+                code, reason = e.args
+                self.close(code, reason)
+                return
+
+            if frame is None:
+                break  # wait for the next chunk
+
+            fin, opcode, payload, start = frame
+            self.on_frame(fin, opcode, payload)
 
-    ### prepare_for_new_request
+        if start >= len(data):
+            self.buffer = None
+        elif data is self.buffer:
+            del self.buffer[:start]  # in place, so incomplete frame is not copied again for each chunk
+        else:
+            self.buffer = bytearray(memoryview(data)[start:])
+
+        if start and self.phase == 'frame':
+            self.phase = None  # each frame gets its own deadline
+        self.update_deadline()
 
-    def prepare_for_new_request(self):
+    ### update_deadline
+
+    def update_deadline(self):
         """
-        Should be called when we expect new request from this client connection:
-        on connection_made() and on send_response()
+        Set deadline of the current phase of connection, when the phase changes:
+        waiting for "connection_init" message, or for the rest of incomplete frame or fragmented message.
 
-        self.content_length: int, None - content length, if known
-        self.headers: bytes or None - HTTP headers, if known
-        self.request: bytes or None - accumulated HTTP request before content length is known, then accumulated content
+        Deadline is not extended by each chunk, so slow clients can not hold connection by trickling bytes.
+        Single timer per connection is not rescheduled when deadline moves later - on_timeout() checks it.
         """
-        self.content_length = None
-        self.headers = None
-        self.request = None
+        if not self.is_initialized:
+            phase, timeout = 'init', self.servers.header_timeout
+        elif self.buffer is not None or self.fragments is not None:
+            phase, timeout = 'frame', self.servers.body_timeout
+        else:
+            phase, timeout = None, None
 
-    ### data_received
+        if phase == self.phase:
+            return
 
-    def data_received(self, chunk):
+        self.phase = phase
+        if timeout is None:
+            self.deadline = None
+            if self.timer:  # idle subscriber has no timer
+                self.timer.cancel()
+                self.timer = None
+            return
+
+        self.deadline = self.loop.time() + timeout
+        if self.timer is None or self.timer.when() > self.deadline:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = self.loop.call_at(self.deadline, self.on_timeout)
+
+    ### on_timeout
+
+    def on_timeout(self):
         """
-        Called by asyncio when new chunk of data is received.
+        Called by timer: close connection of client that is too slow to initialize it or to send its frame.
+        """
+        self.timer = None
+        if self.deadline is None or self.transport.is_closing():
+            return
 
-        This function is NOT async,
-        and it is good both for correct order of chunks
-        and for performance: no need to create_task() each time.
+        if self.loop.time() < self.deadline:
+            self.timer = self.loop.call_at(self.deadline, self.on_timeout)
+            return
 
-        Once all chunks are accumulated,
-        GraphQL request is processed in async mode - to be able to await DB, etc.
+        if self.phase == 'init':
+            self.close(4408, 'Connection initialisation timeout')
+        else:
+            self.close(1008, 'Timeout of frame')
 
-        @param chunk: bytes
+    ### on_frame
+
+    def on_frame(self, fin, opcode, payload):
+        """
+        @param fin: bool - if the frame is the last one of message
+        @param opcode: int - as defined in https://tools.ietf.org/html/rfc6455#section-5.2
+        @param payload: bytes - unmasked
         """
+        if opcode == 8:  # close
+            self.close(int.from_bytes(payload[:2], 'big') if len(payload) >= 2 else 1000)
+
+        elif opcode == 9:  # ping
+            self.send_parts([payload], opcode=10)
+
+        elif opcode == 10:  # pong
+            pass
+
+        elif opcode in (1, 2) and self.fragments is None:  # text or binary
+            if fin:
+                self.on_message(payload)
+            else:
+                self.fragments = [payload]
 
-        ### accumulate chunks
+        elif opcode == 0 and self.fragments is not None:  # continuation
+            self.fragments.append(payload)
+            if sum(len(fragment) for fragment in self.fragments) > self.servers.max_body_size:
+                self.close(1009, 'Message is too big')
+            elif fin:
+                payload = b''.join(self.fragments)
+                self.fragments = None
+                self.on_message(payload)
 
-        if self.request is None:
-            self.request = chunk
         else:
-            self.request += chunk
+            self.close(1002, 'Unexpected frame')
 
-        ### get content length
+    ### on_message
 
-        if self.content_length is None:
+    def on_message(self, payload):
+        """
+        @param payload: bytes - JSON message of GraphQL over WebSocket protocol
+        """
+        try:
+            message = self.servers.json_codec.loads(payload)
+            assert isinstance(message, dict)
+        except Exception:
+            self.close(4400, 'Invalid message')
+            return
 
-            end_of_headers_index = self.request.find(END_OF_HEADERS)
-            if end_of_headers_index == -1:
-                return  # wait for the next chunk
+        type = message.get('type')
+        id = message.get('id')
 
-            match = CONTENT_LENGTH_RE.search(self.request)
-            if not match:
-                message = '"Content-Length" header is not found'
-                self.loop.call_exception_handler(dict(
-                    message=message,
-                    protocol=self,
-                    transport=self.transport,
-                    request=self.request,
-                ))
-                self.send_response({'errors': [{'message': message}]})
+        if type == 'connection_init':
+            if self.is_initialized:
+                self.close(4429, 'Too many initialisation requests')
                 return
 
-            self.content_length = int(match.group(1))
+            self.is_initialized = True
+            self.connection_params = message.get('payload')
+            self.send_message({'type': 'connection_ack'})
 
-            ### cut headers off
+        elif type in ('subscribe', 'start'):
+            if not self.is_initialized:
+                self.close(4401, 'Unauthorized')
+                return
 
-            self.headers = self.request[:end_of_headers_index]
-            self.request = self.request[end_of_headers_index + len(END_OF_HEADERS):]
+            if not isinstance(id, str) or not isinstance(message.get('payload'), dict):
+                self.close(4400, 'Invalid message')
+                return
 
-        ### get full request
+            if id in self.subscriptions:
+                self.close(4409, 'Subscriber for {} already exists'.format(id))
+                return
 
-        if len(self.request) < self.content_length:
-            return  # wait for the next chunk
+            self.subscriptions[id] = None
+            self.loop.create_task(self.subscribe(id, message['payload']))
 
-        ### process request
+        elif type in ('complete', 'stop'):
+            self.unsubscribe(id)
 
-        self.loop.create_task(self.process_request(self.headers, self.request))
-        # loop.create_task() is a bit faster than asyncio.ensure_future() when starting coroutines.
+        elif type == 'ping':
+            self.send_message({'type': 'pong'})
 
-    ### process_request
+        elif type == 'pong':
+            pass
 
-    async def process_request(self, headers, request):
-        """
-        Execute GraphQL request in async mode and send response back to client.
+        elif type == 'connection_terminate':
+            self.close(1000)
 
-        Resolvers that need to await DB, etc - should be async too.
-        Other resolvers should NOT be async.
+        else:
+            self.close(4400, 'Invalid message')
 
-        @param headers: bytes or None - HTTP headers
-        @param request: bytes - content of GraphQL request
+    ### subscribe
+
+    async def subscribe(self, id, request):
         """
-        json_error_message = None
-        is_response_sent = False
+        Start subscription: call resolver of subscription field once to get Topic or async iterable of events,
+        then execute each event. Query and mutation operations are executed once.
+
+        @param id: str - subscription id
+        @param request: dict - GraphQL request
+        """
+        servers = self.servers
+        query_cache, subscription_schema = servers.query_cache, servers.subscription_schema  # may be swapped meanwhile
+        schema = query_cache.schema
         try:
+            query, error = await self.get_query(request)
+            if error is None and not isinstance(query, str):
+                error = {'message': 'JSON: "query" key not found'}
+            if error:
+                self.send_error(id, [error])
+                return
 
-            ### parse json
+            document_ast, errors = query_cache.get(query)
+            if errors:
+                self.send_error(id, [format_error(error) for error in errors])
+                return
 
-            try:
-                request = json.loads(request)
-                assert 'query' in request, '"query" key not found'
+            operation = get_operation(document_ast, request.get('operationName'))
+            if self.has_complexity_limits and operation:
+                error = self.check_complexity(query_cache, query, document_ast, operation)
+                if error:
+                    self.send_error(id, [error])
+                    return
 
-            except Exception as e:
-                json_error_message = 'JSON: {}'.format(e)
-                raise
+            data_loaders = create_data_loaders(servers.data_loaders, self.loop) if servers.data_loaders else None
+            context = await self.create_context(request, data_loaders)
 
-            ### get context
+            ### query or mutation
 
-            if self.get_context:
-                context = self.get_context(self.loop, dict(
-                    message=None,  # this field is required by format shared with exception_handler()
-                    protocol=self,
-                    transport=self.transport,
-                    headers=headers,
-                    request=request,
+            if operation is None or operation.operation != 'subscription':
+                try:
+                    result = await execute(
+                        schema,
+                        document_ast,
+                        context_value=context,
+                        variable_values=request.get('variables'),
+                        operation_name=request.get('operationName'),
+                        executor=servers.executor,
+                        return_promise=True,
+                    )
+                except Exception as e:
+                    result = ExecutionResult(errors=[e], invalid=True)
+
+                payload, errors = serialize_result(result, servers.json_codec)
+                self.send_parts([self.get_next_prefix(id), payload, b'}'])
+                self.send_complete(id)
+                report_event_errors(servers, errors, request)
+                return
+
+            ### subscription
+
+            event_document_ast, field_ast = query_cache.analyze(query, document_ast, get_event_document, operation)
+            if event_document_ast is None:
+                self.send_error(id, [{'message': 'Subscription must select only one top level field'}])
+                return
+
+            source = await self.get_source(schema, document_ast, operation, field_ast, request, context)
+
+            if isinstance(source, Topic):
+                # Events are executed with context of the first subscriber of the group,
+                # so subscribers with their own context are not grouped without explicit scope.
+                scope = servers.get_cache_scope(context) if servers.get_cache_scope else None if self.get_context else ''
+                if hasattr(scope, '__await__'):
+                    scope = await scope
+
+                key = query, request.get('operationName'), json.dumps(request.get('variables'), sort_keys=True), scope, subscription_schema
+                if scope is None:
+                    key += (object(),)  # not shared
+
+                if self.subscriptions.get(id, False) is not None or self.transport.is_closing():
+                    return  # unsubscribed meanwhile
+
+                group = servers.pubsub.join(source.name, key, lambda: SubscriptionGroup(
+                    servers.pubsub, source.name, key, servers, subscription_schema, event_document_ast, request, context, data_loaders,
                 ))
-                if hasattr(context, '__await__'):
-                    context = await context
+                group.subscribers[self, id] = self.get_next_prefix(id)
+                self.subscriptions[id] = group
+
+            elif hasattr(source, '__aiter__'):
+                if self.subscriptions.get(id, False) is not None or self.transport.is_closing():
+                    if hasattr(source, 'aclose'):
+                        await source.aclose()
+                    return  # unsubscribed meanwhile
+
+                self.subscriptions[id] = self.loop.create_task(self.iterate(id, source, subscription_schema, event_document_ast,
+                    request, context, data_loaders))
+
             else:
-                context = None
+                self.send_error(id, [{'message': 'Subscription field should return aiographql.Topic or async iterable'}])
+                return
 
-            ### execute GraphQL
+            if servers.metrics:
+                servers.metrics.inc('subscriptions_active')
 
-            result = await self.schema.execute(
-                request_string=request['query'],
-                context_value=context,
-                variable_values=request.get('variables'),
-                operation_name=request.get('operationName'),
-                executor=AsyncioExecutor(loop=self.loop),
-                # AsyncioExecutor should not be reused - to avoid memory leak.
-                # TODO: Check if my PR is released: https://github.com/graphql-python/graphql-core/pull/161
-                # Then update "graphql-core==2.0" in requirements.txt and use shared AsyncioExecutor.
-                return_promise=True,
-            )
+        except Exception as e:
+            self.loop.call_exception_handler(dict(
+                message=str(e),
+                exception=e,
+                protocol=self,
+                transport=self.transport,
+                headers=self.headers,
+                request=request,
+            ))
+            self.send_error(id, [format_error(e) if isinstance(e, GraphQLError) else {'message': 'Internal Server Error'}])
 
-            ### format and send response to client
+        finally:
+            if self.subscriptions.get(id, False) is None:
+                del self.subscriptions[id]  # not started
 
-            response = {}
-            if not result.invalid:
-                response['data'] = result.data
-            if result.errors:
-                response['errors'] = [format_error(error) for error in result.errors]
+    ### create_context
 
-            self.send_response(response)
-            is_response_sent = True
+    async def create_context(self, request, data_loaders):
+        """
+        @param request: dict - GraphQL request
+        @param data_loaders: dict or None - DataLoader-s created for this subscription
+        @return context: mixed - as produced by get_context() defined in serve()
+        """
+        if self.get_context:
+            method, path, http_headers = parse_request_head(self.headers)
+            context = self.get_context(self.loop, dict(
+                message=None,  # this field is required by format shared with exception_handler()
+                protocol=self,
+                transport=self.transport,
+                headers=self.headers,
+                request=request,
+                data_loaders=data_loaders,
+                method=method,
+                path=path,
+                http_headers=http_headers,
+                connection_params=self.connection_params,
+            ))
+            if hasattr(context, '__await__'):
+                context = await context
+            return context
 
-            ### process errors at server side too
+        return dict(data_loaders=data_loaders) if data_loaders else None
 
-            if result.errors:
-                for error in result.errors:
-                    self.loop.call_exception_handler(dict(
-                        message=error.message,
-                        exception=getattr(error, 'original_error', error),
-                        protocol=self,
-                        transport=self.transport,
-                        headers=headers,
-                        request=request,
-                    ))
+    ### get_source
 
-        except Exception as e:
+    async def get_source(self, schema, document_ast, operation, field_ast, request, context):
+        """
+        Call resolver of subscription field once, the same way as executor does.
+
+        @param schema: graphene.Schema - GraphQL schema the document is valid for
+        @param document_ast: graphql.language.ast.Document - valid document
+        @param operation: graphql.language.ast.OperationDefinition - subscription operation
+        @param field_ast: graphql.language.ast.Field - subscription field, as returned by get_event_document()
+        @param request: dict - GraphQL request
+        @param context: mixed - GraphQL context
+        @return source: Topic or async iterable - as returned by resolver
+        """
+        subscription_type = schema.get_subscription_type()
+        field_def = subscription_type.fields[field_ast.name.value]
+        variables = get_variable_values(schema, operation.variable_definitions or [], request.get('variables'))
+        info = ResolveInfo(
+            field_ast.name.value,
+            [field_ast],
+            field_def.type,
+            subscription_type,
+            schema,
+            {definition.name.value: definition for definition in document_ast.definitions if isinstance(definition, ast.FragmentDefinition)},
+            None,
+            operation,
+            variables,
+            context,
+            path=[(field_ast.alias or field_ast.name).value],
+        )
+
+        resolver = field_def.resolver or default_resolve_fn
+        source = resolver(None, info, **get_argument_values(field_def.args, field_ast.arguments, variables))
+        if hasattr(source, '__await__'):
+            source = await source
+        return source
+
+    ### iterate
+
+    async def iterate(self, id, source, schema, document_ast, request, context, data_loaders):
+        """
+        Execute and send each event of async iterable returned by resolver of subscription field.
+
+        @param id: str - subscription id
+        @param source: async iterable - of events
+        @param schema: GraphQLSchema - subscription_schema the document is valid for
+        @param document_ast: graphql.language.ast.Document - as returned by get_event_document()
+        @param request, context, data_loaders: as defined in subscribe()
+        """
+        prefix = self.get_next_prefix(id)
+        try:
+            async for event in source:
+                payload, errors = await execute_event(self.servers, schema, document_ast, request, context, data_loaders, event)
+                self.send_parts([prefix, payload, b'}'], id)
+                report_event_errors(self.servers, errors, request)
+
+            self.send_complete(id)
 
+        except asyncio.CancelledError:
+            pass  # unsubscribed
+
+        except Exception as e:
             self.loop.call_exception_handler(dict(
                 message=str(e),
                 exception=e,
                 protocol=self,
                 transport=self.transport,
-                headers=headers,
+                headers=self.headers,
                 request=request,
             ))
+            self.send_error(id, [{'message': 'Internal Server Error'}])
 
-            if not is_response_sent:
-                self.send_response({'errors': [{'message': json_error_message or 'Internal Server Error'}]})
+        finally:
+            if hasattr(source, 'aclose'):
+                await source.aclose()
 
-    ### send_response
+            if self.subscriptions.get(id) is asyncio.current_task():
+                del self.subscriptions[id]
+                if self.servers.metrics:
+                    self.servers.metrics.inc('subscriptions_active', -1)
+
+    ### unsubscribe
 
-    def send_response(self, response):
+    def unsubscribe(self, id):
         """
-        Send response to the client.
+        Stop subscription, if it is started.
 
-        @param response: dict - http://facebook.github.io/graphql/October2016/#sec-Response-Format
+        @param id: str - subscription id
         """
-        self.prepare_for_new_request()
-        content = json.dumps(response)
+        subscription = self.subscriptions.pop(id, None)
+        if subscription is None:
+            return  # unknown, or subscribe() will see it is gone
 
-        http_response = HTTP_RESPONSE.format(
-            content_length=len(content),
-            content=content,
-            date=datetime.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S'),
-        )
+        if isinstance(subscription, SubscriptionGroup):
+            subscription.remove(self, id)
+        else:
+            subscription.cancel()
+
+        if self.servers.metrics:
+            self.servers.metrics.inc('subscriptions_active', -1)
+
+    ### send
+
+    def get_next_prefix(self, id):
+        """
+        @param id: str - subscription id
+        @return prefix: bytes - of message with payload serialized once for all subscribers of SubscriptionGroup
+        """
+        return b'{"type":"' + (b'data' if self.is_legacy else b'next') + b'","id":' + self.servers.json_codec.dumps(id) + b',"payload":'
+
+    def send_complete(self, id):
+        self.send_message({'type': 'complete', 'id': id})
+
+    def send_error(self, id, errors):
+        """
+        @param id: str - subscription id
+        @param errors: list - formatted GraphQL errors
+        """
+        self.send_message({'type': 'error', 'id': id, 'payload': errors})
+
+    def send_message(self, message):
+        """
+        @param message: dict - of GraphQL over WebSocket protocol
+        """
+        self.send_parts([self.servers.json_codec.dumps(message)])
+
+    def send_parts(self, parts, id=None, opcode=1):
+        """
+        Send WebSocket frame, or put it to the queue while writing is paused.
+
+        When the queue is full, events of subscriptions are dropped,
+        or with subscription_overflow='coalesce' the latest event replaces the queued one of the same subscription.
+        Other messages are never dropped.
+
+        @param parts: list of bytes - payload of frame, sent with writelines() to avoid copying
+        @param id: str or None - subscription id, if it is an event that may be dropped or coalesced
+        @param opcode: int - text by default
+        """
+        if self.transport.is_closing():
+            return
+
+        parts.insert(0, get_websocket_frame_header(sum(len(part) for part in parts), opcode))
+
+        if not self.is_writing_paused and not self.queue:
+            self.transport.writelines(parts)  # may call pause_writing() synchronously
+            return
+
+        if self.queue is None:
+            self.queue = OrderedDict()
+
+        if id is not None:
+            is_coalescing = self.servers.subscription_overflow == 'coalesce'
+            if is_coalescing and id in self.queue or len(self.queue) >= self.servers.subscription_queue_size:
+                if self.servers.metrics:
+                    self.servers.metrics.inc('subscription_events_dropped_total')
+                if not is_coalescing or id not in self.queue:
+                    return
+
+            if is_coalescing:
+                self.queue[id] = parts  # keeps its place in the queue
+                return
+
+        self.queue[object()] = parts
+
+    ### close
+
+    def close(self, code, reason=''):
+        """
+        Send close frame and close connection.
+
+        @param code: int - e.g. 1000 for normal closure, 4400 for invalid message
+        @param reason: str
+        """
+        if self.transport.is_closing():
+            return
 
-        self.transport.write(http_response.encode())
+        payload = code.to_bytes(2, 'big') + reason.encode()
+        self.transport.write(get_websocket_frame_header(len(payload), 8) + payload)
+        self.transport.close()
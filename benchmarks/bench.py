@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Load generator and benchmark suite of aiographql server.
+
+Each scenario starts the server in a separate process, so the load generator does not compete with it for the loop,
+then keeps connections busy with requests for the given duration,
+optionally pipelined, over keep-alive TCP or Unix socket connections.
+
+Results are saved as JSON and compared against the stored baseline to catch regressions before release:
+
+    python benchmarks/bench.py --output /tmp/bench.json --baseline benchmarks/baseline.json
+
+Baseline is specific to the machine, so refresh it on the machine that runs the comparison:
+
+    python benchmarks/bench.py --output benchmarks/baseline.json
+"""
+
+### import
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import graphene
+import uvloop
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import aiographql  # noqa: E402 - from this repo, not from site-packages
+
+### schemas
+
+class User(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String()
+    friends = graphene.List(lambda: User)
+
+    def resolve_friends(self, info):
+        return [User(id=int(self.id) * 10 + index, name='Friend') for index in range(10)]
+
+class Item(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    title = graphene.String()
+    price = graphene.Float()
+
+class Query(graphene.ObjectType):
+    hello = graphene.String()
+    users = graphene.List(User, count=graphene.Int())
+    items = graphene.List(Item, count=graphene.Int())
+    broken = graphene.String()
+    echo = graphene.Int(payload=graphene.List(graphene.String))
+
+    def resolve_hello(self, info):
+        return 'Hello'
+
+    def resolve_users(self, info, count):
+        return [User(id=index, name='User') for index in range(count)]
+
+    def resolve_items(self, info, count):
+        return [Item(id=index, title='Item {}'.format(index), price=index * 1.5) for index in range(count)]
+
+    def resolve_broken(self, info):
+        raise ValueError('Broken')
+
+    def resolve_echo(self, info, payload):
+        return len(payload)
+
+
+schema = graphene.Schema(query=Query, mutation=None)
+
+SCENARIOS = {
+    # name: GraphQL request
+    'trivial': {'query': '{hello}'},
+    'n_plus_one': {'query': '{users(count: 20) {id name friends {id name}}}'},
+    'large_list': {'query': '{items(count: 1000) {id title price}}'},
+    'errors': {'query': '{a: broken b: broken c: broken d: broken e: broken hello}'},
+    'big_body': {'query': 'query Echo($payload: [String]) {echo(payload: $payload)}', 'variables': {'payload': ['x' * 100] * 2000}},
+}
+
+### server
+
+def run_server(endpoint, connection, serve_kwargs, trace_allocations=False):
+    """
+    Serve requests in separate process until terminated,
+    and answer "start" and "stop" commands from the load generator with stats of this process.
+
+    @param endpoint: dict - as defined in aiographql.serve()
+    @param connection: multiprocessing.connection.Connection - to receive commands and to send stats
+    @param serve_kwargs: dict - extra kwargs of aiographql.serve()
+    @param trace_allocations: bool - trace memory allocated by Python while measuring, slows the server down a few times
+    """
+    asyncio.set_event_loop(None)  # loop of parent process is not used after fork
+    logging.getLogger('graphql').setLevel(logging.CRITICAL)  # traceback of each resolver error would flood the output
+    servers = aiographql.serve(schema, listen=[endpoint], run=False, exception_handler=lambda loop, context: None, **serve_kwargs)
+    loop = asyncio.get_event_loop()
+    started = {}
+
+    def on_command():
+        command = connection.recv()
+        if command == 'start':
+            started.update(get_process_stats())
+            if trace_allocations:
+                tracemalloc.start()
+            connection.send(None)
+
+        elif command == 'stop':
+            stats = dict(traced_peak_mb=None)
+            if trace_allocations:
+                stats['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+                tracemalloc.stop()
+
+            stopped = get_process_stats()
+            stats.update(
+                max_rss_mb=round(stopped['max_rss_kb'] / 1024, 1),
+                gc_collections=stopped['gc_collections'] - started['gc_collections'],
+                allocated_blocks_delta=stopped['allocated_blocks'] - started['allocated_blocks'],
+            )
+            connection.send(stats)
+
+    loop.add_reader(connection.fileno(), on_command)
+    loop.run_until_complete(servers.serving)
+
+def get_process_stats():
+    """
+    @return stats: dict - of this process:
+        max_rss_kb: int - peak resident set size
+        gc_collections: int - of generation 0, each is triggered by gc.get_threshold()[0] more container allocations than deallocations,
+            e.g. objects in reference cycles, that are not freed until collected
+        allocated_blocks: int - memory blocks currently allocated by Python, growing with leaks
+    """
+    return dict(
+        max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        gc_collections=gc.get_stats()[0]['collections'],
+        allocated_blocks=sys.getallocatedblocks(),
+    )
+
+### load generator
+
+class ClientConnection(asyncio.Protocol):
+    """
+    Keep-alive connection sending the same request again once a response is received, with up to "pipeline" requests in flight.
+
+    Load starts only once server answers the handshake request on this connection, see generate_load().
+    """
+
+    def __init__(self, request, pipeline, latencies, errors, is_running):
+        """
+        @param request: bytes - raw HTTP request
+        @param pipeline: int - max number of requests in flight
+        @param latencies: list - to append latency of each response in seconds
+        @param errors: list - to append latency of each response with errors, shared by connections
+        @param is_running: callable(): bool - False to stop sending new requests
+        """
+        self.request = request
+        self.pipeline = pipeline
+        self.latencies = latencies
+        self.errors = errors
+        self.is_running = is_running
+        self.sent_at = []
+        self.buffer = bytearray()
+        self.content_length = None
+        loop = asyncio.get_event_loop()
+        self.accepted = loop.create_future()
+        self.closed = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.transport.write(HANDSHAKE_REQUEST)
+
+    def start(self):
+        for index in range(self.pipeline):
+            self.send()
+
+    def send(self):
+        self.sent_at.append(time.perf_counter())
+        self.transport.write(self.request)
+
+    def data_received(self, chunk):
+        self.buffer += chunk
+        while True:
+            if self.content_length is None:
+                end_of_headers_index = self.buffer.find(b'\r\n\r\n')
+                if end_of_headers_index == -1:
+                    return
+
+                match = aiographql.CONTENT_LENGTH_RE.search(self.buffer, 0, end_of_headers_index)
+                self.content_length = int(match.group(1))
+                del self.buffer[:end_of_headers_index + 4]
+
+            if len(self.buffer) < self.content_length:
+                return
+
+            content = bytes(self.buffer[:self.content_length])
+            del self.buffer[:self.content_length]
+            self.content_length = None
+            self.on_response(content)
+
+    def on_response(self, content):
+        if not self.accepted.done():
+            self.accepted.set_result(None)  # response to HANDSHAKE_REQUEST
+            return
+
+        latency = time.perf_counter() - self.sent_at.pop(0)
+        self.latencies.append(latency)
+        if b'"errors":' in content:
+            self.errors.append(latency)
+
+        if self.is_running():
+            self.send()
+        elif not self.sent_at:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+def format_request(request, host='localhost'):
+    """
+    @param request: dict - GraphQL request
+    @return request: bytes - raw HTTP request
+    """
+    content = json.dumps(request).encode()
+    return b'POST /graphql HTTP/1.1\r\nHost: %b\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%b' % (
+        host.encode(), len(content), content)
+
+
+HANDSHAKE_REQUEST = format_request({'query': '{__typename}'})
+
+async def generate_load(endpoint, request, connections, pipeline, duration, warmup, control):
+    """
+    @param endpoint: dict - as defined in aiographql.serve()
+    @param request: dict - GraphQL request
+    @param connections: int - number of concurrent keep-alive connections
+    @param pipeline: int - max number of requests in flight per connection
+    @param duration: float - seconds to measure
+    @param warmup: float - seconds to send requests before measuring
+    @param control: multiprocessing.connection.Connection - to send "start" and "stop" commands to server process
+    @return result: dict - RPS, latency percentiles and rate of responses with errors
+    """
+    loop = asyncio.get_event_loop()
+    raw_request = format_request(request)
+    latencies = []
+    errors = []
+    stop_at = None
+
+    def is_running():
+        return loop.time() < stop_at
+
+    def factory():
+        return ClientConnection(raw_request, pipeline, latencies, errors, is_running)
+
+    clients = []
+    for index in range(connections):
+        if endpoint['protocol'] == 'tcp':
+            transport, client = await loop.create_connection(factory, endpoint.get('host', 'localhost'), endpoint['port'])
+        else:
+            transport, client = await loop.create_unix_connection(factory, endpoint['path'])
+        clients.append(client)
+
+    # Busy server accepts one connection per iteration of its loop, so connections waiting in the backlog
+    # would starve behind heavy requests of accepted ones - all connections are accepted before the load starts.
+    await asyncio.wait_for(asyncio.gather(*[client.accepted for client in clients]), 30)
+    stop_at = loop.time() + warmup + duration
+    for client in clients:
+        client.start()
+
+    await asyncio.sleep(warmup)
+    await loop.run_in_executor(None, lambda: (control.send('start'), control.recv()))
+    del latencies[:]
+    del errors[:]
+    started_at = time.perf_counter()
+
+    await asyncio.sleep(max(0, stop_at - loop.time()))
+    seconds = time.perf_counter() - started_at
+    count, error_count = len(latencies), len(errors)
+    await asyncio.wait_for(asyncio.gather(*[client.closed for client in clients]), 30)
+
+    latencies.sort()
+    return dict(
+        requests=count,
+        error_rate=round(error_count / count, 3) if count else None,
+        rps=round(count / seconds, 1),
+        p50_ms=get_percentile(latencies, 0.5),
+        p99_ms=get_percentile(latencies, 0.99),
+        p999_ms=get_percentile(latencies, 0.999),
+    )
+
+def get_percentile(latencies, fraction):
+    """
+    @param latencies: list - sorted, in seconds
+    @param fraction: float - e.g. 0.99
+    @return milliseconds: float or None
+    """
+    if not latencies:
+        return None
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 3)
+
+### run
+
+def run_scenario(name, endpoint, connections=32, pipeline=1, duration=5.0, warmup=1.0, serve_kwargs=None, trace_allocations=False):
+    """
+    @param name: str - key of SCENARIOS
+    @param endpoint: dict - as defined in aiographql.serve()
+    @param connections, pipeline, duration, warmup: as defined in generate_load()
+    @param serve_kwargs: dict or None - extra kwargs of aiographql.serve()
+    @param trace_allocations: bool - as defined in run_server()
+    @return result: dict - as returned by generate_load(), plus stats of server process:
+        max_rss_mb: float - peak resident set size
+        gc_collections_per_1k_requests: float - see get_process_stats()
+        allocated_blocks_delta: int - memory blocks allocated by Python after measuring minus before, growing with leaks
+        traced_peak_mb: float or None - peak memory allocated by Python while measuring, if trace_allocations
+    """
+    control, connection = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=run_server, args=(endpoint, connection, serve_kwargs or {}, trace_allocations), daemon=True)
+    server.start()
+    try:
+        loop = asyncio.get_event_loop()
+        wait_for_endpoint(loop, endpoint)
+        result = loop.run_until_complete(generate_load(endpoint, SCENARIOS[name], connections, pipeline, duration, warmup, control))
+
+        control.send('stop')
+        stats = control.recv()
+        gc_collections = stats.pop('gc_collections')
+        result.update(stats, gc_collections_per_1k_requests=round(gc_collections * 1000 / result['requests'], 2) if result['requests'] else None)
+        return result
+
+    finally:
+        server.terminate()
+        server.join()
+
+def wait_for_endpoint(loop, endpoint, timeout=10):
+    """
+    Wait until server process starts listening.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if endpoint['protocol'] == 'tcp':
+                coro = asyncio.open_connection(endpoint.get('host', 'localhost'), endpoint['port'])
+            else:
+                coro = asyncio.open_unix_connection(endpoint['path'])
+            reader, writer = loop.run_until_complete(coro)
+            writer.close()
+            return
+
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+def run(scenarios=None, protocol='unix', connections=32, pipeline=1, duration=5.0, warmup=1.0, trace_allocations=False):
+    """
+    @param scenarios: list or None - names of SCENARIOS, None for all
+    @param protocol: str - 'unix' or 'tcp'
+    @param connections, pipeline, duration, warmup: as defined in generate_load()
+    @param trace_allocations: bool - as defined in run_server()
+    @return results: dict - ready to be saved as JSON
+    """
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    endpoint = dict(protocol='tcp', port=25199) if protocol == 'tcp' else dict(protocol='unix', path='/tmp/aiographql-bench')
+
+    return dict(
+        meta=dict(
+            aiographql=aiographql.__version__,
+            python=platform.python_version(),
+            platform=platform.platform(),
+            protocol=protocol,
+            connections=connections,
+            pipeline=pipeline,
+            duration=duration,
+            trace_allocations=trace_allocations,
+        ),
+        scenarios={
+            name: run_scenario(name, endpoint, connections, pipeline, duration, warmup, trace_allocations=trace_allocations)
+            for name in scenarios or SCENARIOS
+        },
+    )
+
+### compare
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Find regressions against baseline: lower RPS or higher p99 latency, beyond tolerance.
+
+    @param results: dict - as returned by run()
+    @param baseline: dict - as returned by run() before
+    @param tolerance: float - e.g. 0.2 for 20%, latency of short runs is noisy
+    @return regressions: list of str - empty if there are no regressions
+    """
+    regressions = []
+    for name, result in sorted(results['scenarios'].items()):
+        expected = baseline['scenarios'].get(name)
+        if not expected:
+            continue
+
+        if result['rps'] < expected['rps'] * (1 - tolerance):
+            regressions.append('{}: rps {} < baseline {}'.format(name, result['rps'], expected['rps']))
+
+        if result['p99_ms'] is not None and expected['p99_ms'] is not None and result['p99_ms'] > expected['p99_ms'] * (1 + tolerance):
+            regressions.append('{}: p99_ms {} > baseline {}'.format(name, result['p99_ms'], expected['p99_ms']))
+
+        if result['error_rate'] is None or abs(result['error_rate'] - (expected['error_rate'] or 0)) > 0.01:
+            regressions.append('{}: error_rate {} != baseline {}'.format(name, result['error_rate'], expected['error_rate']))
+
+    return regressions
+
+### main
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark aiographql server')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='default: all')
+    parser.add_argument('--protocol', choices=['unix', 'tcp'], default='unix')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--pipeline', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--trace-allocations', action='store_true', help='report peak memory allocated by Python, slower')
+    parser.add_argument('--output', help='path to save results as JSON')
+    parser.add_argument('--baseline', help='path to results saved before, to exit with code 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run(args.scenario, args.protocol, args.connections, args.pipeline, args.duration, args.warmup, args.trace_allocations)
+    print(json.dumps(results, indent=4, sort_keys=True))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: ' + regression, file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
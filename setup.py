@@ -19,12 +19,18 @@ setup(
 * `graphql <http://graphql.org/>`_ - all you need and nothing more in one request +auto docs of your api
 * `uvloop, protocol <https://github.com/MagicStack/uvloop#performance>`_ - `top performance <https://magic.io/blog/uvloop-blazing-fast-python-networking/>`_
 * minimal http - unlike REST frameworks that are waste of time for ``/graphql`` endpoint
+* ``GET`` requests cacheable by CDN and browsers - ``ETag``, ``304 Not Modified``, and ``Cache-Control: max-age`` from hints like ``@aiographql.cache_control(max_age=60)`` decorating resolvers
+* ``@defer`` and ``@stream`` - initial part of response is sent at once, the rest as ``multipart/mixed`` parts, if client accepts them and schema is created with ``graphene.Schema(..., directives=aiographql.DIRECTIVES)``
+* subscriptions over WebSocket - each event of ``aiographql.Topic`` is executed and serialized once per group of subscribers, slow clients get the latest events coalesced, or dropped
+* blocking or CPU-heavy resolvers decorated with ``@aiographql.offload()`` run in thread or process pool, so other requests of the loop are not stalled, and ``LoopMonitor`` finds resolvers to offload
+* zero-downtime deploys - graceful drain on ``SIGTERM``, listening sockets handed off to new process on ``SIGHUP``, and ``servers.swap_schema(schema)`` without restart
+* pluggable JSON codec working on bytes - orjson is used automatically, if installed
 * pluggable context - for auth, logging, etc
 * exception handling - at all levels, with default or custom handler
 
 **Usage**::
 
-    pip install aiographql
+    pip install 'aiographql[orjson]'
 
     cat <<'END' >serve.py
     import asyncio, aiographql, graphene
@@ -71,7 +77,7 @@ See `more examples and tests <https://github.com/academicmerit/aiographql/tree/m
 
     import aiographql; help(aiographql.serve)
 
-    serve(schema, listen, get_context=None, exception_handler=None, enable_uvloop=True, run=True)
+    serve(schema, listen, get_context=None, exception_handler=None, enable_uvloop=True, run=True, query_cache_size=1000, persisted_queries=None, persisted_queries_only=False, workers=None, executor_factory=None, compression_min_size=1024, compression_level=6, compression_thread_min_size=65536, max_requests=10000, max_requests_per_connection=100, write_buffer_limits=None, max_batch_size=100, batch_concurrency=10, data_loaders=None, response_cache=None, get_cache_scope=None, metrics=None, tracing=None, max_depth=None, max_nodes=None, max_cost=None, list_size=10, max_header_size=65536, max_body_size=10485760, header_timeout=10.0, body_timeout=60.0, keep_alive_timeout=60.0, streaming_min_size=1048576, streaming_chunk_size=65536, pubsub=None, subscription_queue_size=100, subscription_overflow='coalesce', http_parser_factory=None, offload_threads=None, offload_processes=None, loop_monitor=None, drain_timeout=30.0, json_codec=None)
         Configure the stack and start serving requests
 
 * ``schema``: ``graphene.Schema`` - GraphQL schema to serve
@@ -80,7 +86,15 @@ See `more examples and tests <https://github.com/academicmerit/aiographql/tree/m
     * ``dict(protocol='tcp', port=25100, ...)`` - `create_server() docs <https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.create_server>`_
     * ``dict(protocol='unix', path='/tmp/worker0', ...)`` - `create_unix_server() docs <https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.create_unix_server>`_
 
-* ``get_context``: ``None`` or ``[async] callable(loop, context: dict): mixed`` - to produce GraphQL context like auth from input unified with ``exception_handler()``
+* ``get_context``: ``None`` or ``[async] callable(loop, context: dict): mixed`` - to produce GraphQL context like auth from input unified with ``exception_handler()`` +
+
+   * ``data_loaders``: ``dict`` - ``DataLoader``-s created for this request, if ``data_loaders`` are configured below
+   * ``method``: ``str`` - HTTP method, e.g. ``POST``
+   * ``path``: ``str`` - HTTP path without query string, e.g. ``/graphql``
+   * ``http_headers``: ``dict`` - HTTP headers with names in lower case
+   * ``keep_alive``: ``bool`` - ``False`` if connection is closed after this request, e.g. ``Connection: close`` or HTTP/1.0
+   * ``connection_params``: payload of ``connection_init`` message, for subscriptions over WebSocket
+
 * ``exception_handler``: ``None`` or ``callable(loop, context: dict)`` - default or custom exception handler as defined in `the docs <https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.set_exception_handler>`_ +
 
    * ``headers``: ``bytes`` or ``None`` - HTTP headers, if known
@@ -88,7 +102,66 @@ See `more examples and tests <https://github.com/academicmerit/aiographql/tree/m
 
 * ``enable_uvloop``: ``bool`` - enable uvloop for top performance, unless you have a better loop
 * ``run``: ``bool`` - if ``True``, run the loop; ``False`` is good for tests
-* return ``servers``: ``Servers`` - ``await servers.close()`` to close listening sockets - good for tests
+* ``query_cache_size``: ``int`` - how many parsed and validated GraphQL documents to keep in LRU cache, ``0`` to disable the cache, see ``servers.query_cache.hits`` and ``.misses``
+* ``persisted_queries``: ``None`` or ``PersistedQueries`` - store of `Automatic Persisted Queries <https://github.com/apollographql/apollo-link-persisted-queries#protocol>`_:
+
+    * ``None`` - in-memory LRU store of 1000 queries
+    * ``PersistedQueries.load(path)`` - queries from manifest built at deploy time
+    * or custom store with the same interface, e.g. shared by workers
+
+* ``persisted_queries_only``: ``bool`` - if ``True``, serve only queries found in ``persisted_queries`` store, good for allow-list
+* ``workers``: ``None`` or ``int`` - number of worker processes to fork, each with its own loop, to use all CPU cores:
+
+    * ``dict(protocol='tcp', ...)`` endpoints are shared by workers with ``reuse_port=True``
+    * ``dict(protocol='unix', path='/tmp/worker{worker}', ...)`` endpoints get ``path`` formatted with worker index, ``ValueError`` is raised if ``path`` has no ``{worker}``, as workers would bind the same path over each other
+    * crashed workers are restarted, ``SIGTERM`` and ``SIGINT`` are passed to workers to close listening sockets and exit
+
+* ``executor_factory``: ``None`` or ``callable(loop): executor`` - to create GraphQL executor shared by all requests in this loop, ``None`` - ``SharedAsyncioExecutor``
+* ``compression_min_size``: ``int`` or ``None`` - compress responses of this size or bigger with ``br`` or ``gzip`` as negotiated by ``Accept-Encoding`` request header, ``None`` to disable compression, ``br`` needs ``pip install brotli``
+* ``compression_level``: ``int`` - ``1-9`` for ``gzip``, the same value is used as quality of ``br``
+* ``compression_thread_min_size``: ``int`` - compress responses of this size or bigger in thread pool of the loop, to avoid blocking other connections
+* ``max_requests``: ``int`` - max number of requests in flight in this loop, new requests get fast error response, see ``servers.requests_in_flight`` and ``.requests_shed``
+* ``max_requests_per_connection``: ``int`` - max number of pipelined requests in flight per connection, reading from connection is paused until responses are sent
+* ``write_buffer_limits``: ``None`` or ``dict(high=int, low=int)`` - write buffer watermarks of each connection as defined in `the docs <https://docs.python.org/3/library/asyncio-protocol.html#asyncio.WriteTransport.set_write_buffer_limits>`_, once ``high`` is reached, both reading from connection and writing to it are paused until ``low`` is reached
+* ``max_batch_size``: ``int`` - max number of GraphQL requests in a batch sent as JSON array, responses are sent as JSON array too
+* ``batch_concurrency``: ``int`` - max number of GraphQL requests of a batch executed concurrently
+* ``data_loaders``: ``None`` or ``dict(name=[async] callable(keys: list): list or dict(batch_load=..., cache=bool, max_batch_size=int), ...)`` - to create ``DataLoader``-s for each request, passed to ``get_context()`` as ``data_loaders``, or used as GraphQL context ``dict(data_loaders=...)`` if ``get_context`` is ``None``
+* ``response_cache``: ``None`` or ``ResponseCache`` - to cache serialized responses to query operations without errors, ``None`` to disable:
+
+    * ``ResponseCache(ttl=1.0, max_size=64 * 1024 * 1024)`` - in-memory LRU cache limited by total size in bytes
+    * or custom store with the same interface, e.g. shared by workers
+    * concurrent identical requests that miss the cache are executed once
+    * compressed content of cache hits is cached too, so hits are not compressed again
+
+* ``get_cache_scope``: ``None`` or ``[async] callable(context: mixed): str or None`` - scope key of ``response_cache`` from GraphQL context, e.g. user id for responses that depend on auth, or ``None`` to bypass the cache, ``None`` - responses are shared by all clients
+* ``metrics``: ``None`` or ``Metrics`` - e.g. ``Metrics(listen=[dict(protocol='tcp', port=25101)])`` to serve metrics in Prometheus text format, aggregated across ``workers``, ``None`` to disable metrics: time to parse request, of ``get_context()``, to execute and to serialize, request and response sizes, open connections, requests in flight, errors by kind
+* ``tracing``: ``None`` or ``Tracing`` - e.g. ``Tracing(header='X-Tracing', sample_rate=0.01, slow_query_seconds=1.0, top_fields=5)`` to time each resolver:
+
+    * requests with the header get `Apollo tracing extension <https://github.com/apollographql/apollo-tracing#response-format>`_ in response
+    * sampled requests slower than ``slow_query_seconds`` are reported with ``operationName``, digest of variables and top fields by time to exception handler, if it is set, or to ``aiographql`` logger
+    * unsampled requests are executed without tracing middleware at all
+
+* ``max_depth``: ``int`` or ``None`` - max depth of fields in operation, ``None`` for no limit
+* ``max_nodes``: ``int`` or ``None`` - max number of fields in operation with fragments expanded, ``None`` for no limit
+* ``max_cost``: ``float`` or ``None`` - max sum of weights of fields, multiplied by list sizes of parent fields, ``None`` for no limit, weight is ``1`` unless declared by ``@aiographql.cost(weight=..., list_size=...)`` decorator of resolver
+* ``list_size``: ``int`` - expected max length of lists, unless declared by ``cost()`` decorator, operation over any limit is rejected before execution, the analysis is cached alongside parsed document
+* ``max_header_size``: ``int`` - max size of HTTP request headers in bytes
+* ``max_body_size``: ``int`` - max ``Content-Length`` of HTTP request in bytes, checked before the body is buffered
+* ``header_timeout``: ``float`` - seconds to receive HTTP request headers since their first byte, or WebSocket ``connection_init`` message since upgrade
+* ``body_timeout``: ``float`` - seconds to receive HTTP request body since its headers are received, or each WebSocket frame since its first byte
+* ``keep_alive_timeout``: ``float`` - seconds to wait for the next request on idle connection before closing it, request over any limit gets error response, and then connection is closed, idle connection is closed silently
+* ``streaming_min_size``: ``int`` or ``None`` - stream response with ``Transfer-Encoding: chunked`` as it is serialized, if its estimated size is this or bigger, ``None`` to disable streaming
+* ``streaming_chunk_size``: ``int`` - approximate size of chunks of streamed response, next chunk is serialized once transport write buffer drains below its "high" limit
+* ``pubsub``: ``None`` or ``PubSub`` - broker of subscription events, ``None`` - new ``PubSub()``, resolver of subscription field returns ``aiographql.Topic(name)`` to receive events of ``pubsub.publish(name, event)``, or async iterable of events, subscriptions are served over WebSocket at any path, with ``graphql-transport-ws`` or legacy ``graphql-ws`` protocol, if schema has subscription type, each event is executed and serialized once per group of subscribers with the same operation, variables and cache scope, see ``get_cache_scope``, if ``get_context`` is set without ``get_cache_scope``, subscribers are not grouped, as each event is executed with context of the first subscriber of the group
+* ``subscription_queue_size``: ``int`` - max number of events waiting for slow client per connection, and for execution per group of subscribers
+* ``subscription_overflow``: ``str`` - ``'coalesce'`` to replace waiting event of the same subscription with the latest one, or ``'drop'`` to drop new events once the queue is full, see ``subscription_events_dropped_total`` metric
+* ``http_parser_factory``: ``None`` or ``callable(protocol, max_header_size, max_body_size): parser`` - to create HTTP parser for each connection, ``None`` - ``HttpParser`` in pure Python, faster for usual requests as only headers that define framing are searched, ``HttptoolsParser`` - strict C parser with callback per header, needs ``pip install httptools``, both support ``Transfer-Encoding: chunked`` content, ``Expect: 100-continue``, ``Connection: close`` and HTTP/1.0
+* ``offload_threads``: ``int`` or ``None`` - max number of threads running resolvers marked by ``@aiographql.offload()``, ``None`` - default of ``ThreadPoolExecutor``
+* ``offload_processes``: ``int`` or ``None`` - max number of processes running resolvers marked by ``@aiographql.offload(pool='process')``, ``None`` - number of CPUs, each worker gets its own pools, created only if schema has resolvers marked for them
+* ``loop_monitor``: ``None`` or ``LoopMonitor`` - e.g. ``LoopMonitor(interval=0.1, lag_seconds=0.1, resolver_seconds=0.01, sample_rate=0.01)`` to report lag of the loop, and sync resolvers of sampled requests blocking it, candidates for ``offload()``, to exception handler or ``aiographql`` logger, lag is observed by ``loop_lag_seconds`` metric
+* ``drain_timeout``: ``float`` - seconds to finish requests in flight on ``SIGTERM`` or ``SIGINT``, see ``servers.drain()``, if ``serve(run=True)`` or ``workers``, ``SIGHUP`` starts new process with the same command line, and once it is listening, this process is drained: listening sockets are inherited by new process, or bound by its workers with ``reuse_port=True``, so no connection is refused
+* ``json_codec``: ``None`` or object with ``loads(bytes)`` and ``dumps(value): bytes`` methods - to parse requests and serialize responses, ``None`` - ``OrjsonCodec`` if ``pip install orjson``, the fastest one, with native support of ``datetime`` values and non-``str`` keys, else ``JsonCodec`` of stdlib with the same output, about 2x slower, so ``pip install 'aiographql[orjson]'`` is recommended, ``UjsonCodec`` is faster than ``JsonCodec``, if ``pip install ujson``, but serializes ``datetime`` values as Unix timestamps and ``None`` keys as ``"None"``
+* return ``servers``: ``Servers`` - ``await servers.close()`` to close listening sockets - good for tests, ``await servers.drain(timeout=30.0)`` to stop accepting connections, finish requests in flight and close connections, ``servers.swap_schema(schema)`` to serve new schema for the next requests of all connections, without restart, or ``None`` in supervisor process of ``workers``, once all workers exit
 ''',
     url='https://github.com/academicmerit/aiographql',
     author='Denis Ryzhkov',
@@ -107,5 +180,6 @@ See `more examples and tests <https://github.com/academicmerit/aiographql/tree/m
     py_modules=['aiographql'],
     python_requires='>=3.5',
     install_requires=requirements,
+    extras_require={'orjson': ['orjson']},
     tests_require=requirements_test,
 )
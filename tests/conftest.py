@@ -2,6 +2,7 @@
 ### import
 
 import asyncio
+import re
 
 import graphene
 import pytest
@@ -50,7 +51,7 @@ def unix_endpoint():
 def curl():
     return _curl
 
-async def _curl(endpoint, query, variables=None, operation_name=None, extra_headers=None):
+async def _curl(endpoint, query, variables=None, operation_name=None, extra_headers=None, extensions=None):
 
     ### format endpoint
 
@@ -87,6 +88,7 @@ async def _curl(endpoint, query, variables=None, operation_name=None, extra_head
             query=query,
             variables=variables,
             operationName=operation_name,
+            **(dict(extensions=extensions) if extensions else {})
         )),
     )
 
@@ -102,3 +104,71 @@ async def _curl(endpoint, query, variables=None, operation_name=None, extra_head
 
     assert stderr == b''
     return json.loads(stdout) if stdout else None
+
+### http
+
+@pytest.fixture
+def http():
+    return _http
+
+async def _http(endpoint, data, responses=1, timeout=5):
+    """
+    Send raw HTTP data, e.g. pipelined requests, and read raw HTTP responses - unlike curl() above.
+
+    @param timeout: float - seconds to wait for all responses
+    @return responses: list of tuple(headers: bytes, content: bytes)
+    """
+
+    ### connect
+
+    protocol = endpoint['protocol']
+
+    if protocol == 'tcp':
+        reader, writer = await asyncio.open_connection(endpoint.get('host', 'localhost'), endpoint['port'])
+
+    elif protocol == 'unix':
+        reader, writer = await asyncio.open_unix_connection(endpoint['path'])
+
+    else:
+        raise ValueError('Unsupported protocol={}'.format(repr(protocol)))
+
+    ### send and receive
+
+    writer.write(data)
+
+    async def receive():
+        results = []
+        for _ in range(responses):
+            headers = await reader.readuntil(b'\r\n\r\n')
+            match = re.search(br'\r\nContent-Length:\s*(\d+)', headers, re.IGNORECASE)
+            content_length = int(match.group(1)) if match else 0  # e.g. "304 Not Modified"
+            content = await reader.readexactly(content_length)
+            results.append((headers[:-4], content))
+        return results
+
+    try:
+        return await asyncio.wait_for(receive(), timeout)
+    finally:
+        writer.close()
+
+### http_request
+
+@pytest.fixture
+def http_request():
+    return _http_request
+
+def _http_request(query, variables=None, extra_headers=None):
+    """
+    Format raw HTTP request for http() above.
+
+    @return request: bytes
+    """
+    content = json.dumps(dict(query=query, variables=variables)).encode()
+    return b''.join([
+        b'POST / HTTP/1.1\r\n',
+        b'Host: localhost\r\n',
+        b'Content-Type: application/json\r\n',
+        b''.join(header.encode() + b'\r\n' for header in extra_headers or ()),
+        'Content-Length: {}\r\n\r\n'.format(len(content)).encode(),
+        content,
+    ])
@@ -0,0 +1,69 @@
+
+### import
+
+import asyncio
+
+import aiographql
+
+### test_query_cache
+
+def test_query_cache(schema, curl, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = [
+            await curl(unix_endpoint, '{me {id}}'),
+            await curl(unix_endpoint, '{me {id}}'),
+            await curl(unix_endpoint, '{me {name}}'),
+            await curl(unix_endpoint, '{me {password}}'),
+            await curl(unix_endpoint, '{me {password}}'),
+        ]
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+    assert results[:3] == [
+        {'data': {'me': {'id': '42'}}},
+        {'data': {'me': {'id': '42'}}},
+        {'data': {'me': {'name': 'John'}}},
+    ]
+    assert results[3] == results[4]
+    assert results[4]['errors'][0]['message'] == 'Cannot query field "password" on type "User".'
+
+    query_cache = servers.query_cache
+    assert (query_cache.hits, query_cache.misses) == (2, 3)
+    assert list(query_cache.documents) == ['{me {id}}', '{me {name}}', '{me {password}}']
+
+### test_query_cache_lru
+
+def test_query_cache_lru(schema):
+
+    query_cache = aiographql.QueryCache(schema, size=2)
+    query_cache.get('{me {id}}')
+    query_cache.get('{me {name}}')
+    query_cache.get('{me {id}}')
+    query_cache.get('{me {friends {id}}}')
+    assert list(query_cache.documents) == ['{me {id}}', '{me {friends {id}}}']
+
+    document_ast, errors = query_cache.get('{me')
+    assert document_ast is None
+    assert len(errors) == 1
+
+### test_query_cache_disabled
+
+def test_query_cache_disabled(schema, curl, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], query_cache_size=0, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = [await curl(unix_endpoint, '{me {id}}') for _ in range(2)]
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+    assert results == [{'data': {'me': {'id': '42'}}}] * 2
+    assert (servers.query_cache.hits, servers.query_cache.misses) == (0, 2)
+    assert not servers.query_cache.documents
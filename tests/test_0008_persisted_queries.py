@@ -0,0 +1,77 @@
+
+### import
+
+import asyncio
+import hashlib
+
+import aiographql
+import ujson as json
+
+### const
+
+QUERY = '{me {id}}'
+SHA256_HASH = hashlib.sha256(QUERY.encode()).hexdigest()
+EXTENSIONS = {'persistedQuery': {'version': 1, 'sha256Hash': SHA256_HASH}}
+
+NOT_FOUND = {'errors': [{'message': 'PersistedQueryNotFound', 'extensions': {'code': 'PERSISTED_QUERY_NOT_FOUND'}}]}
+
+### test_automatic_persisted_queries
+
+def test_automatic_persisted_queries(schema, curl, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = [
+            await curl(unix_endpoint, None, extensions=EXTENSIONS),
+            await curl(unix_endpoint, QUERY, extensions=EXTENSIONS),
+            await curl(unix_endpoint, None, extensions=EXTENSIONS),
+            await curl(unix_endpoint, '{me {name}}', extensions=EXTENSIONS),
+        ]
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+    assert results == [
+        NOT_FOUND,
+        {'data': {'me': {'id': '42'}}},
+        {'data': {'me': {'id': '42'}}},
+        {'errors': [{'message': 'provided sha does not match query', 'extensions': {'code': 'BAD_REQUEST'}}]},
+    ]
+    assert servers.persisted_queries.queries == {SHA256_HASH: QUERY}
+
+### test_persisted_queries_only
+
+def test_persisted_queries_only(schema, curl, unix_endpoint, tmpdir):
+
+    path = str(tmpdir.join('manifest.json'))
+    with open(path, 'w') as f:
+        f.write(json.dumps({'format': 'apollo-persisted-query-manifest', 'version': 1, 'operations': [
+            {'id': SHA256_HASH, 'name': None, 'type': 'query', 'body': QUERY},
+        ]}))
+
+    persisted_queries = aiographql.PersistedQueries.load(path)
+    servers = aiographql.serve(schema, listen=[unix_endpoint], persisted_queries=persisted_queries, persisted_queries_only=True, run=False)
+    loop = asyncio.get_event_loop()
+
+    other_query = '{me {name}}'
+    other_extensions = {'persistedQuery': {'version': 1, 'sha256Hash': hashlib.sha256(other_query.encode()).hexdigest()}}
+
+    async def client():
+        results = [
+            await curl(unix_endpoint, None, extensions=EXTENSIONS),
+            await curl(unix_endpoint, other_query, extensions=other_extensions),
+            await curl(unix_endpoint, other_query),
+        ]
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+    assert results == [
+        {'data': {'me': {'id': '42'}}},
+        NOT_FOUND,
+        {'errors': [{'message': 'PersistedQueryNotSupported', 'extensions': {'code': 'PERSISTED_QUERY_NOT_SUPPORTED'}}]},
+    ]
+    assert persisted_queries.size is None
+    assert list(persisted_queries.queries) == [SHA256_HASH]
@@ -0,0 +1,38 @@
+
+### import
+
+import asyncio
+import time
+
+import aiographql
+import ujson as json
+
+### test
+
+def test_pipelining(schema, http, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    slow_query = 'query Sloth($seconds: Float) { slowDb(seconds: $seconds) }'
+
+    async def client():
+        started_at = time.perf_counter()
+        responses = await http(unix_endpoint, b''.join([
+            http_request(slow_query, {'seconds': 0.3}),
+            http_request('{me {id}}'),
+            http_request(slow_query, {'seconds': 0.1}),
+        ]), responses=3)
+        seconds = time.perf_counter() - started_at
+
+        await servers.close()
+        return responses, seconds
+
+    responses, seconds = loop.run_until_complete(client())
+    assert [json.loads(content) for headers, content in responses] == [
+        {'data': {'slowDb': True}},
+        {'data': {'me': {'id': '42'}}},
+        {'data': {'slowDb': True}},
+    ]
+    assert all(headers.startswith(b'HTTP/1.1 200 OK\r\n') for headers, content in responses)
+    assert 0.3 < seconds < 0.4  # concurrent, not 0.4
@@ -0,0 +1,56 @@
+
+### import
+
+import asyncio
+
+import aiographql
+import ujson as json
+
+### test
+
+def test_request_buffer(schema, http_request, unix_endpoint):
+
+    state = dict(chunks=0)
+    old_data_received = aiographql.ConnectionFromClient.data_received
+
+    def new_data_received(self, chunk):
+        state['chunks'] += 1
+        old_data_received(self, chunk)
+
+    aiographql.ConnectionFromClient.data_received = new_data_received
+
+    try:
+        servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+        loop = asyncio.get_event_loop()
+
+        data = http_request('{me {id}}') + http_request('{me {name}}') + http_request('{me {friends {id}}}')
+        piece_size = 7  # to split both END_OF_HEADERS and content between chunks
+
+        async def client():
+            reader, writer = await asyncio.open_unix_connection(unix_endpoint['path'])
+
+            for index in range(0, len(data), piece_size):
+                writer.write(data[index:index + piece_size])
+                await writer.drain()
+                await asyncio.sleep(0.001)  # to make each piece a separate chunk
+
+            contents = []
+            for _ in range(3):
+                headers = await reader.readuntil(b'\r\n\r\n')
+                content_length = int(headers.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+                contents.append(json.loads(await reader.readexactly(content_length)))
+
+            writer.close()
+            await servers.close()
+            return contents
+
+        contents = loop.run_until_complete(client())
+        assert contents == [
+            {'data': {'me': {'id': '42'}}},
+            {'data': {'me': {'name': 'John'}}},
+            {'data': {'me': {'friends': []}}},
+        ]
+        assert state['chunks'] > len(data) // piece_size // 2
+
+    finally:
+        aiographql.ConnectionFromClient.data_received = old_data_received
@@ -0,0 +1,67 @@
+
+### import
+
+import asyncio
+import os
+import signal
+import sys
+
+import aiographql
+import pytest
+
+### const
+
+SCRIPT = '''
+import os, sys
+import aiographql, graphene
+
+class Query(graphene.ObjectType):
+    pid = graphene.Int()
+
+    def resolve_pid(self, info):
+        return os.getpid()
+
+aiographql.serve(graphene.Schema(query=Query), listen=[dict(protocol='unix', path=sys.argv[1] + '{worker}')], workers=2)
+'''
+
+### test
+
+def test_workers(curl, unix_endpoint):
+
+    loop = asyncio.get_event_loop()
+    paths = [unix_endpoint['path'] + str(index) for index in range(2)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+    async def get_pid(path):
+        for _ in range(100):
+            if os.path.exists(path):
+                result = await curl(dict(protocol='unix', path=path), '{pid}')
+                if result:
+                    return result['data']['pid']
+            await asyncio.sleep(0.05)
+
+    async def client():
+        supervisor = await asyncio.create_subprocess_exec(sys.executable, '-c', SCRIPT, unix_endpoint['path'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+        pids = [await get_pid(path) for path in paths]
+
+        os.kill(pids[0], signal.SIGKILL)
+        os.remove(paths[0])
+        restarted_pid = await get_pid(paths[0])
+
+        supervisor.send_signal(signal.SIGTERM)
+        returncode = await asyncio.wait_for(supervisor.wait(), 5)
+        return pids, restarted_pid, returncode
+
+    pids, restarted_pid, returncode = loop.run_until_complete(client())
+    assert all(pids) and len(set(pids)) == 2
+    assert restarted_pid and restarted_pid not in pids
+    assert returncode == 0
+
+def test_workers_unix_path(schema, unix_endpoint):
+    with pytest.raises(ValueError) as e:
+        aiographql.serve(schema, listen=[unix_endpoint], workers=2)
+    assert 'should contain "{worker}"' in str(e.value)
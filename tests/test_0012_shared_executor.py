@@ -0,0 +1,62 @@
+
+### import
+
+import asyncio
+import gc
+import resource
+
+import aiographql
+
+### const
+
+REQUESTS = 100 * 1000
+PIPELINED = 1000
+
+### test
+
+def test_shared_executor_memory(schema, http, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    data = http_request('query Sloth($seconds: Float) { slowDb(seconds: $seconds) }', {'seconds': 0}) * PIPELINED
+
+    async def client():
+        max_rss = []
+        for index in range(REQUESTS // PIPELINED):
+            responses = await http(unix_endpoint, data, responses=PIPELINED, timeout=30)
+            assert responses[-1][1] == b'{"data":{"slowDb":true}}'
+
+            if index in (9, REQUESTS // PIPELINED - 1):
+                gc.collect()
+                max_rss.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)  # KB on Linux
+
+        await servers.close()
+        return max_rss
+
+    max_rss = loop.run_until_complete(client())
+    assert max_rss[1] - max_rss[0] < 10 * 1024
+    assert isinstance(servers.executor, aiographql.SharedAsyncioExecutor)
+    assert not servers.executor.futures
+
+### test_executor_factory
+
+def test_executor_factory(schema, curl, unix_endpoint):
+
+    executors = []
+
+    def executor_factory(loop):
+        executors.append(aiographql.SharedAsyncioExecutor(loop))
+        return executors[-1]
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], executor_factory=executor_factory, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        result = await curl(unix_endpoint, 'query Sloth($seconds: Float) { slowDb(seconds: $seconds) }', {'seconds': 0})
+        await servers.close()
+        return result
+
+    result = loop.run_until_complete(client())
+    assert result == {'data': {'slowDb': True}}
+    assert executors == [servers.executor]
@@ -0,0 +1,149 @@
+
+### import
+
+import asyncio
+import zlib
+
+import aiographql
+import pytest
+import ujson as json
+
+### const
+
+QUERY = '{' + ' '.join('me{}: me {{id name}}'.format(index) for index in range(100)) + '}'  # about 3 KB response
+DATA = {'me{}'.format(index): {'id': '42', 'name': 'John'} for index in range(100)}
+
+### test_get_content_encoding
+
+def test_get_content_encoding():
+    get = aiographql.get_content_encoding
+    headers = b'POST / HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: {}\r\nAccept: */*'
+
+    assert get(b'POST / HTTP/1.1\r\nHost: localhost') is None
+    assert get(headers.replace(b'{}', b'gzip, deflate')) == b'gzip'
+    assert get(headers.replace(b'{}', b'deflate')) is None
+    assert get(headers.replace(b'{}', b'GZIP;q=0.5')) == b'gzip'
+    assert get(headers.replace(b'{}', b'gzip;q=0')) is None
+    assert get(headers.replace(b'{}', b'*, gzip;q=0.0')) == (b'br' if aiographql.brotli else None)
+    assert get(headers.replace(b'{}', b'gzip, deflate, br')) == (b'br' if aiographql.brotli else b'gzip')
+
+### test_compression
+
+@pytest.mark.parametrize('compression_thread_min_size', [65536, 0])
+def test_compression(schema, http, http_request, unix_endpoint, compression_thread_min_size):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], compression_thread_min_size=compression_thread_min_size, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        responses = await http(unix_endpoint, b''.join([
+            http_request(QUERY, extra_headers=['Accept-Encoding: gzip, deflate']),
+            http_request('{me {id}}', extra_headers=['Accept-Encoding: gzip, deflate']),
+            http_request(QUERY),
+        ]), responses=3)
+        await servers.close()
+        return responses
+
+    (headers, content), (small_headers, small_content), (plain_headers, plain_content) = loop.run_until_complete(client())
+
+    assert headers.endswith(b'\r\nVary: Accept-Encoding\r\nContent-Encoding: gzip')
+    assert json.loads(zlib.decompress(content, 16 + zlib.MAX_WBITS)) == {'data': DATA}
+    assert len(content) < len(plain_content) // 4
+
+    assert b'Content-Encoding' not in small_headers
+    assert json.loads(small_content) == {'data': {'me': {'id': '42'}}}
+
+    assert b'Content-Encoding' not in plain_headers
+    assert b'\r\nVary: Accept-Encoding' in plain_headers
+    assert json.loads(plain_content) == {'data': DATA}
+
+### test_compression_br
+
+def test_compression_br(schema, http, http_request, unix_endpoint):
+    brotli = pytest.importorskip('brotli')
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        responses = await http(unix_endpoint, http_request(QUERY, extra_headers=['Accept-Encoding: gzip, deflate, br']))
+        await servers.close()
+        return responses
+
+    [(headers, content)] = loop.run_until_complete(client())
+    assert headers.endswith(b'\r\nContent-Encoding: br')
+    assert json.loads(brotli.decompress(content)) == {'data': DATA}
+
+### test_compression_disabled
+
+def test_compression_disabled(schema, http, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], compression_min_size=None, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        responses = await http(unix_endpoint, http_request(QUERY, extra_headers=['Accept-Encoding: gzip, deflate']))
+        await servers.close()
+        return responses
+
+    [(headers, content)] = loop.run_until_complete(client())
+    assert b'Content-Encoding' not in headers
+    assert b'Vary' not in headers
+    assert json.loads(content) == {'data': DATA}
+
+### test_compression_response_cache
+
+@pytest.mark.parametrize('compression_thread_min_size', [65536, 0])
+def test_compression_response_cache(schema, http, http_request, unix_endpoint, monkeypatch, compression_thread_min_size):
+
+    compressed = []
+    compress = aiographql.compress
+    monkeypatch.setattr(aiographql, 'compress', lambda *args: compressed.append(args[1]) or compress(*args))
+
+    response_cache = aiographql.ResponseCache()
+    servers = aiographql.serve(schema, listen=[unix_endpoint], compression_thread_min_size=compression_thread_min_size,
+        response_cache=response_cache, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        responses = []
+        for _ in range(3):  # one by one, so the next request hits the cache
+            responses.extend(await http(unix_endpoint, http_request(QUERY, extra_headers=['Accept-Encoding: gzip, deflate'])))
+        responses.extend(await http(unix_endpoint, http_request(QUERY)))
+        await servers.close()
+        return responses
+
+    responses = loop.run_until_complete(client())
+    for headers, content in responses[:3]:
+        assert headers.endswith(b'\r\nVary: Accept-Encoding\r\nContent-Encoding: gzip')
+        assert json.loads(zlib.decompress(content, 16 + zlib.MAX_WBITS)) == {'data': DATA}
+    assert json.loads(responses[3][1]) == {'data': DATA}
+
+    assert response_cache.hits == 3
+    assert compressed == [b'gzip']  # hits reuse compressed content
+    assert response_cache.size == sum(len(content) for _, content in response_cache.responses.values()) + len(responses[0][1])
+
+### test_response_cache_compressed_size
+
+def test_response_cache_compressed_size():
+
+    response_cache = aiographql.ResponseCache(max_size=20)
+    response_cache.set('a', b'1234')
+    response_cache.set('b', b'1234')  # same content
+    response_cache.set_compressed(b'1234', b'gzip', b'12')
+    assert response_cache.get_compressed(b'1234', b'gzip') == b'12'
+    assert response_cache.get_compressed(b'1234', b'br') is None
+    assert response_cache.size == 10
+
+    response_cache.set('a', b'5678')
+    assert response_cache.get_compressed(b'1234', b'gzip') == b'12'  # still cached for "b"
+    response_cache.set('b', b'5678')
+    assert response_cache.get_compressed(b'1234', b'gzip') is None
+    assert response_cache.size == 8
+
+    response_cache.set_compressed(b'1234', b'gzip', b'12')  # not cached anymore
+    assert response_cache.size == 8
+    response_cache.set_compressed(b'5678', b'br', b'1' * 13)  # evicts "a"
+    assert response_cache.get('a') is None
+    assert response_cache.get('b') == b'5678'
+    assert response_cache.size == 17
@@ -0,0 +1,110 @@
+
+### import
+
+import asyncio
+import time
+
+import aiographql
+import ujson as json
+
+### const
+
+SLOW_QUERY = 'query Sloth($seconds: Float) { slowDb(seconds: $seconds) }'
+
+### test_max_requests_per_connection
+
+def test_max_requests_per_connection(schema, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], max_requests_per_connection=2, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        started_at = time.perf_counter()
+        reader, writer = await asyncio.open_unix_connection(unix_endpoint['path'])
+
+        for _ in range(4):
+            writer.write(http_request(SLOW_QUERY, {'seconds': 0.2}))
+            await writer.drain()
+            await asyncio.sleep(0.01)  # to make each request a separate chunk
+
+        contents = []
+        for _ in range(4):
+            headers = await reader.readuntil(b'\r\n\r\n')
+            content_length = int(headers.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+            contents.append(json.loads(await reader.readexactly(content_length)))
+
+        seconds = time.perf_counter() - started_at
+        writer.close()
+        await servers.close()
+        return contents, seconds
+
+    contents, seconds = loop.run_until_complete(client())
+    assert contents == [{'data': {'slowDb': True}}] * 4
+    assert 0.4 < seconds < 0.5  # two requests at a time
+    assert servers.requests_in_flight == 0
+
+### test_max_requests
+
+def test_max_requests(schema, curl, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], max_requests=1, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        slow = loop.create_task(curl(unix_endpoint, SLOW_QUERY, {'seconds': 0.5}))
+        await asyncio.sleep(0.2)
+        shed = await curl(unix_endpoint, '{me {id}}')
+        results = [await slow, shed, await curl(unix_endpoint, '{me {id}}')]
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+    assert results == [
+        {'data': {'slowDb': True}},
+        {'errors': [{'message': 'Server is overloaded, please retry later'}]},
+        {'data': {'me': {'id': '42'}}},
+    ]
+    assert servers.requests_shed == 1
+    assert servers.requests_in_flight == 0
+
+### test_write_buffer_limits
+
+def test_write_buffer_limits(schema, http_request, unix_endpoint):
+
+    protocols = []
+
+    def get_context(loop, context):
+        protocols.append(context['protocol'])
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], get_context=get_context,
+        compression_min_size=None, write_buffer_limits=dict(high=16 * 1024, low=4 * 1024), run=False)
+    loop = asyncio.get_event_loop()
+
+    query = '{' + ' '.join('me{}: me {{id name}}'.format(index) for index in range(100)) + '}'  # about 3 KB response
+    requests = 1000  # about 3 MB of responses - more than socket buffers
+
+    async def client():
+        reader, writer = await asyncio.open_unix_connection(unix_endpoint['path'], limit=1024 * 1024)
+        writer.write(http_request(query) * requests)
+
+        await asyncio.sleep(0.5)  # slow reader
+        protocol = protocols[0]
+        state = dict(
+            is_reading_paused=protocol.is_reading_paused,
+            is_writing_paused=protocol.is_writing_paused,
+            write_buffer_size=protocol.transport.get_write_buffer_size(),
+        )
+
+        for _ in range(requests):
+            headers = await reader.readuntil(b'\r\n\r\n')
+            content_length = int(headers.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+            await reader.readexactly(content_length)
+
+        writer.close()
+        await servers.close()
+        return state
+
+    state = loop.run_until_complete(client())
+    assert state['is_reading_paused'] and state['is_writing_paused']
+    assert state['write_buffer_size'] < 16 * 1024 + 4 * 1024  # "high" limit + one response
+    assert len(protocols) == requests
@@ -0,0 +1,89 @@
+
+### import
+
+import asyncio
+import time
+
+import aiographql
+import ujson as json
+
+### const
+
+SLOW_QUERY = 'query Sloth($seconds: Float) { slowDb(seconds: $seconds) }'
+
+### batch_request
+
+def batch_request(operations):
+    content = json.dumps(operations).encode()
+    return 'POST / HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n'.format(len(content)).encode() + content
+
+### test_batching
+
+def test_batching(schema, http, unix_endpoint):
+
+    contexts = []
+
+    def get_context(loop, context):
+        contexts.append(context)
+        return dict(jwt=None)
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], get_context=get_context, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        started_at = time.perf_counter()
+        [(headers, content)] = await http(unix_endpoint, batch_request([
+            dict(query=SLOW_QUERY, variables={'seconds': 0.3}),
+            dict(query='{me {id}}'),
+            dict(query='{me {password}}'),
+            dict(query=SLOW_QUERY, variables={'seconds': 0.2}),
+        ]))
+        seconds = time.perf_counter() - started_at
+        await servers.close()
+        return json.loads(content), seconds
+
+    result, seconds = loop.run_until_complete(client())
+    assert result[:2] == [
+        {'data': {'slowDb': True}},
+        {'data': {'me': {'id': '42'}}},
+    ]
+    assert result[2]['errors'][0]['message'] == 'Cannot query field "password" on type "User".'
+    assert result[3] == {'data': {'slowDb': True}}
+    assert 0.3 < seconds < 0.4  # concurrent
+    assert len(contexts) == 1
+
+### test_batch_concurrency
+
+def test_batch_concurrency(schema, http, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], batch_concurrency=1, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        started_at = time.perf_counter()
+        [(headers, content)] = await http(unix_endpoint, batch_request([
+            dict(query=SLOW_QUERY, variables={'seconds': 0.2}),
+            dict(query=SLOW_QUERY, variables={'seconds': 0.1}),
+        ]))
+        seconds = time.perf_counter() - started_at
+        await servers.close()
+        return json.loads(content), seconds
+
+    result, seconds = loop.run_until_complete(client())
+    assert result == [{'data': {'slowDb': True}}] * 2
+    assert 0.3 < seconds < 0.4  # one by one
+
+### test_max_batch_size
+
+def test_max_batch_size(schema, http, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], max_batch_size=2, exception_handler=lambda loop, context: None, run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        responses = await http(unix_endpoint, batch_request([dict(query='{me {id}}')] * 3) + batch_request([]), responses=2)
+        await servers.close()
+        return [json.loads(content) for headers, content in responses]
+
+    results = loop.run_until_complete(client())
+    assert results == [{'errors': [{'message': 'JSON: batch size should be from 1 to 2'}]}] * 2
@@ -0,0 +1,111 @@
+
+### import
+
+import asyncio
+
+import aiographql
+import graphene
+
+### schema
+
+USERS = {
+    1: dict(name='John', friend_ids=[2, 3]),
+    2: dict(name='Jane', friend_ids=[1, 3, 4]),
+    3: dict(name='Jack', friend_ids=[1, 4]),
+    4: dict(name='Jill', friend_ids=[2]),
+}
+
+class User(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String()
+    friends = graphene.List(lambda: User)
+
+    def resolve_friends(self, info):
+        return info.context['data_loaders']['users'].load_many(USERS[int(self.id)]['friend_ids'])
+
+class Query(graphene.ObjectType):
+    me = graphene.Field(User)
+
+    def resolve_me(self, info):
+        return info.context['data_loaders']['users'].load(1)
+
+
+schema = graphene.Schema(query=Query, mutation=None)
+
+### test_data_loader
+
+def test_data_loader(curl, unix_endpoint):
+
+    batches = []
+
+    async def batch_load_users(keys):
+        batches.append(keys)
+        await asyncio.sleep(0.01)  # DB
+        return [User(id=key, name=USERS[key]['name']) for key in keys]
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], data_loaders=dict(users=batch_load_users), run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        result = await curl(unix_endpoint, '{me {name friends {name friends {name}}}}')
+        await servers.close()
+        return result
+
+    result = loop.run_until_complete(client())
+    assert result == {'data': {'me': {'name': 'John', 'friends': [
+        {'name': 'Jane', 'friends': [{'name': 'John'}, {'name': 'Jack'}, {'name': 'Jill'}]},
+        {'name': 'Jack', 'friends': [{'name': 'John'}, {'name': 'Jill'}]},
+    ]}}}
+    assert batches == [[1], [2, 3], [4]]  # one batch per level, cached keys are not loaded again
+
+### test_data_loader_options
+
+def test_data_loader_options():
+    loop = asyncio.get_event_loop()
+    batches = []
+
+    def batch_load(keys):
+        batches.append(keys)
+        return [ValueError(key) if key == 'bad' else key * 2 for key in keys]
+
+    async def main():
+        loader = aiographql.DataLoader(batch_load, cache=False, max_batch_size=2)
+        values = await loader.load_many([1, 2, 1])
+        try:
+            await loader.load('bad')
+        except ValueError as e:
+            error = e
+        return values, error
+
+    values, error = loop.run_until_complete(main())
+    assert values == [2, 4, 2]
+    assert str(error) == 'bad'
+    assert batches == [[1, 2], [1], ['bad']]
+
+### test_data_loader_context
+
+def test_data_loader_context(curl, unix_endpoint):
+
+    contexts = []
+
+    def get_context(loop, context):
+        contexts.append(context)
+        return dict(data_loaders=context['data_loaders'])
+
+    def batch_load_users(keys):
+        return [User(id=key, name=USERS[key]['name']) for key in keys]
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], get_context=get_context,
+        data_loaders=dict(users=dict(batch_load=batch_load_users, cache=False)), run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = [await curl(unix_endpoint, '{me {name}}') for _ in range(2)]
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+    assert results == [{'data': {'me': {'name': 'John'}}}] * 2
+    data_loaders = [context['data_loaders']['users'] for context in contexts]
+    assert len(data_loaders) == 2 and data_loaders[0] is not data_loaders[1]
+    assert data_loaders[0].cache is False
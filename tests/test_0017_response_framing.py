@@ -0,0 +1,47 @@
+
+### import
+
+import asyncio
+import email.utils
+import time
+
+import aiographql
+import graphene
+import ujson as json
+
+### schema
+
+class Query(graphene.ObjectType):
+    greeting = graphene.String()
+
+    def resolve_greeting(self, info):
+        return 'Привет, мир! 你好'
+
+
+schema = graphene.Schema(query=Query, mutation=None)
+
+### test
+
+def test_response_framing(http, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        first = await http(unix_endpoint, http_request('{greeting}'))
+        await asyncio.sleep(1.1)
+        second = await http(unix_endpoint, http_request('{greeting}'))
+        await servers.close()
+        return first + second
+
+    (headers, content), (second_headers, second_content) = loop.run_until_complete(client())
+    assert json.loads(content.decode()) == {'data': {'greeting': 'Привет, мир! 你好'}}
+    assert int(headers.split(b'Content-Length: ')[1].split(b'\r\n')[0]) == len(content)
+
+    dates = [
+        email.utils.parsedate_to_datetime(headers.split(b'\r\nDate: ')[1].split(b'\r\n')[0].decode()).timestamp()
+        for headers in (headers, second_headers)
+    ]
+    assert abs(dates[1] - time.time()) < 1.5
+    assert dates[1] - dates[0] >= 1  # refreshed
+    assert servers.date_header_timer.cancelled()
@@ -0,0 +1,136 @@
+
+### import
+
+import asyncio
+from urllib.parse import urlencode
+
+import aiographql
+import graphene
+import ujson as json
+
+### schema
+
+class User(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String()
+    email = graphene.String()
+
+    @aiographql.cache_control(max_age=10, scope='PRIVATE')
+    def resolve_email(self, info):
+        return 'john@example.com'
+
+class Query(graphene.ObjectType):
+    me = graphene.Field(User)
+    greeting = graphene.String(name=graphene.String())
+    now = graphene.Float()
+
+    @aiographql.cache_control(max_age=60)
+    def resolve_me(self, info):
+        return User(id=42, name='John')
+
+    @aiographql.cache_control(max_age=300)
+    def resolve_greeting(self, info, name='world'):
+        return 'Hello, {}!'.format(name)
+
+    def resolve_now(self, info):
+        return 42.0
+
+class Like(graphene.Mutation):
+    ok = graphene.Boolean()
+
+    def mutate(self, info):
+        return Like(ok=True)
+
+class Mutation(graphene.ObjectType):
+    like = Like.Field()
+
+
+schema = graphene.Schema(query=Query, mutation=Mutation)
+
+### helpers
+
+def get_request(extra_headers=(), **params):
+    return b''.join([
+        'GET /?{} HTTP/1.1\r\n'.format(urlencode(params)).encode(),
+        b'Host: localhost\r\n',
+        b''.join(header.encode() + b'\r\n' for header in extra_headers),
+        b'\r\n',
+    ])
+
+def get_header(headers, name):
+    for line in headers.split(b'\r\n'):
+        key, _, value = line.partition(b': ')
+        if key.lower() == name.lower():
+            return value
+    return None
+
+### test
+
+def test_get(http, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        results['greeting'], = await http(unix_endpoint, get_request(
+            query='query Greet($name: String) {greeting(name: $name)}',
+            variables=json.dumps({'name': 'John'}),
+            operationName='Greet',
+        ))
+        results['me'], = await http(unix_endpoint, get_request(query='{me {id name}}'))
+        results['private'], = await http(unix_endpoint, get_request(query='{me {email} greeting}'))
+        results['not_hinted'], = await http(unix_endpoint, get_request(query='{greeting now}'))
+        results['fragment'], = await http(unix_endpoint, get_request(query='{...F} fragment F on Query {me {...U}} fragment U on User {email}'))
+        results['mutation'], = await http(unix_endpoint, get_request(query='mutation {like {ok}}'))
+        results['post'], = await http(unix_endpoint, http_request('{greeting}'))
+
+        etag = get_header(results['me'][0], b'ETag')
+        results['not_modified'], = await http(unix_endpoint, get_request(['If-None-Match: "other", ' + etag.decode()], query='{me {id name}}'))
+        results['modified'], = await http(unix_endpoint, get_request(['If-None-Match: "other"'], query='{me {id name}}'))
+
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    headers, content = results['greeting']
+    assert json.loads(content) == {'data': {'greeting': 'Hello, John!'}}
+    assert get_header(headers, b'Cache-Control') == b'public, max-age=300'
+    assert get_header(headers, b'ETag').startswith(b'W/"')
+
+    headers, content = results['me']
+    assert json.loads(content) == {'data': {'me': {'id': '42', 'name': 'John'}}}
+    assert get_header(headers, b'Cache-Control') == b'public, max-age=60'
+
+    headers, content = results['private']
+    assert get_header(headers, b'Cache-Control') == b'private, max-age=10'
+
+    headers, content = results['not_hinted']
+    assert json.loads(content) == {'data': {'greeting': 'Hello, world!', 'now': 42.0}}
+    assert get_header(headers, b'Cache-Control') == b'no-cache'
+
+    headers, content = results['fragment']
+    assert get_header(headers, b'Cache-Control') == b'private, max-age=10'
+
+    headers, content = results['mutation']
+    assert json.loads(content) == {'errors': [{'message': 'Can only perform a mutation operation from a POST request'}]}
+    assert get_header(headers, b'Cache-Control') == b'no-cache'
+
+    headers, content = results['post']
+    assert json.loads(content) == {'data': {'greeting': 'Hello, world!'}}
+    assert get_header(headers, b'Cache-Control') is None
+    assert get_header(headers, b'ETag') is None
+
+    headers, content = results['not_modified']
+    assert headers.startswith(b'HTTP/1.1 304 Not Modified\r\n')
+    assert content == b''
+    assert get_header(headers, b'ETag') == get_header(results['me'][0], b'ETag')
+    assert get_header(headers, b'Cache-Control') == b'public, max-age=60'
+    assert get_header(headers, b'Content-Length') is None
+
+    headers, content = results['modified']
+    assert headers.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert content == results['me'][1]
+
+    assert servers.query_cache.analyses  # cached alongside documents
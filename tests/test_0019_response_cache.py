@@ -0,0 +1,147 @@
+
+### import
+
+import asyncio
+
+import aiographql
+import graphene
+import ujson as json
+
+### schema
+
+calls = []
+
+class Query(graphene.ObjectType):
+    dashboard = graphene.String(name=graphene.String())
+    broken = graphene.String()
+    whoami = graphene.String()
+
+    async def resolve_dashboard(self, info, name='main'):
+        calls.append(name)
+        await asyncio.sleep(0.1)  # DB
+        return '{} #{}'.format(name, len(calls))
+
+    def resolve_broken(self, info):
+        calls.append('broken')
+        raise Exception('Broken')
+
+    def resolve_whoami(self, info):
+        calls.append('whoami')
+        return info.context['user']
+
+class Like(graphene.Mutation):
+    count = graphene.Int()
+
+    def mutate(self, info):
+        calls.append('like')
+        return Like(count=len(calls))
+
+class Mutation(graphene.ObjectType):
+    like = Like.Field()
+
+
+schema = graphene.Schema(query=Query, mutation=Mutation)
+
+### get_context
+
+def get_context(loop, context):
+    user = context['headers'].split(b'\r\nUser: ')[1].split(b'\r\n')[0].decode() if b'\r\nUser: ' in context['headers'] else None
+    return dict(user=user)
+
+def get_cache_scope(context):
+    return context['user']  # None for anonymous - bypass
+
+### test
+
+def test_response_cache(http, http_request, unix_endpoint):
+
+    response_cache = aiographql.ResponseCache(ttl=0.5)
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, exception_handler=lambda loop, context: None,
+        get_context=get_context, response_cache=response_cache, get_cache_scope=get_cache_scope)
+    loop = asyncio.get_event_loop()
+
+    async def request(query, variables=None, user='alice'):
+        (headers, content), = await http(unix_endpoint, http_request(query, variables, ['User: ' + user] if user else None))
+        return json.loads(content)
+
+    async def client():
+        results = {}
+
+        del calls[:]
+        results['coalesced'] = await asyncio.gather(*[request('{dashboard}') for _ in range(5)])
+        results['coalesced_calls'] = len(calls)
+
+        results['hit'] = await request('{dashboard}')
+        results['variables'] = await request('query($name: String) {dashboard(name: $name)}', {'name': 'sales'})
+        results['other_scope'] = await request('{dashboard}', user='bob')
+        results['hit_calls'] = len(calls)
+
+        await asyncio.sleep(0.6)
+        results['expired'] = await request('{dashboard}')
+        results['expired_calls'] = len(calls)
+
+        del calls[:]
+        await request('{whoami}', user=None)
+        await request('{whoami}', user=None)
+        results['bypass_calls'] = len(calls)
+
+        del calls[:]
+        await request('{broken}')
+        results['errors'] = await request('{broken}')
+        results['errors_calls'] = len(calls)
+
+        del calls[:]
+        await request('mutation {like {count}}')
+        await request('mutation {like {count}}')
+        results['mutation_calls'] = len(calls)
+
+        batch = json.dumps([{'query': '{dashboard}'}, {'query': '{nope}'}]).encode()
+        (headers, content), = await http(unix_endpoint, b''.join([
+            b'POST / HTTP/1.1\r\nUser: alice\r\n',
+            'Content-Length: {}\r\n\r\n'.format(len(batch)).encode(),
+            batch,
+        ]))
+        results['batch'] = json.loads(content)
+
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert results['coalesced'] == [{'data': {'dashboard': 'main #1'}}] * 5
+    assert results['coalesced_calls'] == 1
+
+    assert results['hit'] == {'data': {'dashboard': 'main #1'}}
+    assert results['variables'] == {'data': {'dashboard': 'sales #2'}}
+    assert results['other_scope'] == {'data': {'dashboard': 'main #3'}}
+    assert results['hit_calls'] == 3
+
+    assert results['expired'] == {'data': {'dashboard': 'main #4'}}
+    assert results['expired_calls'] == 4
+
+    assert results['bypass_calls'] == 2
+    assert results['errors']['errors'][0]['message'] == 'Broken'
+    assert results['errors_calls'] == 2
+    assert results['mutation_calls'] == 2
+
+    assert results['batch'][0] == {'data': {'dashboard': 'main #4'}}
+    assert results['batch'][1]['errors'][0]['message'] == 'Cannot query field "nope" on type "Query".'
+
+    assert response_cache.hits >= 2
+    assert response_cache.misses >= 4
+
+def test_response_cache_size():
+
+    response_cache = aiographql.ResponseCache(max_size=10)
+    response_cache.set('a', b'1234')
+    response_cache.set('b', b'1234')
+    assert response_cache.get('a') == b'1234'  # "a" is recently used now
+
+    response_cache.set('c', b'1234')
+    assert response_cache.get('b') is None  # evicted
+    assert response_cache.get('a') == b'1234'
+    assert response_cache.size == 8
+
+    response_cache.set('d', b'12345678901')  # too big to cache
+    assert response_cache.get('d') is None
+    assert response_cache.size == 8
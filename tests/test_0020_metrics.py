@@ -0,0 +1,125 @@
+
+### import
+
+import asyncio
+import os
+import re
+import signal
+import sys
+
+import aiographql
+
+### const
+
+METRICS_ENDPOINT = dict(protocol='unix', path='/tmp/aiographql-tests-metrics')
+
+SCRIPT = '''
+import sys
+import aiographql, graphene
+
+class Query(graphene.ObjectType):
+    hello = graphene.String()
+
+    def resolve_hello(self, info):
+        return 'world'
+
+aiographql.serve(graphene.Schema(query=Query), listen=[dict(protocol='unix', path=sys.argv[1] + '{worker}')], workers=2,
+    metrics=aiographql.Metrics(listen=[dict(protocol='unix', path=sys.argv[2] + '{worker}')]))
+'''
+
+### helpers
+
+async def get_metrics(path):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    response = await asyncio.wait_for(reader.read(), 5)  # until connection is closed
+    writer.close()
+
+    headers, _, content = response.partition(b'\r\n\r\n')
+    assert headers.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert b'\r\nContent-Type: text/plain; version=0.0.4\r\n' in headers
+    return {
+        name: float(value)
+        for name, value in re.findall(r'^(\S+) (\S+)$', content.decode(), re.MULTILINE)
+        if name != '#'
+    }
+
+### test
+
+def test_metrics(curl, http, http_request, schema, unix_endpoint):
+
+    metrics = aiographql.Metrics(listen=[METRICS_ENDPOINT])
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, exception_handler=lambda loop, context: None, metrics=metrics)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        await curl(unix_endpoint, '{me {id}}')
+        await curl(unix_endpoint, '{me {id} nope}')
+        await http(unix_endpoint, b'POST / HTTP/1.1\r\nContent-Length: 3\r\n\r\n{x}')
+        await http(unix_endpoint, http_request('{slowDb(seconds: 0.2)}') * 2, responses=2)
+        await asyncio.sleep(0.1)  # for server to see closed connections
+        result = await get_metrics(METRICS_ENDPOINT['path'])
+        await servers.close()
+        return result
+
+    result = loop.run_until_complete(client())
+
+    assert result['aiographql_request_size_bytes_count'] == 5
+    assert result['aiographql_requests_in_flight'] == 0
+    assert result['aiographql_connections_open'] == 0
+    assert result['aiographql_errors_total{kind="graphql"}'] == 1
+    assert result['aiographql_errors_total{kind="bad_request"}'] == 1
+    assert result['aiographql_errors_total{kind="internal"}'] == 0
+
+    assert result['aiographql_execute_seconds_count'] == 4
+    assert result['aiographql_execute_seconds_sum'] >= 0.4
+    assert result['aiographql_execute_seconds_bucket{le="0.1"}'] == 2
+    assert result['aiographql_execute_seconds_bucket{le="0.5"}'] == 4
+    assert result['aiographql_execute_seconds_bucket{le="+Inf"}'] == 4
+    assert result['aiographql_parse_seconds_count'] == 4
+    assert result['aiographql_serialize_seconds_count'] == 5
+    assert result['aiographql_response_size_bytes_bucket{le="128"}'] == 5
+
+def test_metrics_workers(unix_endpoint):
+
+    loop = asyncio.get_event_loop()
+    paths = [unix_endpoint['path'] + str(index) for index in range(2)]
+    metrics_paths = [METRICS_ENDPOINT['path'] + str(index) for index in range(2)]
+    for path in paths + metrics_paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+    async def request(path):
+        for _ in range(100):
+            if os.path.exists(path):
+                try:
+                    reader, writer = await asyncio.open_unix_connection(path)
+                    break
+                except ConnectionRefusedError:
+                    pass
+            await asyncio.sleep(0.05)
+
+        writer.write(b'POST / HTTP/1.1\r\nContent-Length: 19\r\n\r\n{"query":"{hello}"}')
+        await asyncio.wait_for(reader.readuntil(b'"world"}}'), 5)
+        writer.close()
+
+    async def client():
+        supervisor = await asyncio.create_subprocess_exec(sys.executable, '-c', SCRIPT, unix_endpoint['path'], METRICS_ENDPOINT['path'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+        for path in paths:
+            await request(path)
+        await request(paths[0])
+        await asyncio.sleep(1.1)  # each worker syncs its metrics to shared memory once per second
+
+        results = [await get_metrics(path) for path in metrics_paths]
+
+        supervisor.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(supervisor.wait(), 5)
+        return results
+
+    results = loop.run_until_complete(client())
+    for result in results:
+        result.pop('aiographql_connections_open')  # client may be closing the last connection
+    assert results[0] == results[1]  # aggregated
+    assert results[0]['aiographql_request_size_bytes_count'] == 3
@@ -0,0 +1,84 @@
+
+### import
+
+import asyncio
+import logging
+import re
+
+import aiographql
+import ujson as json
+
+### const
+
+SLOW_SECONDS = 0.19  # slowDb(seconds: 0.2) measured by clock of the loop, that may fire timer up to 1ms earlier
+
+### test
+
+def test_tracing(http, http_request, schema, unix_endpoint):
+
+    reports = []
+    tracing = aiographql.Tracing(sample_rate=0, slow_query_seconds=0.1, top_fields=2)
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, tracing=tracing,
+        exception_handler=lambda loop, context: reports.append(context))
+    loop = asyncio.get_event_loop()
+
+    async def request(query, variables=None, extra_headers=None):
+        (headers, content), = await http(unix_endpoint, http_request(query, variables, extra_headers))
+        return json.loads(content)
+
+    async def client():
+        results = {}
+        results['not_traced'] = await request('query Slow($s: Float) {slowDb(seconds: $s)}', {'s': 0.2})
+        results['traced'] = await request('query Slow($s: Float) {me {id name} slowDb(seconds: $s)}', {'s': 0.2}, ['X-Tracing: 1'])
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert 'extensions' not in results['not_traced']
+
+    result = results['traced']
+    assert result['data'] == {'me': {'id': '42', 'name': 'John'}, 'slowDb': True}
+
+    tracing = result['extensions']['tracing']
+    assert tracing['version'] == 1
+    assert tracing['startTime'].endswith('Z') and tracing['endTime'] >= tracing['startTime']
+    assert tracing['duration'] >= SLOW_SECONDS * 1e9
+
+    resolvers = {tuple(resolver['path']): resolver for resolver in tracing['execution']['resolvers']}
+    assert set(resolvers) == {('me',), ('me', 'id'), ('me', 'name'), ('slowDb',)}
+    assert resolvers['slowDb',]['parentType'] == 'Query'
+    assert resolvers['slowDb',]['fieldName'] == 'slowDb'
+    assert resolvers['slowDb',]['returnType'] == 'Boolean'
+    assert resolvers['slowDb',]['duration'] >= SLOW_SECONDS * 1e9
+    assert resolvers['me', 'id']['returnType'] == 'ID!'
+    assert resolvers['me', 'id']['startOffset'] >= resolvers['me',]['startOffset']
+
+    assert len(reports) == 1  # slow query log of traced request only
+    slow_query = reports[0]['slow_query']
+    assert slow_query['operation_name'] == 'Slow'
+    assert len(slow_query['variables_digest']) == 16
+    assert slow_query['seconds'] >= SLOW_SECONDS
+    (slowest, _), (_, other_seconds) = slow_query['top_fields']  # order of other fields taking microseconds is not stable
+    assert slowest == 'slowDb' and other_seconds < 0.1
+
+    match = re.match(r'Slow query Slow with variables (\w+) took ([\d.]+)s', reports[0]['message'])
+    assert match.group(1) == slow_query['variables_digest']
+    assert float(match.group(2)) >= SLOW_SECONDS
+
+def test_tracing_sampled(http, http_request, schema, unix_endpoint, caplog):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, tracing=aiographql.Tracing(sample_rate=1, slow_query_seconds=0.1))
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = await http(unix_endpoint, http_request('{slowDb(seconds: 0.2)}') + http_request('{me {id}}'), responses=2)
+        await servers.close()
+        return results
+
+    with caplog.at_level(logging.WARNING, logger='aiographql'):
+        (_, slow), (_, fast) = loop.run_until_complete(client())
+
+    assert json.loads(slow) == {'data': {'slowDb': True}}  # no extension without header
+    assert json.loads(fast) == {'data': {'me': {'id': '42'}}}
+    assert [record.getMessage().split(' took ')[0] for record in caplog.records] == ['Slow query None with variables None']
@@ -0,0 +1,86 @@
+
+### import
+
+import asyncio
+
+import aiographql
+import graphene
+
+### schema
+
+calls = []
+
+class Post(graphene.ObjectType):
+    title = graphene.String()
+
+class User(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    friends = graphene.List(lambda: User)
+    posts = graphene.NonNull(graphene.List(Post))
+
+    def resolve_friends(self, info):
+        calls.append('friends')
+        return [User(id=1), User(id=2)]
+
+    @aiographql.cost(weight=5, list_size=3)
+    def resolve_posts(self, info):
+        return [Post(title='Hello')]
+
+class Query(graphene.ObjectType):
+    me = graphene.Field(User)
+
+    def resolve_me(self, info):
+        return User(id=42)
+
+
+schema = graphene.Schema(query=Query)
+
+### const
+
+FRAGMENT_BOMB = '{me {...F0}} ' + ' '.join(
+    'fragment F{} on User {{a: friends {{...F{}}} b: friends {{...F{}}}}}'.format(index, index + 1, index + 1) for index in range(16)
+) + ' fragment F16 on User {id}'
+
+### test
+
+def test_complexity(curl, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, max_depth=4, max_nodes=100, max_cost=100, list_size=10)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        results['ok'] = await curl(unix_endpoint, '{me {id friends {id posts {title}}}}')
+        del calls[:]
+
+        results['depth'] = await curl(unix_endpoint, '{me {friends {friends {friends {id}}}}}')
+        results['cost'] = await curl(unix_endpoint, '{me {friends {id posts {title}} more: friends {id}}}')
+        results['nodes'] = await curl(unix_endpoint, FRAGMENT_BOMB)
+        results['introspection'] = await curl(unix_endpoint, '{__schema {types {fields {type {fields {name}}}}}}')
+        results['typename'] = await curl(unix_endpoint, '{__typename __type(name: "User") {name}}')
+        results['calls'] = len(calls)
+
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert results['ok'] == {'data': {'me': {'id': '42', 'friends': [
+        {'id': '1', 'posts': [{'title': 'Hello'}]},
+        {'id': '2', 'posts': [{'title': 'Hello'}]},
+    ]}}}
+
+    # me 1 + friends (1 + 10 * (id 1 + posts (5 + 3 * title 1))) + more (1 + 10 * id 1)
+    assert results['cost'] == {'errors': [{
+        'message': 'Query cost 103 exceeds max_cost 100',
+        'extensions': {'code': 'QUERY_TOO_COMPLEX', 'depth': 4, 'nodes': 7, 'cost': 103},
+    }]}
+    assert results['depth']['errors'][0]['message'] == 'Query depth 5 exceeds max_depth 4'
+    assert results['nodes']['errors'][0]['message'] == 'Query depth 18 exceeds max_depth 4'
+    assert results['nodes']['errors'][0]['extensions']['nodes'] == 3 * 2 ** 16 - 1
+    assert results['calls'] == 0  # rejected before execution
+
+    assert results['introspection']['errors'][0]['message'] == 'Query depth 6 exceeds max_depth 4'
+    assert results['typename'] == {'data': {'__typename': 'Query', '__type': {'name': 'User'}}}
+
+    assert any(key[0] is aiographql.get_complexity for analyses in servers.query_cache.analyses.values() for key in analyses)
@@ -0,0 +1,124 @@
+
+### import
+
+import asyncio
+import time
+
+import aiographql
+import ujson as json
+
+### helpers
+
+async def exchange(endpoint, parts, delay=0):
+    """
+    Send parts of raw HTTP data with delay between them, and read until connection is closed by server.
+
+    @return data: bytes, seconds: float - received data and time until connection was closed
+    """
+    reader, writer = await asyncio.open_unix_connection(endpoint['path'])
+    started_at = time.monotonic()
+    received = []
+
+    async def receive():
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                received.append(data)
+        except ConnectionError:
+            pass  # e.g. broken pipe after trickled bytes
+        return time.monotonic() - started_at
+
+    receiving = asyncio.ensure_future(receive())
+    try:
+        for part in parts:
+            if receiving.done() or writer.transport.is_closing():
+                break  # closed by server
+            writer.write(part)
+            await asyncio.sleep(delay)
+        seconds = await asyncio.wait_for(receiving, 5)
+        return b''.join(received), seconds
+    finally:
+        writer.close()
+
+def get_error(data):
+    headers, content = data.split(b'\r\n\r\n', 1)
+    assert b'\r\nConnection: close\r\n' in headers
+    return json.loads(content)['errors'][0]['message']
+
+### test
+
+def test_limits(schema, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, exception_handler=lambda loop, context: None,
+        max_header_size=1024, max_body_size=1024, header_timeout=0.3, body_timeout=0.3, keep_alive_timeout=0.5)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+
+        data, _ = await exchange(unix_endpoint, [http_request('{me {id}}', extra_headers=['X-Big: ' + 'x' * 2048])])
+        results['big_headers'] = get_error(data)
+
+        data, _ = await exchange(unix_endpoint, [b'POST / HTTP/1.1\r\nX-Big: ' + b'x' * 600, b'x' * 600], delay=0.05)
+        results['big_headers_in_chunks'] = get_error(data)
+
+        data, _ = await exchange(unix_endpoint, [b'POST / HTTP/1.1\r\nContent-Length: 1000000\r\n\r\n'])
+        results['big_body'] = get_error(data)
+
+        data, _ = await exchange(unix_endpoint, [b'POST / HTTP/1.1\r\n\r\n'])
+        results['no_content_length'] = get_error(data)
+
+        data, seconds = await exchange(unix_endpoint, [b'POST / HTTP/1.1\r\n'])
+        results['header_timeout'] = get_error(data), seconds
+
+        data, seconds = await exchange(unix_endpoint, [b'POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n{'])
+        results['body_timeout'] = get_error(data), seconds
+
+        # Trickled bytes do not extend the deadline.
+        data, seconds = await exchange(unix_endpoint, [b'POST / HTTP/1.1\r\n'] + [b'X'] * 10, delay=0.05)
+        results['trickle'] = get_error(data), seconds
+
+        # Pipelined request after the error is ignored.
+        data, _ = await exchange(unix_endpoint, [b'POST / HTTP/1.1\r\n\r\n' + http_request('{me {id}}')])
+        results['after_error'] = data.count(b'HTTP/1.1 200 OK')
+
+        data, seconds = await exchange(unix_endpoint, [http_request('{me {id}}')])
+        results['keep_alive'] = json.loads(data.split(b'\r\n\r\n', 1)[1]), seconds
+
+        # Keep-alive timeout does not cut off request being processed.
+        data, seconds = await exchange(unix_endpoint, [http_request('{slowDb(seconds: 0.7)}')])
+        results['slow'] = json.loads(data.split(b'\r\n\r\n', 1)[1]), seconds
+
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert results['big_headers'] == 'Request headers are too large'
+    assert results['big_headers_in_chunks'] == 'Request headers are too large'
+    assert results['big_body'] == 'Request body is too large'
+    assert results['no_content_length'] == '"Content-Length" header is not found'
+
+    message, seconds = results['header_timeout']
+    assert message == 'Timeout of request headers'
+    assert 0.25 < seconds < 0.6
+
+    message, seconds = results['body_timeout']
+    assert message == 'Timeout of request body'
+    assert 0.25 < seconds < 0.6
+
+    message, seconds = results['trickle']
+    assert message == 'Timeout of request headers'
+    assert seconds < 0.6
+
+    assert results['after_error'] == 1
+
+    response, seconds = results['keep_alive']
+    assert response == {'data': {'me': {'id': '42'}}}
+    assert 0.45 < seconds < 0.9
+
+    response, seconds = results['slow']
+    assert response == {'data': {'slowDb': True}}
+    assert 1.1 < seconds < 1.6
@@ -0,0 +1,145 @@
+
+### import
+
+import asyncio
+
+import aiographql
+import graphene
+import pytest
+import ujson as json
+
+### schema
+
+class Row(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String()
+    tags = graphene.List(graphene.String)
+
+class Query(graphene.ObjectType):
+    export = graphene.List(Row, size=graphene.Int())
+    greeting = graphene.String()
+
+    def resolve_export(self, info, size):
+        return [Row(id=index, name='Row "{}" / строка'.format(index), tags=['a', 'b']) for index in range(size)]
+
+    def resolve_greeting(self, info):
+        return 'Hello'
+
+
+schema = graphene.Schema(query=Query, mutation=None)
+
+### helpers
+
+def dechunk(content):
+    """
+    @param content: bytes - body with "Transfer-Encoding: chunked"
+    @return content: bytes, chunks: int
+    """
+    parts = []
+    while True:
+        size, _, content = content.partition(b'\r\n')
+        size = int(size, 16)
+        if not size:
+            assert content == b'\r\n'
+            return b''.join(parts), len(parts)
+        parts.append(content[:size])
+        assert content[size:size + 2] == b'\r\n'
+        content = content[size + 2:]
+
+### test
+
+@pytest.mark.parametrize('json_codec', [aiographql.JsonCodec(), aiographql.UjsonCodec()] + (
+    [aiographql.OrjsonCodec()] if aiographql.orjson else []))
+def test_iter_json(json_codec):
+    for value in [
+        {'data': {'export': [{'id': '1', 'tags': []}, {'id': '2', 'tags': None}] * 100, 'empty': [], 'nested': {'a': {}}}},
+        [{'data': None, 'errors': [{'message': 'Error'}]}, {'data': {'x': 1.5}}],
+        {'data': {1: {'name': 'Zoë'}, 2: [{'url': 'http://x/y'}]}},
+        {},
+        [],
+    ]:
+        assert b''.join(aiographql.iter_json(value, 64, json_codec)) == json_codec.dumps(value)
+
+def test_iter_json_custom_codec():
+
+    class IndentingCodec(object):
+        def dumps(self, value):
+            return json.dumps(value, indent=2).encode()
+
+    value = {'data': {'export': [{'id': '1', 'tags': ['a']}] * 100, 1: {'nested': {}}}}
+    assert json.loads(b''.join(aiographql.iter_json(value, 64, IndentingCodec()))) == json.loads(json.dumps(value))
+
+def test_streaming(curl, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False,
+        streaming_min_size=10000, streaming_chunk_size=4096, write_buffer_limits=dict(high=8192))
+    loop = asyncio.get_event_loop()
+    query = '{export(size: 1000) {id name tags}}'
+
+    async def client():
+        reader, writer = await asyncio.open_unix_connection(unix_endpoint['path'])
+        writer.write(http_request(query) + http_request('{greeting}'))
+
+        data = b''
+        while b'\r\n0\r\n\r\n' not in data:
+            data += await reader.read(1024)
+            await asyncio.sleep(0.001)  # slow client, so server waits for write buffer to drain
+
+        headers, data = data.split(b'\r\n\r\n', 1)
+        content, data = data.split(b'\r\n0\r\n\r\n', 1)
+        while data.count(b'\r\n\r\n') < 1 or not data.endswith(b'}'):
+            data += await reader.read(1024)
+        small_content = data.split(b'\r\n\r\n', 1)[1]
+        writer.close()
+
+        compressed = await curl(unix_endpoint, query)
+        small = await curl(unix_endpoint, '{greeting}')
+        await servers.close()
+        return headers, content, small_content, compressed, small
+
+    headers, content, small_content, compressed, small = loop.run_until_complete(client())
+
+    assert b'\r\nTransfer-Encoding: chunked\r\n' in headers
+    assert b'Content-Length' not in headers
+    content, chunks = dechunk(content + b'\r\n0\r\n\r\n')
+    assert chunks > 10
+
+    expected = schema.execute(query).data
+    assert json.loads(content) == {'data': expected}
+    assert json.loads(small_content) == {'data': {'greeting': 'Hello'}}  # in order after streamed response
+
+    assert compressed == {'data': expected}  # streamed with compression, decoded by curl
+    assert small == {'data': {'greeting': 'Hello'}}
+
+def test_streaming_error(http_request, unix_endpoint):
+
+    class FailingCodec(aiographql.JsonCodec):
+        def dumps(self, value):
+            if isinstance(value, list) and any(isinstance(item, dict) and item.get('id') == '900' for item in value):
+                raise ValueError('Failed to serialize')
+            return super().dumps(value)
+
+    errors = []
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, json_codec=FailingCodec(),
+        exception_handler=lambda loop, context: errors.append(context), streaming_min_size=10000, streaming_chunk_size=4096)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        reader, writer = await asyncio.open_unix_connection(unix_endpoint['path'])
+        writer.write(http_request('{export(size: 1000) {id name tags}}') + http_request('{greeting}'))
+        data = await asyncio.wait_for(reader.read(), 5)  # until connection is closed
+        writer.close()
+        await servers.close()
+        return data
+
+    data = loop.run_until_complete(client())
+
+    headers, content = data.split(b'\r\n\r\n', 1)
+    assert b'\r\nTransfer-Encoding: chunked\r\n' in headers
+    assert len(content) > 4096  # failed in the middle of response
+    assert not content.endswith(b'\r\n0\r\n\r\n')  # incomplete, so client does not take it as complete
+    assert b'Hello' not in content  # connection is closed, not reused for the next response
+
+    [error] = errors
+    assert str(error['exception']) == 'Failed to serialize'
+    assert error['headers'].startswith(b'POST / HTTP/1.1\r\n')
@@ -0,0 +1,113 @@
+
+### import
+
+import asyncio
+import time
+
+import aiographql
+import graphene
+import ujson as json
+
+### schema
+
+class User(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String()
+
+    async def resolve_name(self, info):
+        await asyncio.sleep(0.3)
+        return 'John'
+
+class Query(graphene.ObjectType):
+    fast = graphene.String()
+    slow = graphene.String()
+    items = graphene.List(graphene.Int)
+    users = graphene.List(User)
+
+    def resolve_fast(self, info):
+        return 'fast'
+
+    async def resolve_slow(self, info):
+        await asyncio.sleep(0.5)
+        return 'slow'
+
+    def resolve_items(self, info):
+        return [1, 2, 3]
+
+    def resolve_users(self, info):
+        return [User(id=1), User(id=2)]
+
+
+schema = graphene.Schema(query=Query, mutation=None, directives=aiographql.DIRECTIVES)
+
+QUERY = '''query Page {
+    fast
+    ... @defer(label: "slow") { slow }
+    items @stream(initialCount: 1)
+    users { id ...Details @defer }
+}
+fragment Details on User { name }'''
+
+### helpers
+
+async def read_parts(reader):
+    """
+    Read "multipart/mixed" response with "Transfer-Encoding: chunked".
+
+    @return headers: bytes, parts: list of (seconds: float, part: dict)
+    """
+    started_at = time.monotonic()
+    headers = await reader.readuntil(b'\r\n\r\n')
+    parts = []
+    while True:
+        size = int(await reader.readuntil(b'\r\n'), 16)
+        chunk = await reader.readexactly(size + 2)
+        if not size:
+            return headers, parts
+        chunk = chunk[:-2]
+        if chunk != b'\r\n-----\r\n':
+            assert chunk.startswith(b'\r\n---\r\nContent-Type: application/json; charset=utf-8\r\n\r\n')
+            parts.append((time.monotonic() - started_at, json.loads(chunk.split(b'\r\n\r\n', 1)[1])))
+
+### test
+
+def test_defer_stream(http, http_request, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        reader, writer = await asyncio.open_unix_connection(unix_endpoint['path'])
+        writer.write(http_request(QUERY, extra_headers=['Accept: multipart/mixed; deferSpec=20220824, application/json']))
+        writer.write(http_request('{fast}'))  # pipelined
+        headers, parts = await read_parts(reader)
+        pipelined = await reader.readuntil(b'}}')
+        writer.close()
+
+        ((_, content),) = await http(unix_endpoint, http_request(QUERY))
+        await servers.close()
+        return headers, parts, pipelined, json.loads(content)
+
+    headers, parts, pipelined, response = loop.run_until_complete(client())
+
+    assert b'\r\nContent-Type: multipart/mixed; boundary="-"; deferSpec=20220824\r\n' in headers
+    assert b'\r\nTransfer-Encoding: chunked\r\n' in headers
+
+    (seconds, initial), (_, streamed), (_, details), (last_seconds, slow) = parts
+    assert seconds < 0.2  # not blocked by slow fields
+    assert initial == {'data': {'fast': 'fast', 'items': [1], 'users': [{'id': '1'}, {'id': '2'}]}, 'hasNext': True}
+    assert streamed == {'incremental': [{'items': [2, 3], 'path': ['items', 1]}], 'hasNext': True}
+    assert details == {'incremental': [
+        {'data': {'name': 'John'}, 'path': ['users', 0]},
+        {'data': {'name': 'John'}, 'path': ['users', 1]},
+    ], 'hasNext': True}
+    assert slow == {'incremental': [{'data': {'slow': 'slow'}, 'path': [], 'label': 'slow'}], 'hasNext': False}
+    assert 0.5 <= last_seconds < 0.7
+
+    assert pipelined.endswith(b'\r\n\r\n{"data":{"fast":"fast"}}')  # after the parts
+
+    # Client that does not accept "multipart/mixed" gets the whole response at once.
+    assert response == {'data': {'fast': 'fast', 'slow': 'slow', 'items': [1, 2, 3], 'users': [
+        {'id': '1', 'name': 'John'},
+        {'id': '2', 'name': 'John'},
+    ]}}
@@ -0,0 +1,391 @@
+
+### import
+
+import asyncio
+import hashlib
+import os
+
+import aiographql
+import graphene
+import ujson as json
+
+### schema
+
+executions = []
+
+class Price(graphene.ObjectType):
+    symbol = graphene.String()
+    value = graphene.Float()
+    executions = graphene.Int()
+
+    def resolve_executions(self, info):
+        executions.append(self['value'])
+        return len(executions)
+
+class Secret(graphene.ObjectType):
+    text = graphene.String()
+
+    def resolve_text(self, info):
+        return 'secret of ' + info.context['user']
+
+class Query(graphene.ObjectType):
+    hello = graphene.String()
+
+    def resolve_hello(self, info):
+        return 'Hello'
+
+class Subscription(graphene.ObjectType):
+    price = graphene.Field(Price, symbol=graphene.String(required=True))
+    counter = graphene.Int(limit=graphene.Int())
+    secret = graphene.Field(Secret)
+
+    def resolve_price(self, info, symbol):
+        return aiographql.Topic('price:' + symbol)
+
+    def resolve_secret(self, info):
+        return aiographql.Topic('secret')
+
+    async def resolve_counter(self, info, limit):
+        for index in range(limit):
+            await asyncio.sleep(0.01)
+            yield index
+
+
+schema = graphene.Schema(query=Query, mutation=None, subscription=Subscription)
+
+PRICE = 'subscription Price($symbol: String!) {price(symbol: $symbol) {symbol value executions}}'
+
+### helpers
+
+class Client(object):
+    """
+    Minimal WebSocket client speaking graphql-transport-ws protocol.
+    """
+
+    async def connect(self, endpoint, protocol='graphql-transport-ws'):
+        self.reader, self.writer = await asyncio.open_unix_connection(endpoint['path'])
+        self.writer.write('''GET /graphql HTTP/1.1
+Host: localhost
+Upgrade: websocket
+Connection: Upgrade
+Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==
+Sec-WebSocket-Protocol: {}
+Sec-WebSocket-Version: 13
+
+'''.format(protocol).replace('\n', '\r\n').encode())
+        self.headers = await self.reader.readuntil(b'\r\n\r\n')
+        return self
+
+    def send(self, message, opcode=1):
+        self.writer.write(self.get_frame(message, opcode))
+
+    def get_frame(self, message, opcode=1):
+        payload = json.dumps(message).encode() if isinstance(message, dict) else message
+        mask = os.urandom(4)
+        length = len(payload)
+        header = bytes((0x80 | opcode,)) + (
+            bytes((0x80 | length,)) if length < 126 else b'\xfe' + length.to_bytes(2, 'big')
+        )
+        return header + mask + bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+
+    async def receive_frame(self):
+        first, second = await self.reader.readexactly(2)
+        length = second & 0x7f
+        if length == 126:
+            length = int.from_bytes(await self.reader.readexactly(2), 'big')
+        elif length == 127:
+            length = int.from_bytes(await self.reader.readexactly(8), 'big')
+        return first & 0x0f, await self.reader.readexactly(length)
+
+    async def receive(self):
+        opcode, payload = await self.receive_frame()
+        assert opcode == 1, (opcode, payload)
+        return json.loads(payload)
+
+### test
+
+def test_unmask():
+    # Example from https://tools.ietf.org/html/rfc6455#section-1.3
+    assert aiographql.unmask(aiographql.unmask(b'Hello', b'\x37\xfa\x21\x3d'), b'\x37\xfa\x21\x3d') == b'Hello'
+    assert aiographql.unmask(b'\x7f\x9f\x4d\x51\x58', b'\x37\xfa\x21\x3d') == b'Hello'
+
+def test_subscriptions(unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        clients = [await Client().connect(unix_endpoint) for index in range(3)]
+        results['headers'] = clients[0].headers
+
+        for client in clients:
+            client.send({'type': 'connection_init', 'payload': {'token': 'secret'}})
+            assert await client.receive() == {'type': 'connection_ack'}
+            client.send({'type': 'subscribe', 'id': '1', 'payload': {'query': PRICE, 'variables': {'symbol': 'AAPL'}}})
+
+        await asyncio.sleep(0.05)
+        results['groups'] = len(servers.pubsub.groups['price:AAPL'])
+        servers.pubsub.publish('price:AAPL', {'symbol': 'AAPL', 'value': 1.5})
+        servers.pubsub.publish('price:MSFT', {'symbol': 'MSFT', 'value': 2.5})  # no subscribers
+        results['events'] = [await client.receive() for client in clients]
+
+        # Unsubscribed client gets no more events, the group is forgotten once empty.
+        clients[0].send({'type': 'complete', 'id': '1'})
+        clients[1].writer.close()
+        await asyncio.sleep(0.05)
+        servers.pubsub.publish('price:AAPL', {'symbol': 'AAPL', 'value': 1.6})
+        results['after_unsubscribe'] = await clients[2].receive()
+        clients[2].send({'type': 'complete', 'id': '1'})
+        await asyncio.sleep(0.05)
+        results['groups_left'] = dict(servers.pubsub.groups)
+
+        # Async generator, query and errors over legacy protocol.
+        legacy = await Client().connect(unix_endpoint, protocol='graphql-ws')
+        results['legacy_headers'] = legacy.headers
+        legacy.send({'type': 'connection_init'})
+        await legacy.receive()
+        legacy.send({'type': 'start', 'id': 'c', 'payload': {'query': 'subscription {counter(limit: 3)}'}})
+        results['counter'] = [await legacy.receive() for index in range(4)]
+        legacy.send({'type': 'start', 'id': 'q', 'payload': {'query': '{hello}'}})
+        results['query'] = [await legacy.receive() for index in range(2)]
+        legacy.send({'type': 'start', 'id': 'e', 'payload': {'query': 'subscription {unknown}'}})
+        results['error'] = await legacy.receive()
+
+        # Ping, then protocol errors close connection.
+        clients[0].send(b'ping', opcode=9)
+        results['pong'] = await clients[0].receive_frame()
+        clients[0].send({'type': 'connection_init'})
+        results['close'] = await clients[0].receive_frame()
+
+        unauthorized = await Client().connect(unix_endpoint)
+        unauthorized.send({'type': 'subscribe', 'id': '1', 'payload': {'query': PRICE}})
+        results['unauthorized'] = await unauthorized.receive_frame()
+
+        for client in clients + [legacy, unauthorized]:
+            client.writer.close()
+        await servers.close()
+        return results
+
+    del executions[:]
+    results = loop.run_until_complete(client())
+
+    assert b'HTTP/1.1 101 Switching Protocols\r\n' in results['headers']
+    assert b'\r\nSec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n' in results['headers']
+    assert b'\r\nSec-WebSocket-Protocol: graphql-transport-ws\r\n' in results['headers']
+
+    assert results['groups'] == 1
+    assert results['events'] == [
+        {'type': 'next', 'id': '1', 'payload': {'data': {'price': {'symbol': 'AAPL', 'value': 1.5, 'executions': 1}}}},
+    ] * 3
+    assert results['after_unsubscribe']['payload']['data']['price'] == {'symbol': 'AAPL', 'value': 1.6, 'executions': 2}
+    assert executions == [1.5, 1.6]  # once per event, not once per subscriber
+    assert results['groups_left'] == {}
+
+    assert b'\r\nSec-WebSocket-Protocol: graphql-ws\r\n' in results['legacy_headers']
+    assert results['counter'] == [
+        {'type': 'data', 'id': 'c', 'payload': {'data': {'counter': 0}}},
+        {'type': 'data', 'id': 'c', 'payload': {'data': {'counter': 1}}},
+        {'type': 'data', 'id': 'c', 'payload': {'data': {'counter': 2}}},
+        {'type': 'complete', 'id': 'c'},
+    ]
+    assert results['query'] == [
+        {'type': 'data', 'id': 'q', 'payload': {'data': {'hello': 'Hello'}}},
+        {'type': 'complete', 'id': 'q'},
+    ]
+    assert results['error']['type'] == 'error'
+    assert results['error']['payload'][0]['message'] == 'Cannot query field "unknown" on type "Subscription".'
+
+    assert results['pong'] == (10, b'ping')
+    assert results['close'] == (8, (4429).to_bytes(2, 'big') + b'Too many initialisation requests')
+    assert results['unauthorized'] == (8, (4401).to_bytes(2, 'big') + b'Unauthorized')
+
+def test_slow_subscriber(unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, subscription_queue_size=2)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        for overflow in ['coalesce', 'drop']:
+            servers.subscription_overflow = overflow
+            client = await Client().connect(unix_endpoint)
+            client.send({'type': 'connection_init'})
+            await client.receive()
+            for symbol in ['AAPL', 'MSFT', 'GOOG']:
+                client.send({'type': 'subscribe', 'id': symbol, 'payload': {'query': PRICE, 'variables': {'symbol': symbol}}})
+            await asyncio.sleep(0.05)
+
+            # Simulate full write buffer of slow client.
+            connection = next(iter(servers.pubsub.groups['price:AAPL'].values())).subscribers
+            connection = next(iter(connection))[0]
+            connection.pause_writing()
+            for value in range(3):
+                for symbol in ['AAPL', 'MSFT', 'GOOG']:
+                    servers.pubsub.publish('price:' + symbol, {'symbol': symbol, 'value': value})
+                await asyncio.sleep(0.02)
+            connection.resume_writing()
+
+            events = []
+            while True:
+                try:
+                    event = await asyncio.wait_for(client.receive(), 0.1)
+                except asyncio.TimeoutError:
+                    break
+                events.append((event['id'], event['payload']['data']['price']['value']))
+            results[overflow] = events
+            client.writer.close()
+            await asyncio.sleep(0.05)
+
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    # The latest event of each subscription replaces the waiting one, up to queue size subscriptions.
+    assert results['coalesce'] == [('AAPL', 2.0), ('MSFT', 2.0)]
+    # New events are dropped once the queue is full.
+    assert results['drop'] == [('AAPL', 0.0), ('MSFT', 0.0)]
+
+def test_subscription_context(unix_endpoint):
+
+    def get_context(loop, context):
+        return dict(user=context['connection_params']['user'])
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, get_context=get_context)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        clients = {}
+        for user in ['alice', 'bob']:
+            client = clients[user] = await Client().connect(unix_endpoint)
+            client.send({'type': 'connection_init', 'payload': {'user': user}})
+            await client.receive()
+            client.send({'type': 'subscribe', 'id': '1', 'payload': {'query': 'subscription {secret {text}}'}})
+
+        await asyncio.sleep(0.05)
+        servers.pubsub.publish('secret', {})
+        results = {user: await client.receive() for user, client in clients.items()}
+        results['groups'] = len(servers.pubsub.groups['secret'])
+
+        for client in clients.values():
+            client.writer.close()
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    # Without get_cache_scope subscribers with context are not grouped, so each one gets event executed with own context.
+    assert results['groups'] == 2
+    assert results['alice']['payload'] == {'data': {'secret': {'text': 'secret of alice'}}}
+    assert results['bob']['payload'] == {'data': {'secret': {'text': 'secret of bob'}}}
+
+def test_persisted_queries_only(unix_endpoint):
+
+    persisted_queries = aiographql.PersistedQueries()
+    sha256_hash = hashlib.sha256(PRICE.encode()).hexdigest()
+    persisted_queries.set(sha256_hash, PRICE)
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False,
+        persisted_queries=persisted_queries, persisted_queries_only=True)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        client = await Client().connect(unix_endpoint)
+        client.send({'type': 'connection_init'})
+        await client.receive()
+
+        for id, payload in [
+            ('query', {'query': '{hello}'}),
+            ('subscription', {'query': 'subscription {counter(limit: 1)}'}),
+            ('unknown', {'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': '0' * 64}}}),
+        ]:
+            client.send({'type': 'subscribe', 'id': id, 'payload': payload})
+            results[id] = await client.receive()
+
+        client.send({'type': 'subscribe', 'id': 'persisted', 'payload': {'variables': {'symbol': 'AAPL'},
+            'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}}}})
+        await asyncio.sleep(0.05)
+        servers.pubsub.publish('price:AAPL', {'symbol': 'AAPL', 'value': 1.5})
+        results['persisted'] = await client.receive()
+
+        client.writer.close()
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    for id in ['query', 'subscription']:
+        assert results[id] == {'type': 'error', 'id': id, 'payload': [
+            {'message': 'PersistedQueryNotSupported', 'extensions': {'code': 'PERSISTED_QUERY_NOT_SUPPORTED'}}]}
+    assert results['unknown']['payload'][0]['message'] == 'PersistedQueryNotFound'
+    assert results['persisted']['payload']['data']['price']['value'] == 1.5
+
+def test_complexity(unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, max_depth=1)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        client = await Client().connect(unix_endpoint)
+        client.send({'type': 'connection_init'})
+        await client.receive()
+
+        client.send({'type': 'subscribe', 'id': 'deep', 'payload': {'query': PRICE, 'variables': {'symbol': 'AAPL'}}})
+        results['deep'] = await client.receive()
+        client.send({'type': 'subscribe', 'id': 'query', 'payload': {'query': '{hello}'}})
+        results['query'] = await client.receive()
+
+        client.writer.close()
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    error, = results['deep']['payload']
+    assert results['deep']['type'] == 'error'
+    assert error['message'] == 'Query depth 2 exceeds max_depth 1'
+    assert error['extensions']['code'] == 'QUERY_TOO_COMPLEX'
+    assert results['query']['payload'] == {'data': {'hello': 'Hello'}}  # within limits
+
+def test_timeouts(unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, header_timeout=0.1, body_timeout=0.3)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        uninitialized = await Client().connect(unix_endpoint)
+        results['init'] = await asyncio.wait_for(uninitialized.receive_frame(), 1)
+
+        client = await Client().connect(unix_endpoint)
+        client.send({'type': 'connection_init'})
+        await client.receive()
+        await asyncio.sleep(0.15)  # longer than header_timeout
+        results['timers'] = [connection.timer for connection in servers.connections]
+
+        # Frame sent in small chunks is buffered until it is complete, within body_timeout.
+        frame = client.get_frame({'type': 'subscribe', 'id': '1', 'payload': {'query': '{hello}', 'variables': {'x': 'x' * 1000}}})
+        for start in range(0, len(frame), 100):
+            client.writer.write(frame[start:start + 100])
+            await asyncio.sleep(0.01)
+        results['chunked'] = [await client.receive() for index in range(2)]
+
+        client.writer.write(frame[:100])  # and never the rest
+        results['frame'] = await asyncio.wait_for(client.receive_frame(), 1)
+
+        for client in uninitialized, client:
+            client.writer.close()
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert results['init'] == (8, (4408).to_bytes(2, 'big') + b'Connection initialisation timeout')
+    assert results['timers'] == [None]  # idle subscriber has no timer
+    assert results['chunked'] == [
+        {'type': 'next', 'id': '1', 'payload': {'data': {'hello': 'Hello'}}},
+        {'type': 'complete', 'id': '1'},
+    ]
+    assert results['frame'] == (8, (1008).to_bytes(2, 'big') + b'Timeout of frame')
@@ -0,0 +1,144 @@
+
+### import
+
+import asyncio
+
+import aiographql
+import pytest
+import ujson as json
+
+### helpers
+
+PARSERS = [aiographql.HttpParser] + ([aiographql.HttptoolsParser] if aiographql.httptools else [])
+
+async def exchange(endpoint, parts, delay=0.05):
+    """
+    Send parts of raw HTTP data with delay between them, and read until connection is closed by server or timeout.
+
+    @return data: bytes
+    """
+    reader, writer = await asyncio.open_unix_connection(endpoint['path'])
+    data = b''
+    try:
+        for part in parts:
+            writer.write(part)
+            await asyncio.sleep(delay)
+
+        while True:
+            chunk = await asyncio.wait_for(reader.read(65536), 0.3)
+            if not chunk:
+                break
+            data += chunk
+    except asyncio.TimeoutError:
+        pass  # connection is kept alive
+    finally:
+        writer.close()
+    return data
+
+def get_responses(data):
+    """
+    @param data: bytes - pipelined responses with "Content-Length"
+    @return responses: list of (headers: bytes, content: dict or None)
+    """
+    responses = []
+    while data:
+        headers, data = data.split(b'\r\n\r\n', 1)
+        if headers.startswith(b'HTTP/1.1 100 '):
+            responses.append((headers, None))
+            continue
+        content_length = int(aiographql.CONTENT_LENGTH_RE.search(headers).group(1))
+        responses.append((headers, json.loads(data[:content_length])))
+        data = data[content_length:]
+    return responses
+
+def chunked(content, size=7):
+    return b''.join(b'%x;ext=1\r\n%b\r\n' % (len(content[index:index + size]), content[index:index + size])
+        for index in range(0, len(content), size)) + b'0\r\nX-Trailer: 1\r\n\r\n'
+
+### test
+
+def test_parse_request_head():
+    method, path, headers = aiographql.parse_request_head(
+        b'POST /graphql?x=1 HTTP/1.1\r\nHost: localhost\r\nX-Forwarded-For: a\r\nx-forwarded-for: b')
+    assert method == 'POST'
+    assert path == '/graphql'
+    assert headers == {'host': 'localhost', 'x-forwarded-for': 'a, b'}
+
+@pytest.mark.parametrize('http_parser_factory', PARSERS)
+def test_http_parser(schema, unix_endpoint, http_parser_factory):
+
+    contexts = []
+
+    def get_context(loop, context):
+        contexts.append({key: context[key] for key in ['method', 'path', 'http_headers', 'keep_alive']})
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, get_context=get_context,
+        http_parser_factory=http_parser_factory, exception_handler=lambda loop, context: None)
+    loop = asyncio.get_event_loop()
+    content = json.dumps({'query': '{me {id name}}'}).encode()
+    expected = {'data': {'me': {'id': '42', 'name': 'John'}}}
+
+    async def client():
+        results = {}
+
+        # Chunked content split to many chunks, pipelined with usual request.
+        request = b''.join([
+            b'POST /graphql HTTP/1.1\r\nTransfer-Encoding: chunked\r\nX-Request: 1\r\n\r\n' + chunked(content),
+            b'POST /graphql HTTP/1.1\r\nContent-Length: %d\r\n\r\n%b' % (len(content), content),
+        ])
+        results['chunked'] = get_responses(await exchange(unix_endpoint, [request[index:index + 5] for index in range(0, len(request), 5)], 0))
+
+        results['expect'] = get_responses(await exchange(unix_endpoint, [
+            b'POST / HTTP/1.1\r\nExpect: 100-continue\r\nContent-Length: %d\r\n\r\n' % len(content),
+            content,
+        ]))
+
+        results['close'] = get_responses(await exchange(unix_endpoint, [
+            b''.join([
+                b'POST / HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%b' % (len(content), content),
+                b'POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%b' % (len(content), content),  # ignored
+            ]),
+        ]))
+
+        results['http10'] = get_responses(await exchange(unix_endpoint, [
+            b'POST / HTTP/1.0\r\nContent-Length: %d\r\n\r\n%b' % (len(content), content),
+        ]))
+
+        results['http10_keep_alive'] = get_responses(await exchange(unix_endpoint, [
+            b'POST / HTTP/1.0\r\nConnection: keep-alive\r\nContent-Length: %d\r\n\r\n%b' % (len(content), content),
+        ]))
+
+        results['bad_chunk'] = get_responses(await exchange(unix_endpoint, [
+            b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nxyz\r\n',
+        ]))
+
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert [content for headers, content in results['chunked']] == [expected, expected]
+    assert contexts[0] == {'method': 'POST', 'path': '/graphql', 'keep_alive': True,
+        'http_headers': {'transfer-encoding': 'chunked', 'x-request': '1'}}
+
+    (continue_headers, _), (headers, response) = results['expect']
+    assert continue_headers == b'HTTP/1.1 100 Continue'
+    assert response == expected
+
+    ((headers, response),) = results['close']  # the second request is ignored
+    assert response == expected
+    assert b'\r\nConnection: close\r\n' in headers
+    assert contexts[3]['keep_alive'] is False
+
+    ((headers, response),) = results['http10']
+    assert response == expected
+    assert b'\r\nConnection: close\r\n' in headers
+
+    ((headers, response),) = results['http10_keep_alive']
+    assert response == expected
+    assert b'Connection: close' not in headers
+
+    ((headers, response),) = results['bad_chunk']
+    if http_parser_factory is aiographql.HttpParser:
+        assert response == {'errors': [{'message': 'Chunk size is not valid'}]}
+    assert b'\r\nConnection: close\r\n' in headers
@@ -0,0 +1,33 @@
+
+### import
+
+from benchmarks import bench
+
+### test
+
+def test_benchmark(unix_endpoint):
+    result = bench.run_scenario('trivial', unix_endpoint, connections=4, pipeline=2, duration=0.3, warmup=0.1)
+
+    assert result['requests'] > 0
+    assert result['rps'] > 0
+    assert result['error_rate'] == 0
+    assert 0 < result['p50_ms'] <= result['p99_ms'] <= result['p999_ms']
+    assert result['max_rss_mb'] > 0
+    assert {'gc_collections_per_1k_requests', 'allocated_blocks_delta', 'traced_peak_mb'} <= set(result)
+
+def test_compare():
+    baseline = {'scenarios': {
+        'trivial': {'rps': 1000, 'p99_ms': 2.0, 'error_rate': 0.0},
+        'errors': {'rps': 100, 'p99_ms': 20.0, 'error_rate': 1.0},
+    }}
+    results = {'scenarios': {
+        'trivial': {'rps': 700, 'p99_ms': 2.1, 'error_rate': 0.0},
+        'errors': {'rps': 110, 'p99_ms': 30.0, 'error_rate': 0.5},
+        'new': {'rps': 1, 'p99_ms': 1.0, 'error_rate': 0.0},
+    }}
+    assert bench.compare(results, baseline) == [
+        'errors: p99_ms 30.0 > baseline 20.0',
+        'errors: error_rate 0.5 != baseline 1.0',
+        'trivial: rps 700 < baseline 1000',
+    ]
+    assert bench.compare(baseline, baseline) == []
@@ -0,0 +1,114 @@
+
+### import
+
+import asyncio
+import os
+import threading
+import time
+
+import aiographql
+import graphene
+import ujson as json
+
+### schema
+
+@aiographql.offload()
+class Report(graphene.ObjectType):
+    id = graphene.ID()
+    thread = graphene.String()
+
+    def resolve_thread(self, info):
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+class Query(graphene.ObjectType):
+    fast = graphene.String()
+    heavy = graphene.String(seconds=graphene.Float())
+    pid = graphene.Int()
+    report = graphene.Field(Report)
+    blocking = graphene.String()
+
+    def resolve_fast(self, info):
+        return 'fast'
+
+    @aiographql.cache_control(max_age=60)
+    @aiographql.offload()
+    def resolve_heavy(self, info, seconds):
+        time.sleep(seconds)
+        return info.field_name
+
+    @aiographql.offload(pool='process')
+    def resolve_pid(self, info):
+        assert info is None
+        return os.getpid()
+
+    def resolve_report(self, info):
+        return Report(id=1)
+
+    def resolve_blocking(self, info):
+        time.sleep(0.2)
+        return 'blocking'
+
+
+schema = graphene.Schema(query=Query, mutation=None)
+
+### test
+
+def test_offload(http, http_request, unix_endpoint):
+
+    reports = []
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, offload_threads=2,
+        loop_monitor=aiographql.LoopMonitor(interval=0.01, lag_seconds=0.1, resolver_seconds=0.1, sample_rate=1),
+        exception_handler=lambda loop, context: reports.append(context))
+    loop = asyncio.get_event_loop()
+
+    async def request(query):
+        started_at = time.monotonic()
+        (headers, content), = await http(unix_endpoint, http_request(query))
+        return time.monotonic() - started_at, json.loads(content)
+
+    async def client():
+        results = {}
+        heavy = asyncio.ensure_future(request('{heavy(seconds: 0.3) report {id thread}}'))
+        await asyncio.sleep(0.05)
+        results['fast'] = await request('{fast}')
+        results['heavy'] = await heavy
+        results['pid'] = await request('{pid}')
+        results['lag_reports'] = len(reports)
+
+        results['blocking'] = await request('{blocking}')
+        await asyncio.sleep(0.05)
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    seconds, response = results['fast']
+    assert seconds < 0.1  # not blocked by heavy fields
+    assert response == {'data': {'fast': 'fast'}}
+
+    seconds, response = results['heavy']
+    assert seconds < 0.45  # fields of different types are executed concurrently
+    assert response['data']['heavy'] == 'heavy'
+    assert response['data']['report']['id'] == '1'
+    assert response['data']['report']['thread'] != threading.current_thread().name
+
+    seconds, response = results['pid']
+    assert response['data']['pid'] != os.getpid()
+
+    assert results['lag_reports'] == 0
+    assert results['blocking'][1] == {'data': {'blocking': 'blocking'}}
+    (blocking_resolver,) = [context for context in reports if 'blocking_resolver' in context]
+    assert blocking_resolver['blocking_resolver']['field'] == 'Query.blocking'
+    assert blocking_resolver['blocking_resolver']['seconds'] >= 0.2
+    assert 'consider @aiographql.offload()' in blocking_resolver['message']
+    (loop_lag,) = [context for context in reports if 'loop_lag' in context]
+    assert loop_lag['loop_lag'] >= 0.1
+
+    # Attributes of resolver are kept for static analysis, serving the schema again does not wrap resolvers twice.
+    assert schema.get_query_type().fields['heavy'].resolver.cache_control == (60, 'PUBLIC')
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    resolver = schema.get_query_type().fields['heavy'].resolver
+    assert resolver.offloaded_resolver is Query.resolve_heavy
+    assert schema.get_query_type().fields['fast'].resolver is Query.resolve_fast
+    loop.run_until_complete(servers.close())
@@ -0,0 +1,225 @@
+
+### import
+
+import asyncio
+import os
+import signal
+import sys
+import time
+
+import aiographql
+import graphene
+import pytest
+import ujson as json
+
+### const
+
+SCRIPT = '''
+import os, sys
+import aiographql, graphene
+
+class Query(graphene.ObjectType):
+    pid = graphene.Int()
+    ppid = graphene.Int()
+
+    def resolve_pid(self, info):
+        return os.getpid()
+
+    def resolve_ppid(self, info):
+        return os.getppid()
+
+workers = int(sys.argv[2]) or None
+path = sys.argv[1] + ('{worker}' if workers else '')
+aiographql.serve(graphene.Schema(query=Query), listen=[dict(protocol='unix', path=path)], workers=workers, drain_timeout=5)
+'''
+
+### helpers
+
+async def read_response(reader):
+    """
+    @return headers, content: bytes, dict
+    """
+    headers = await reader.readuntil(b'\r\n\r\n')
+    content_length = int(aiographql.CONTENT_LENGTH_RE.search(headers).group(1))
+    return headers, json.loads(await reader.readexactly(content_length))
+
+async def read_until_closed(reader):
+    try:
+        return await reader.read()
+    except ConnectionResetError:
+        return b''
+
+### test
+
+def test_drain(http_request, schema, unix_endpoint):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        connections = {}
+        for name in ['idle', 'busy', 'stuck']:
+            connections[name] = await asyncio.open_unix_connection(unix_endpoint['path'])
+
+        idle_reader, idle_writer = connections['idle']
+        idle_writer.write(http_request('{me {id}}'))
+        await read_response(idle_reader)
+
+        connections['busy'][1].write(http_request('query Sloth($seconds: Float) {slowDb(seconds: $seconds)}', {'seconds': 0.3}))
+        connections['stuck'][1].write(http_request('query Sloth($seconds: Float) {slowDb(seconds: $seconds)}', {'seconds': 5}))
+        await asyncio.sleep(0.05)
+
+        started_at = time.monotonic()
+        drain = loop.create_task(servers.drain(timeout=1))
+        await asyncio.sleep(0.05)
+
+        results['idle'] = await read_until_closed(idle_reader)
+        results['idle_seconds'] = time.monotonic() - started_at
+        try:
+            await asyncio.open_unix_connection(unix_endpoint['path'])
+            results['refused'] = False
+        except ConnectionRefusedError:
+            results['refused'] = True
+
+        busy_reader = connections['busy'][0]
+        results['busy'] = await read_response(busy_reader)
+        results['busy_closed'] = await read_until_closed(busy_reader)
+        results['stuck'] = await read_until_closed(connections['stuck'][0])
+
+        await drain
+        results['seconds'] = time.monotonic() - started_at
+        await asyncio.sleep(0)
+        results['serving_done'] = servers.serving.done()
+        for reader, writer in connections.values():
+            writer.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert results['idle'] == b''
+    assert results['idle_seconds'] < 0.2
+    assert results['refused']
+
+    headers, response = results['busy']
+    assert response == {'data': {'slowDb': True}}  # finished
+    assert b'\r\nConnection: close\r\n' in headers
+    assert results['busy_closed'] == b''
+
+    assert results['stuck'] == b''  # aborted after timeout
+    assert 1 <= results['seconds'] < 1.5
+    assert results['serving_done']
+    assert not servers.connections
+
+def test_swap_schema(http_request, schema, unix_endpoint):
+
+    class NewQuery(graphene.ObjectType):
+        version = graphene.Int()
+
+        def resolve_version(self, info):
+            return 2
+
+    new_schema = graphene.Schema(query=NewQuery, mutation=None)
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False)
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        results = {}
+        reader, writer = await asyncio.open_unix_connection(unix_endpoint['path'])
+        writer.write(http_request('query Sloth($seconds: Float) {slowDb(seconds: $seconds)}', {'seconds': 0.2}))
+        await asyncio.sleep(0.05)
+
+        old_query_cache = servers.query_cache
+        servers.swap_schema(new_schema)
+        results['in_flight'] = await read_response(reader)
+
+        writer.write(http_request('{version}') + http_request('{me {id}}'))  # the same connection
+        results['new'] = await read_response(reader)
+        results['old'] = await read_response(reader)
+        results['query_cache'] = old_query_cache, servers.query_cache
+
+        writer.close()
+        await servers.close()
+        return results
+
+    results = loop.run_until_complete(client())
+
+    assert results['in_flight'][1] == {'data': {'slowDb': True}}
+    assert results['new'][1] == {'data': {'version': 2}}
+    assert results['old'][1]['errors'][0]['message'] == 'Cannot query field "me" on type "NewQuery".'
+
+    old_query_cache, query_cache = results['query_cache']
+    assert query_cache is not old_query_cache and query_cache.schema is new_schema
+    assert query_cache.size == old_query_cache.size
+
+def test_inherited_sockets(curl, schema, unix_endpoint):
+
+    if os.path.exists(unix_endpoint['path']):
+        os.remove(unix_endpoint['path'])
+    import socket
+    sock = socket.socket(socket.AF_UNIX)
+    sock.bind(unix_endpoint['path'])
+    sock.listen()
+    loop = asyncio.get_event_loop()
+
+    async def client():
+        previous = await asyncio.create_subprocess_exec('sleep', '10')
+        os.environ[aiographql.LISTEN_FDS_ENV] = str(sock.fileno())
+        os.environ[aiographql.HANDOFF_PID_ENV] = str(previous.pid)
+
+        servers = aiographql.serve(schema, listen=[dict(protocol='unix', path='/tmp/aiographql-not-bound')], run=False)
+        result = await curl(unix_endpoint, '{me {id}}')
+        returncode = await asyncio.wait_for(previous.wait(), 1)
+        await servers.close()
+        return result, returncode
+
+    result, returncode = loop.run_until_complete(client())
+    assert result == {'data': {'me': {'id': '42'}}}
+    assert returncode == -signal.SIGTERM  # previous process is stopped once this one is listening
+    assert not os.path.exists('/tmp/aiographql-not-bound')
+    assert aiographql.LISTEN_FDS_ENV not in os.environ and aiographql.HANDOFF_PID_ENV not in os.environ
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_handoff(curl, unix_endpoint, workers):
+
+    loop = asyncio.get_event_loop()
+    path = unix_endpoint['path'] + ('0' if workers else '')
+    if os.path.exists(path):
+        os.remove(path)
+
+    async def get_pids():
+        for _ in range(100):
+            if os.path.exists(path):
+                result = await curl(dict(protocol='unix', path=path), '{pid ppid}')
+                if result:
+                    return result['data']['pid'], result['data']['ppid']
+            await asyncio.sleep(0.05)
+
+    async def client():
+        process = await asyncio.create_subprocess_exec(sys.executable, '-c', SCRIPT, unix_endpoint['path'], str(workers),
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        old_pid, _ = await get_pids()
+
+        failures = []
+        is_running = [True]
+
+        async def load():
+            while is_running[0]:
+                result = await curl(dict(protocol='unix', path=path), '{pid}')
+                if not result or 'data' not in result:
+                    failures.append(result)
+
+        load_task = loop.create_task(load())
+        process.send_signal(signal.SIGHUP)
+        returncode = await asyncio.wait_for(process.wait(), 10)
+        is_running[0] = False
+        await load_task
+
+        new_pid, new_ppid = await get_pids()
+        os.kill(new_ppid if workers else new_pid, signal.SIGTERM)
+        return old_pid, new_pid, returncode, failures
+
+    old_pid, new_pid, returncode, failures = loop.run_until_complete(client())
+    assert returncode == 0
+    assert new_pid != old_pid
+    assert failures == []  # no connection is refused or dropped
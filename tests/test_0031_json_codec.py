@@ -0,0 +1,107 @@
+
+### import
+
+import asyncio
+import datetime
+from urllib.parse import quote
+
+import aiographql
+import graphene
+import pytest
+import ujson as json
+
+### schema
+
+class Raw(graphene.Scalar):
+    serialize = staticmethod(lambda value: value)
+
+class Query(graphene.ObjectType):
+    created = graphene.Field(Raw)
+    counts = graphene.Field(Raw)
+    echo = graphene.String(text=graphene.String())
+
+    def resolve_created(self, info):
+        return datetime.datetime(2024, 1, 2, 3, 4, 5, 678000)
+
+    def resolve_counts(self, info):
+        return {1: 'one', 2.5: 'two and a half'}
+
+    def resolve_echo(self, info, text):
+        return text
+
+
+schema = graphene.Schema(query=Query, mutation=None)
+
+CODECS = [aiographql.JsonCodec()] + ([aiographql.OrjsonCodec()] if aiographql.orjson else [])
+
+### test
+
+@pytest.mark.parametrize('json_codec', CODECS + [aiographql.UjsonCodec()])
+def test_codec(json_codec):
+    data = json_codec.dumps({'text': 'Zoë / ok', 'list': [1, 1.5, None, True], 'id': 2 ** 40})
+    assert isinstance(data, bytes)
+    assert json_codec.loads(data) == {'text': 'Zoë / ok', 'list': [1, 1.5, None, True], 'id': 2 ** 40}
+    assert json_codec.loads(data.decode()) == json_codec.loads(data)
+
+@pytest.mark.parametrize('json_codec', CODECS)
+def test_native_types(json_codec):
+    assert json_codec.loads(json_codec.dumps({
+        'datetime': datetime.datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=datetime.timezone.utc),
+        'date': datetime.date(2024, 1, 2),
+        'time': datetime.time(3, 4),
+        'keys': {1: 'a', 1.5: 'b', False: 'c', None: 'd'},
+    })) == {
+        'datetime': '2024-01-02T03:04:05.678000+00:00',
+        'date': '2024-01-02',
+        'time': '03:04:00',
+        'keys': {'1': 'a', '1.5': 'b', 'false': 'c', 'null': 'd'},
+    }
+
+@pytest.mark.skipif(not aiographql.orjson, reason='orjson is not installed')
+def test_same_output():
+    value = {'data': {
+        'datetime': datetime.datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=datetime.timezone.utc),
+        'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+        'date': datetime.date(2024, 1, 2),
+        'time': datetime.time(3, 4, 5, 6),
+        'keys': {1: 'a', 1.5: 'b', False: 'c', None: 'd'},
+        'text': 'Zoë / "quoted" \n',
+        'list': [1, -2.25, None, True, {}, []],
+    }}
+    assert aiographql.JsonCodec().dumps(value) == aiographql.OrjsonCodec().dumps(value)
+
+    nested = {None: {'a': [1]}, False: [{'b': 2}], 1.5: {}}
+    for json_codec in CODECS:
+        assert b''.join(aiographql.iter_json(nested, 64, json_codec)) == json_codec.dumps(nested)
+
+def test_default_codec(monkeypatch):
+    assert isinstance(aiographql.get_json_codec(), aiographql.OrjsonCodec if aiographql.orjson else aiographql.JsonCodec)
+    monkeypatch.setattr(aiographql, 'orjson', None)
+    assert isinstance(aiographql.get_json_codec(), aiographql.JsonCodec)  # not UjsonCodec, as its output differs
+
+@pytest.mark.parametrize('json_codec', CODECS)
+def test_serve_json_codec(http, http_request, unix_endpoint, json_codec):
+
+    servers = aiographql.serve(schema, listen=[unix_endpoint], run=False, json_codec=json_codec)
+    loop = asyncio.get_event_loop()
+    assert servers.json_codec is json_codec
+
+    async def client():
+        results = await http(unix_endpoint, b''.join([
+            http_request('{created counts}'),
+            http_request('query Echo($text: String) {echo(text: $text)}', {'text': 'Zoë'}),
+            'GET /?query={}&variables={} HTTP/1.1\r\n\r\n'.format(
+                quote('query Echo($text: String) {echo(text: $text)}'), quote(json.dumps({'text': 'GET'}))).encode(),
+            b'POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\n{"x":',
+        ]), responses=4)
+        await servers.close()
+        return [content for headers, content in results]
+
+    datetime_content, echo_content, get_content, error_content = loop.run_until_complete(client())
+    assert datetime_content == json_codec.dumps({'data': {
+        'created': '2024-01-02T03:04:05.678000',
+        'counts': {'1': 'one', '2.5': 'two and a half'},
+    }})
+    assert json_codec.loads(echo_content) == {'data': {'echo': 'Zoë'}}
+    assert json_codec.loads(get_content) == {'data': {'echo': 'GET'}}
+    assert json_codec.loads(error_content)['errors'][0]['message'].startswith('JSON: ')